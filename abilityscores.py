@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# Bulk ability score generation. Rolls or assigns the six raw ability scores of any number of characters at once by each of the usual methods: rolling 4d6 and dropping the lowest die, point buy, or the standard array.
+# Scores come back as one row per character, in the order of Character.abilities. With NumPy installed every method is sampled as arrays, a chunk of rows at a time, so millions of score arrays take about a second; without it the same rows are made with plain lists.
+# The exact distribution of a score and of a row's total is also available for each method, for comparing rolled scores against what the method should give.
+
+import argparse
+import itertools
+from functools import lru_cache
+
+import dice
+import notation
+from probability import Distribution
+from theprogram import RACEBUFFS, RACEINDEX, Character
+
+numpy = dice.numpy
+
+
+# Ways of generating scores, with the names shown in menus
+METHODS = {"roll": "Roll 4d6, dropping the lowest die", "pointbuy": "Point buy", "standard": "Standard array"}
+
+STANDARDARRAY = (15, 14, 13, 12, 10, 8)
+
+# Cost in points of each score that point buy allows, and the points every character has to spend
+POINTBUYCOSTS = {8: 0, 9: 1, 10: 2, 11: 3, 12: 4, 13: 5, 14: 7, 15: 9}
+POINTBUYBUDGET = 27
+
+# Most rows made in one go, which bounds the memory used by the dice of the roll method
+CHUNKROWS = 1 << 16
+
+
+# Every point buy that spends the whole budget, as rows of six scores. Point buy scores are generated by picking one of these at random, so every complete point buy is equally likely.
+@lru_cache(maxsize=None)
+def pointbuys(budget=POINTBUYBUDGET):
+    return tuple(row for row in itertools.product(POINTBUYCOSTS, repeat=len(Character.abilities)) if sum(POINTBUYCOSTS[score] for score in row) == budget)
+
+
+# Generates count rows of raw ability scores by a method. rng is any generator accepted by dice.rollbatch(), and defaults to the shared one. Returns an int8 NumPy array shaped (count, 6), or a list of lists without NumPy.
+def generate(count, method="roll", rng=None):
+    if method not in METHODS:
+        raise ValueError("method must be one of {}, got {!r}".format(", ".join(METHODS), method))
+    if count < 0:
+        raise ValueError("count must be at least 0, got {}".format(count))
+    if rng is None:
+        rng = dice.generator()
+    width = len(Character.abilities)
+    if numpy is None or not hasattr(rng, "integers"):
+        return [_generaterow(method, rng) for row in range(count)]
+    rows = numpy.empty((count, width), dtype=numpy.int8)
+    for start in range(0, count, CHUNKROWS):
+        stop = min(count, start+CHUNKROWS)
+        size = stop - start
+        if method == "roll":
+            faces = numpy.asarray(rng.integers(1, 7, size=(size, width, 4)))
+            rows[start:stop] = faces.sum(axis=2) - faces.min(axis=2)
+        elif method == "pointbuy":
+            table = _pointbuytable()
+            rows[start:stop] = table[numpy.asarray(rng.integers(0, len(table), size=size))]
+        else:
+            # Shuffles the standard array along each row, swapping each column with a random one at or before it
+            chunk = numpy.tile(numpy.array(STANDARDARRAY, dtype=numpy.int8), (size, 1))
+            index = numpy.arange(size)
+            for column in range(width-1, 0, -1):
+                other = numpy.asarray(rng.integers(0, column+1, size=size))
+                swapped = chunk[index, other]
+                chunk[index, other] = chunk[:, column]
+                chunk[:, column] = swapped
+            rows[start:stop] = chunk
+    return rows
+
+
+@lru_cache(maxsize=None)
+def _pointbuytable():
+    return numpy.array(pointbuys(), dtype=numpy.int8)
+
+
+# Generates a single row of scores with a random module style generator
+def _generaterow(method, rng):
+    if method == "roll":
+        rolled = []
+        for score in Character.abilities:
+            faces = sorted(rng.randint(1, 6) for die in range(4))
+            rolled.append(faces[1] + faces[2] + faces[3])
+        return rolled
+    if method == "pointbuy":
+        table = pointbuys()
+        return list(table[rng.randint(0, len(table)-1)])
+    row = list(STANDARDARRAY)
+    for column in range(len(row)-1, 0, -1):
+        other = rng.randint(0, column)
+        row[column], row[other] = row[other], row[column]
+    return row
+
+
+# Adds racial bonuses to rows of raw scores. races is one race for every row, or a sequence of races with one per row. Returns new rows, leaving the raw scores as they were.
+def applybuffs(rows, races):
+    if isinstance(races, str):
+        indexes = [RACEINDEX[races]] * len(rows)
+    else:
+        indexes = [RACEINDEX[race] for race in races]
+        if len(indexes) != len(rows):
+            raise ValueError("got {} races for {} rows of scores".format(len(indexes), len(rows)))
+    if numpy is not None and isinstance(rows, numpy.ndarray):
+        return rows + numpy.array(RACEBUFFS, dtype=rows.dtype)[numpy.array(indexes, dtype=numpy.intp)]
+    return [[score + buff for score, buff in zip(row, RACEBUFFS[index])] for row, index in zip(rows, indexes)]
+
+
+# Exact distribution of a single raw score generated by a method. Every score of a row has the same distribution.
+@lru_cache(maxsize=None)
+def distribution(method):
+    if method == "roll":
+        return notation.parse("4d6kh3").distribution()
+    if method == "pointbuy":
+        return _counted(row[0] for row in pointbuys())
+    if method == "standard":
+        return _counted(STANDARDARRAY)
+    raise ValueError("method must be one of {}, got {!r}".format(", ".join(METHODS), method))
+
+
+# Exact distribution of the total of a row of six raw scores
+@lru_cache(maxsize=None)
+def totaldistribution(method):
+    if method == "roll":
+        # The six rolls are independent, so their total is the sum of six copies of one roll
+        total = distribution(method)
+        for score in Character.abilities[1:]:
+            total = total + distribution(method)
+        return total
+    if method == "pointbuy":
+        return _counted(sum(row) for row in pointbuys())
+    if method == "standard":
+        return _counted([sum(STANDARDARRAY)])
+    raise ValueError("method must be one of {}, got {!r}".format(", ".join(METHODS), method))
+
+
+# Distribution where each value appears as often as it does in values
+def _counted(values):
+    values = list(values)
+    low = min(values)
+    counts = [0] * (max(values)-low+1)
+    for value in values:
+        counts[value-low] += 1
+    return Distribution(low, counts)
+
+
+# Statistics of rows of scores: the mean and standard deviation of a score and of a row's total, the lowest and highest score, and how often each score came up
+def summarize(rows):
+    if numpy is not None and isinstance(rows, numpy.ndarray):
+        values = rows.astype(numpy.int64)
+        totals = values.sum(axis=1)
+        counts = numpy.bincount(values.ravel() - values.min()) if values.size else numpy.zeros(0, dtype=numpy.int64)
+        return {"rows": len(rows), "mean": float(values.mean()), "deviation": float(values.std()), "totalmean": float(totals.mean()), "totaldeviation": float(totals.std()), "lowest": int(values.min()), "highest": int(values.max()), "frequencies": {int(values.min())+index: int(count) for index, count in enumerate(counts) if count}}
+    values = [score for row in rows for score in row]
+    totals = [sum(row) for row in rows]
+    mean = sum(values) / len(values)
+    totalmean = sum(totals) / len(totals)
+    frequencies = {}
+    for value in values:
+        frequencies[value] = frequencies.get(value, 0) + 1
+    return {"rows": len(rows), "mean": mean, "deviation": (sum((value-mean)**2 for value in values) / len(values)) ** 0.5, "totalmean": totalmean, "totaldeviation": (sum((total-totalmean)**2 for total in totals) / len(totals)) ** 0.5, "lowest": min(values), "highest": max(values), "frequencies": dict(sorted(frequencies.items()))}
+
+
+# Text report comparing generated scores against the exact distribution of their method
+def report(method, rows):
+    summary = summarize(rows)
+    exact = distribution(method)
+    total = totaldistribution(method)
+    scores = summary["rows"] * len(Character.abilities)
+    lines = ["{} ({:,} rows)".format(METHODS[method], summary["rows"]),
+             "{:<16}{:>12}{:>12}".format("", "generated", "exact"),
+             "{:<16}{:>12.4f}{:>12.4f}".format("score mean", summary["mean"], float(exact.mean())),
+             "{:<16}{:>12.4f}{:>12.4f}".format("score std dev", summary["deviation"], float(exact.variance())**0.5),
+             "{:<16}{:>12.4f}{:>12.4f}".format("total mean", summary["totalmean"], float(total.mean())),
+             "{:<16}{:>12.4f}{:>12.4f}".format("total std dev", summary["totaldeviation"], float(total.variance())**0.5),
+             "",
+             "{:<16}{:>12}{:>12}".format("score", "generated", "exact")]
+    for value, chance in exact.items():
+        lines.append("{:<16}{:>12.4%}{:>12.4%}".format(value, summary["frequencies"].get(value, 0) / scores, float(chance)))
+    return "\n".join(lines)
+
+
+# Command line tool for generating scores in bulk and reporting on each method
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Generate ability scores in bulk and compare them with the exact odds of each method.")
+    parser.add_argument("--seed", type=int, help="seed for the dice, to repeat a set of scores")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show = subparsers.add_parser("generate", help="print rows of generated scores")
+    show.add_argument("method", choices=list(METHODS))
+    show.add_argument("--count", type=int, default=10, help="number of rows (default: %(default)s)")
+    show.add_argument("--race", choices=list(RACEINDEX), metavar="RACE", help="add this race's bonuses to the scores")
+    summary = subparsers.add_parser("report", help="generate scores and compare them with the exact distribution")
+    summary.add_argument("method", choices=list(METHODS))
+    summary.add_argument("--count", type=int, default=1000000, help="number of rows (default: %(default)s)")
+    arguments = parser.parse_args(arguments)
+    rng = dice.DiceStream(arguments.seed, "scores") if arguments.seed is not None else None
+    rows = generate(arguments.count, arguments.method, rng)
+    if arguments.command == "report":
+        print(report(arguments.method, rows))
+        return
+    if arguments.race:
+        rows = applybuffs(rows, arguments.race)
+    print("".join("{:>14}".format(ability) for ability in Character.abilities))
+    for row in rows:
+        print("".join("{:>14}".format(int(score)) for score in row))
+
+
+if __name__ == "__main__":
+    main()
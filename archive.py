@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+# Fixed-width character archive for campaigns with millions of characters. Every character takes one record of RECORDSIZE bytes in a single file, so record N is always at the same place and can be read or rewritten on its own without touching the rest of the file.
+# The file starts like a trajectory table: a magic number, the length of a JSON header, the header (the race, class and background names that the record codes stand for, and the ability and stat names in the order they are stored), then the records from an 8 byte boundary. Opening an archive only maps the file into memory, so nothing is read until a record is asked for.
+# Each record holds the proficiency and expertise bitmasks, the level, the race, class and background codes, the six ability scores and the stats as signed bytes, and the name and path name as UTF-8. With NumPy installed the records can also be viewed as arrays sharing memory with the mapped file, so a whole column can be summed or filtered without copying anything.
+#
+#     python archive.py import [directory]        add every character sheet in a directory to the archive
+#     python archive.py show 1234                 print record 1234
+#     python archive.py summary Perception        statistics of one column across the whole archive
+
+import argparse
+import json
+import mmap
+import os
+import struct
+
+from theprogram import Character, loadsheets
+
+
+DEFAULTPATH = "characters.archive"
+
+MAGIC = b"DNDARCH1"
+
+# Longest name and path name that fit in a record, in bytes of UTF-8
+NAMESIZE = 43
+
+# Layout of one record: the proficiency and expertise bitmasks, the level, the race, class and background codes, the packed scores and stats, then the name and path name padded with zero bytes
+RECORD = struct.Struct("<IIBBBB{}s{}s{}s".format(len(Character.abilities)+len(Character.statnames), NAMESIZE, NAMESIZE))
+RECORDSIZE = RECORD.size
+
+# Code stored for a race, class or background that hasn't been chosen yet
+UNSET = 0xFF
+
+# Records written to the file in one go when appending
+CHUNKRECORDS = 4096
+
+# Names of the fixed fields, in record order, as used by column()
+FIELDS = ("proficient", "doubled", "level", "race", "setclass", "background", "values", "name", "pathname")
+
+
+# Header describing what the codes and values in the records stand for
+def header():
+    return {"races": list(Character.racebuffs), "classes": list(Character.classbuffs), "backgrounds": list(Character.backgroundbuffs), "abilities": Character.abilities, "stats": Character.statnames, "recordsize": RECORDSIZE}
+
+
+# Whether a character's name and path name fit in a record
+def fits(character):
+    return len(character.name.encode("utf-8")) <= NAMESIZE and len(character.pathname.encode("utf-8")) <= NAMESIZE
+
+
+# Writes a new archive holding characters, replacing any file already at path. The whole archive is written to a temporary file and renamed into place, as sheets are, so if any character can't be stored the file at path is left as it was.
+def create(path=DEFAULTPATH, characters=()):
+    encoded = json.dumps(header()).encode("utf-8")
+    start = len(MAGIC) + 4 + len(encoded)
+    padding = -start % 8
+    temporary = path + ".tmp"
+    try:
+        with open(temporary, "wb") as file:
+            file.write(MAGIC)
+            file.write(struct.pack("<I", len(encoded) + padding))
+            file.write(encoded + b" "*padding)
+        if characters:
+            with Archive(temporary, writable=True) as archive:
+                archive.extend(characters)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return path
+
+
+# An archive file, mapped into memory. Opened with writable=True, records can be replaced in place and new ones appended.
+# NumPy views from asarray(), column(), scores() and stats() share memory with the mapped file, so they have to be dropped before the archive is closed or appended to.
+class Archive:
+    def __init__(self, path=DEFAULTPATH, writable=False):
+        self.path = path
+        self.writable = writable
+        self.file = open(path, "r+b" if writable else "rb")
+        self.map = None
+        self._remap()
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("{} is not a character archive".format(path))
+        length = struct.unpack_from("<I", self.map, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(self.map[start:start+length]))
+        if self.header["recordsize"] != RECORDSIZE or self.header["abilities"] != Character.abilities or self.header["stats"] != Character.statnames:
+            self.close()
+            raise ValueError("{} was written with a different record layout".format(path))
+        self.start = start + length
+        self.races = self.header["races"]
+        self.classes = self.header["classes"]
+        self.backgrounds = self.header["backgrounds"]
+        self.racecodes = {name: index for index, name in enumerate(self.races)}
+        self.classcodes = {name: index for index, name in enumerate(self.classes)}
+        self.backgroundcodes = {name: index for index, name in enumerate(self.backgrounds)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return (len(self.map) - self.start) // RECORDSIZE
+
+    # The character stored in record index. Negative indexes count back from the end, as with a list.
+    def __getitem__(self, index):
+        return Character.unpacked(*self.record(index))
+
+    # Replaces record index with a character, leaving every other record untouched
+    def __setitem__(self, index, character):
+        if not self.writable:
+            raise ValueError("{} was opened read only".format(self.path))
+        self.pack(character, self.map, self._offset(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    # Writes any records changed in place out to the file
+    def flush(self):
+        self.map.flush()
+
+    # Maps the whole file, as it is now, into memory
+    def _remap(self):
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ)
+
+    def _offset(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("record {} is outside an archive of {} records".format(index, count))
+        return self.start + index*RECORDSIZE
+
+    # Record index in the form Character.packed() returns, without making a Character from it
+    def record(self, index):
+        proficient, doubled, level, race, setclass, background, values, name, pathname = RECORD.unpack_from(self.map, self._offset(index))
+        return (name.rstrip(b"\0").decode("utf-8"), pathname.rstrip(b"\0").decode("utf-8"), level, self.classes[setclass] if setclass != UNSET else "", self.races[race] if race != UNSET else "", self.backgrounds[background] if background != UNSET else "", values, proficient, doubled)
+
+    # Packs a character into buffer at offset, using this archive's codes
+    def pack(self, character, buffer, offset):
+        character.recalculate()
+        if not fits(character):
+            raise ValueError("the name {!r} is longer than the {} bytes an archive record holds".format(character.name, NAMESIZE))
+        RECORD.pack_into(buffer, offset, character._proficient, character._doubled, character.level, self._code(self.racecodes, character.race), self._code(self.classcodes, character.setclass), self._code(self.backgroundcodes, character.background), character._values.tobytes(), character.name.encode("utf-8"), character.pathname.encode("utf-8"))
+
+    @staticmethod
+    def _code(codes, name):
+        if not name:
+            return UNSET
+        if name not in codes:
+            raise ValueError("{!r} is not one of the names this archive was written with".format(name))
+        return codes[name]
+
+    def append(self, character):
+        self.extend([character])
+
+    # Adds characters to the end of the archive, writing them a chunk at a time. Any iterable of characters can be passed, including a generator. Returns the number of characters added.
+    # Either every character is added or none are: if one can't be stored, such as a name too long for a record, the file is cut back to where it was before raising the error.
+    def extend(self, characters):
+        if not self.writable:
+            raise ValueError("{} was opened read only".format(self.path))
+        added = 0
+        chunk = bytearray(CHUNKRECORDS*RECORDSIZE)
+        filled = 0
+        size = self.file.seek(0, os.SEEK_END)
+        try:
+            for character in characters:
+                self.pack(character, chunk, filled*RECORDSIZE)
+                filled += 1
+                if filled == CHUNKRECORDS:
+                    self.file.write(chunk)
+                    added += filled
+                    filled = 0
+            self.file.write(memoryview(chunk)[:filled*RECORDSIZE])
+            added += filled
+            self.file.flush()
+        except BaseException:
+            self.file.truncate(size)
+            raise
+        finally:
+            self._remap()
+        return added
+
+    # Every record as a NumPy structured array with one field per entry in FIELDS, sharing memory with the mapped file. Needs NumPy. Writing to the array of a writable archive changes the records.
+    def asarray(self):
+        import numpy
+        width = len(Character.abilities) + len(Character.statnames)
+        dtype = numpy.dtype([("proficient", "<u4"), ("doubled", "<u4"), ("level", "u1"), ("race", "u1"), ("setclass", "u1"), ("background", "u1"), ("values", "i1", (width,)), ("name", "S{}".format(NAMESIZE)), ("pathname", "S{}".format(NAMESIZE))])
+        return numpy.frombuffer(self.map, dtype=dtype, count=len(self), offset=self.start)
+
+    # One field of every record, as a NumPy view of the mapped file. Race, class and background are their codes; decode them with the races, classes and backgrounds lists.
+    def column(self, field):
+        if field not in FIELDS:
+            raise ValueError("field must be one of {}, got {!r}".format(", ".join(FIELDS), field))
+        return self.asarray()[field]
+
+    # The raw ability scores of every record, shaped (records, 6) in the order of Character.abilities
+    def scores(self):
+        return self.column("values")[:, :len(Character.abilities)]
+
+    # The calculated stats of every record, shaped (records, stats) in the order of Character.statnames
+    def stats(self):
+        return self.column("values")[:, len(Character.abilities):]
+
+
+# Command line tool for filling an archive from character sheets and reading it back
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Store DnDPy characters in a fixed-width archive file and read them back one record or one column at a time.")
+    parser.add_argument("--archive", default=DEFAULTPATH, help="archive file to use (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("import", help="add the character sheets in a directory to the archive").add_argument("directory", nargs="?", default=".")
+    subparsers.add_parser("show", help="print the character in one record").add_argument("index", type=int)
+    subparsers.add_parser("summary", help="statistics of a stat across the whole archive (needs NumPy)").add_argument("stat", choices=Character.statnames, metavar="stat")
+    arguments = parser.parse_args(arguments)
+    if arguments.command == "import":
+        if not os.path.exists(arguments.archive):
+            create(arguments.archive)
+        characters = []
+        for character in loadsheets(arguments.directory):
+            if fits(character):
+                characters.append(character)
+            else:
+                print("Skipped {}: the name is longer than the {} bytes a record holds.".format(character.name, NAMESIZE))
+        with Archive(arguments.archive, writable=True) as archive:
+            added = archive.extend(characters)
+            print("Added {} characters. The archive now holds {}.".format(added, len(archive)))
+        return
+    with Archive(arguments.archive) as archive:
+        if arguments.command == "show":
+            archive[arguments.index].charactersheet()
+            return
+        if not len(archive):
+            print("The archive is empty.")
+            return
+        column = archive.stats()[:, Character.statindex[arguments.stat]]
+        print("{} across {:,} characters: mean {:+.2f}, lowest {:+d}, highest {:+d}".format(arguments.stat, len(column), float(column.mean()), int(column.min()), int(column.max())))
+        del column
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Import time benchmark. Imports each library module in a fresh interpreter, many times over, and reports how long the import took from a cold start using Python's own -X importtime measurements.
+# Importing a module must stay quick and must not have side effects, since worker processes and short command line tools import the program thousands of times a day. The benchmark fails if a median import is slower than the limit, if an import pulls in NumPy, or if it prints anything or waits for input.
+#
+#     python benchmarks/importtime.py                   measure every module
+#     python benchmarks/importtime.py theprogram -v     measure one module and list the slowest imports it pulls in
+
+import argparse
+import compileall
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that the program, the server and worker processes import as a library, with the slowest median import allowed for each in milliseconds.
+# dice only needs os. theprogram also needs array, collections.abc, contextlib and functools, which load the collections package and take about 5 ms between them, and builder also needs random, which takes about 3 ms more.
+LIMITS = {"theprogram": 10.0, "dice": 1.0, "builder": 12.0}
+MODULES = list(LIMITS)
+
+# Modules an import must not pull in, because they are slow to import and only needed once dice are rolled in bulk
+HEAVY = ["numpy"]
+
+# Limit for modules not listed in LIMITS
+LIMIT = 10.0
+
+
+# Imports a module in a fresh interpreter. Returns the cumulative import time of the module in microseconds, the cumulative times of the modules it imported, the names of any heavy modules that were loaded, and anything the import printed.
+def measure(module):
+    environment = dict(os.environ)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    check = "import sys; import {}; print(','.join(name for name in {!r} if name in sys.modules))".format(module, HEAVY)
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", check], cwd=ROOT, env=environment, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+    if completed.returncode != 0:
+        raise RuntimeError("importing {} failed:\n{}".format(module, completed.stderr))
+    lines = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        lines.append((name[1:].rstrip(), int(cumulative)))
+    # Each module is listed after the modules it imported, which are indented one level further, so the modules imported by this one are the indented lines just before it
+    end = [name for name, cumulative in lines].index(module)
+    start = end
+    while start and lines[start-1][0].startswith(" "):
+        start -= 1
+    imported = {name.strip(): cumulative for name, cumulative in lines[start:end]}
+    output = completed.stdout.splitlines()
+    heavy = [name for name in output[-1].split(",") if name] if output else []
+    return lines[end][1], imported, heavy, output[:-1]
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Measure how long the DnDPy library modules take to import from a cold start.")
+    parser.add_argument("modules", nargs="*", default=MODULES, help="modules to measure (default: all library modules)")
+    parser.add_argument("--runs", type=int, default=20, help="imports per module (default: %(default)s)")
+    parser.add_argument("--limit", type=float, help="slowest median import allowed for every module, in milliseconds (default: the module's limit in LIMITS)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list the slowest imports each module pulls in")
+    arguments = parser.parse_args(arguments)
+
+    # Measures imports from compiled bytecode, as an installed program would run, rather than from source
+    compileall.compile_dir(ROOT, maxlevels=0, quiet=1)
+    failures = 0
+    print("{:<16}{:>12}{:>12}{:>12}  status".format("module", "median ms", "best ms", "worst ms"))
+    for module in arguments.modules:
+        runs = [measure(module) for run in range(arguments.runs)]
+        totals = [total / 1000 for total, imported, heavy, output in runs]
+        problems = []
+        median = statistics.median(totals)
+        limit = arguments.limit if arguments.limit is not None else LIMITS.get(module, LIMIT)
+        if median > limit:
+            problems.append("slower than {:g} ms".format(limit))
+        heavy = sorted({name for total, imported, found, output in runs for name in found})
+        if heavy:
+            problems.append("imports {}".format(", ".join(heavy)))
+        if any(output for total, imported, found, output in runs):
+            problems.append("prints on import")
+        failures += bool(problems)
+        print("{:<16}{:>12.2f}{:>12.2f}{:>12.2f}  {}".format(module, median, min(totals), max(totals), "; ".join(problems) or "ok"))
+        if arguments.verbose:
+            imported = min(runs, key=lambda run: abs(run[0]/1000 - median))[1]
+            for name, cumulative in sorted(imported.items(), key=lambda item: item[1], reverse=True)[:10]:
+                print("    {:<40}{:>8.2f} ms".format(name, cumulative / 1000))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
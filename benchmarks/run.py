@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+
+# Benchmark suite for the character lifecycle and dice hot paths.
+# Each benchmark is run over a sweep of sizes (roster sizes for the character benchmarks, numbers of dice for the dice benchmarks) and reports operations per second and the peak memory allocated by one run.
+# Results can be saved as a baseline and later runs compared against it, flagging anything that has become slower or hungrier than the threshold allows. Baselines are only meaningful on the machine they were recorded on.
+#
+#     python benchmarks/run.py                    run everything and compare against benchmarks/baseline.json
+#     python benchmarks/run.py --quick            smaller sweeps, for a fast check
+#     python benchmarks/run.py -k roll            only benchmarks whose name contains "roll"
+#     python benchmarks/run.py --save-baseline    record this run as the new baseline
+
+import argparse
+import ast
+import contextlib
+import csv
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import abilityscores
+import archive
+import builder
+import dice
+import notation
+import party
+import theprogram
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+ROSTERSIZES = [1, 10, 100, 1000, 10000, 100000]
+DICECOUNTS = [1, 10, 100, 1000, 10000, 100000, 1000000]
+# Sweeps used by --quick
+QUICKROSTERSIZES = [1, 10, 100, 1000]
+QUICKDICECOUNTS = [1, 100, 10000, 1000000]
+
+# Every benchmark, registered by the benchmark decorator as name: (function, sweep)
+BENCHMARKS = {}
+
+
+# Registers a benchmark. The function is called with the size to run at and a scratch directory, and returns the operation to time along with the number of operations one call of it performs.
+def benchmark(name, sweep):
+    def register(function):
+        BENCHMARKS[name] = (function, sweep)
+        return function
+    return register
+
+
+# Characters shared between benchmarks, so that the roster only has to be generated once per size
+_rosters = {}
+
+
+def roster(size):
+    if size not in _rosters:
+        _rosters.clear()
+        _rosters[size] = list(builder.generate(size, seed=size))
+    return _rosters[size]
+
+
+# Stops prompts and printing inside the interactive functions while they are being timed. With printing=False, print() does nothing at all, so the time spent turning results into text isn't counted either.
+@contextlib.contextmanager
+def silenced(printing=True):
+    theprogram.input = lambda *prompt: ""
+    if not printing:
+        theprogram.print = lambda *values, **options: None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        del theprogram.input
+        if not printing:
+            del theprogram.print
+
+
+@benchmark("recalculate-full", "roster")
+def recalculatefull(size, scratch):
+    characters = roster(size)
+
+    def run():
+        for character in characters:
+            character.calculatedmodifier = None
+            character.recalculate()
+    return run, size
+
+
+@benchmark("recalculate-one-score", "roster")
+def recalculateone(size, scratch):
+    characters = roster(size)
+
+    def run():
+        for character in characters:
+            scores = character.scores
+            scores["Strength"] = scores["Strength"] ^ 1
+            character.recalculate()
+    return run, size
+
+
+@benchmark("export", "roster")
+def export(size, scratch):
+    characters = roster(size)
+
+    def run():
+        for character in characters:
+            character.export(scratch)
+    return run, size
+
+
+@benchmark("loadsheet", "roster")
+def loadsheet(size, scratch):
+    for character in roster(size):
+        character.export(scratch)
+    files = [os.path.join(scratch, file) for file in os.listdir(scratch)]
+
+    def run():
+        for file in files:
+            theprogram.loadsheet(file)
+    return run, size
+
+
+# Exports characters as sheets in the format earlier versions wrote, with the scores, stats and proficiencies as Python dictionaries. Returns the paths of the sheets.
+def writelegacy(characters, scratch):
+    files = []
+    for character in characters:
+        character.recalculate()
+        proficiencies = {"proficiencies": list(character.proficiencies["proficiencies"]), "doubled": list(character.proficiencies["doubled"])}
+        row = [character.name, character.pathname, character.level, character.setclass, character.race, character.background, dict(character.scores), dict(character.stats), proficiencies]
+        path = os.path.join(scratch, "charactersheet_{}.csv".format(character.pathname))
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(theprogram.csvkeys)
+            writer.writerow(row)
+        files.append(path)
+    return files
+
+
+# Loads sheets in the earlier format through the legacy parsers, for comparing with loadsheet on the typed format
+@benchmark("loadsheet-legacy", "roster")
+def loadsheetlegacy(size, scratch):
+    files = writelegacy(roster(size), scratch)
+
+    def run():
+        for file in files:
+            theprogram.loadsheet(file)
+    return run, size
+
+
+# Reads the same sheets the way earlier versions did, evaluating each field with ast.literal_eval, as the reference the typed format replaced
+@benchmark("loadsheet-literaleval", "roster")
+def loadsheetliteraleval(size, scratch):
+    files = writelegacy(roster(size), scratch)
+
+    def run():
+        for file in files:
+            with open(file, newline="") as csvfile:
+                for loaded in csv.DictReader(csvfile):
+                    for field in ("Level", "Ability scores", "Stats", "Proficiencies"):
+                        ast.literal_eval(loaded[field])
+    return run, size
+
+
+@benchmark("readsheets-stream", "roster")
+def readsheets(size, scratch):
+    stream = io.StringIO()
+    stream.write(",".join(theprogram.csvkeys) + "\n")
+    for character in roster(size):
+        csv.writer(stream).writerow(character.sheetrow().values())
+
+    def run():
+        stream.seek(0)
+        for character in theprogram.readsheets(stream):
+            pass
+    return run, size
+
+
+@benchmark("startup-index-cold", "roster")
+def indexcold(size, scratch):
+    for character in roster(size):
+        character.export(scratch)
+    indexfile = os.path.join(scratch, theprogram.indexfilename)
+
+    def run():
+        if os.path.exists(indexfile):
+            os.remove(indexfile)
+        index = theprogram.SheetIndex(scratch)
+        index.sheets()
+        index.save()
+    return run, size
+
+
+@benchmark("startup-index-warm", "roster")
+def indexwarm(size, scratch):
+    for character in roster(size):
+        character.export(scratch)
+    index = theprogram.SheetIndex(scratch)
+    index.save()
+
+    def run():
+        theprogram.SheetIndex(scratch).sheets()
+    return run, size
+
+
+@benchmark("party-check", "roster")
+def partycheck(size, scratch):
+    group = party.Party(roster(size))
+    group.table()
+
+    def run():
+        group.check("Perception", 15, "advantage")
+    return run, size
+
+
+@benchmark("party-initiative", "roster")
+def partyinitiative(size, scratch):
+    group = party.Party(roster(size))
+    group.table()
+
+    def run():
+        group.initiative()
+    return run, size
+
+
+@benchmark("archive-read", "roster")
+def archiveread(size, scratch):
+    path = archive.create(os.path.join(scratch, "characters.archive"), roster(size))
+    records = archive.Archive(path)
+    # Reads the records in a scattered order, as random access into a large archive would
+    order = [(index*7919) % size for index in range(size)]
+
+    def run():
+        for index in order:
+            records[index]
+    return run, size
+
+
+@benchmark("archive-column", "roster")
+def archivecolumn(size, scratch):
+    path = archive.create(os.path.join(scratch, "characters.archive"), roster(size))
+    records = archive.Archive(path)
+    perception = len(theprogram.Character.abilities) + theprogram.Character.statindex["Perception"]
+
+    def run():
+        values = records.column("values")
+        (values[:, perception] >= 5).sum()
+    return run, size
+
+
+@benchmark("dice-rollbatch", "dice")
+def rollbatch(size, scratch):
+    def run():
+        dice.rollbatch(size, 20)
+    return run, size
+
+
+@benchmark("dice-rolltotals", "dice")
+def rolltotals(size, scratch):
+    def run():
+        dice.rolltotals(size, 20)
+    return run, size
+
+
+# Times the rolling in roll(), leaving out printing the results, which for a million dice takes far longer than rolling them
+@benchmark("roll", "dice")
+def roll(size, scratch):
+    def run():
+        with silenced(printing=False):
+            theprogram.roll(size, 20, 0)
+    return run, size
+
+
+@benchmark("notation-sample", "dice")
+def notationsample(size, scratch):
+    expression = notation.parse("4d6kh3")
+
+    def run():
+        expression.sample(size)
+    return run, size
+
+
+@benchmark("abilityscores-roll", "dice")
+def abilityscoresroll(size, scratch):
+    def run():
+        abilityscores.generate(size, "roll")
+    return run, size
+
+
+@benchmark("notation-parse", "single")
+def notationparse(size, scratch):
+    def run():
+        notation.parse("2d20kl1+5")
+    return run, 1
+
+
+@benchmark("charactersheet", "single")
+def charactersheet(size, scratch):
+    character = roster(1)[0]
+
+    def run():
+        with silenced():
+            character.charactersheet()
+    return run, 1
+
+
+@benchmark("rendersheets", "roster")
+def rendersheets(size, scratch):
+    characters = roster(size)
+
+    def run():
+        theprogram.rendersheets(characters, io.StringIO())
+    return run, size
+
+
+@benchmark("columns", "single")
+def columns(size, scratch):
+    items = theprogram.numbered(theprogram.Character.statnames)
+
+    def run():
+        theprogram.columns(theprogram.columns(items, False), False)
+    return run, 1
+
+
+@benchmark("bordered", "single")
+def bordered(size, scratch):
+    lines = ["{}: [{}]".format(name, 0).center(110) for name in theprogram.Character.statnames]
+
+    def run():
+        theprogram.bordered(lines)
+    return run, 1
+
+
+# Number of timing rounds per measurement. The fastest round is reported, since anything slower than that was slowed down by something other than the code being measured.
+ROUNDS = 3
+
+
+# Times one benchmark at one size. In each round the operation is repeated until at least a share of mintime has passed, then it is run once more under tracemalloc to find its peak memory.
+def measure(function, size, mintime):
+    scratch = tempfile.mkdtemp(prefix="dndpy-bench-")
+    try:
+        run, operations = function(size, scratch)
+        run()
+        gc.collect()
+        best = 0
+        for round in range(ROUNDS):
+            calls = 0
+            started = time.perf_counter()
+            while True:
+                run()
+                calls += 1
+                elapsed = time.perf_counter() - started
+                if elapsed >= mintime/ROUNDS:
+                    break
+            best = max(best, operations*calls/elapsed)
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {"ops": best, "peak": peak}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+# Compares a result with its baseline, returning a description of every way it has regressed
+def regressions(result, baseline, threshold):
+    found = []
+    if baseline is None:
+        return found
+    if result["ops"] < baseline["ops"] * (1-threshold):
+        found.append("{:.0%} slower".format(1 - result["ops"]/baseline["ops"]))
+    # Tiny allocations vary from run to run, so memory is only compared once it is over a few kilobytes
+    if result["peak"] > max(baseline["peak"] * (1+threshold), baseline["peak"] + 4096):
+        found.append("{:.0%} more memory".format(result["peak"]/max(baseline["peak"], 1) - 1))
+    return found
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Run the DnDPy benchmark suite.")
+    parser.add_argument("-k", dest="keyword", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="use smaller sweeps")
+    parser.add_argument("--max-roster", type=int, help="largest roster size to run")
+    parser.add_argument("--max-dice", type=int, help="largest number of dice to run")
+    parser.add_argument("--mintime", type=float, default=0.3, help="seconds to spend timing each measurement (default: %(default)s)")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="fraction slower or larger than the baseline that counts as a regression (default: %(default)s)")
+    arguments = parser.parse_args(arguments)
+
+    sweeps = {"roster": QUICKROSTERSIZES if arguments.quick else ROSTERSIZES, "dice": QUICKDICECOUNTS if arguments.quick else DICECOUNTS, "single": [1]}
+    if arguments.max_roster:
+        sweeps["roster"] = [size for size in sweeps["roster"] if size <= arguments.max_roster]
+    if arguments.max_dice:
+        sweeps["dice"] = [size for size in sweeps["dice"] if size <= arguments.max_dice]
+    try:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)["results"]
+    except (OSError, ValueError, KeyError):
+        baseline = {}
+
+    results = {}
+    flagged = 0
+    print("{:<24}{:>10}{:>16}{:>12}{:>16}  {}".format("benchmark", "size", "ops/sec", "peak KiB", "baseline ops", "status"))
+    for name, (function, sweep) in BENCHMARKS.items():
+        if arguments.keyword not in name:
+            continue
+        for size in sweeps[sweep]:
+            key = "{}[{}]".format(name, size)
+            result = results[key] = measure(function, size, arguments.mintime)
+            previous = baseline.get(key)
+            found = regressions(result, previous, arguments.threshold)
+            flagged += bool(found)
+            status = "REGRESSION: " + ", ".join(found) if found else ("ok" if previous else "new")
+            print("{:<24}{:>10}{:>16,.0f}{:>12,.1f}{:>16}  {}".format(name, size, result["ops"], result["peak"]/1024, "{:,.0f}".format(previous["ops"]) if previous else "-", status))
+
+    if arguments.save_baseline:
+        # Results for benchmarks that weren't run this time are kept from the old baseline
+        merged = dict(baseline)
+        merged.update(results)
+        with open(arguments.baseline, "w") as file:
+            json.dump({"machine": platform.platform(), "python": platform.python_version(), "results": merged}, file, indent=1, sort_keys=True)
+        print("Saved {} results to {}".format(len(results), arguments.baseline))
+    elif flagged:
+        print("{} measurement(s) regressed against the baseline.".format(flagged))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Navigation soak test. Drives the menus through a scripted session of many steps (100,000 by default), moving between the main menu, rolls, character sheets, the character options menu and character selection over and over.
+# Every time a prompt reads a line, the depth of the call stack is recorded, and the memory in use is sampled as the session goes. Both should stay flat however many steps are run: navigating the menus must never build up the stack or leak memory.
+#
+#     python benchmarks/soak.py                  run 100,000 steps
+#     python benchmarks/soak.py --steps 5000     run a shorter session
+
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import builder
+import theprogram
+
+
+# One lap around the menus, as the lines typed at each prompt. Sheets are listed alphabetically, so selecting (1) at character selection always picks the same character.
+LAP = [
+    "2", "",           # roll for strength, then continue
+    "1", "20", "3", "",  # custom roll of 3d20
+    "26", "",          # view the character sheet
+    "27", "1", "",     # character options, view the sheet
+    "6",               # return to the main menu
+    "27", "3",         # character options, reset my luck
+    "27", "4", "2",    # character options, reset character, go back
+    "6",
+    "28", "1",         # switch character, then select the first character again
+    "x",               # an invalid selection
+]
+
+
+# Script lines that record the stack depth and sample memory as each one is read
+class SoakInput:
+    def __init__(self, steps, sample):
+        self.lines = itertools.islice(itertools.cycle(LAP), steps)
+        self.sample = sample
+        self.step = 0
+        self.depths = set()
+        self.memory = []
+
+    def readline(self):
+        line = next(self.lines, None)
+        if line is None:
+            return ""
+        self.step += 1
+        depth = 0
+        frame = sys._getframe()
+        while frame is not None:
+            depth += 1
+            frame = frame.f_back
+        self.depths.add(depth)
+        if self.step % self.sample == 0:
+            self.memory.append(tracemalloc.get_traced_memory()[0])
+        return line + "\n"
+
+    def isatty(self):
+        return False
+
+
+# Output stream that throws everything away, so that the session's output doesn't fill memory
+class NullOutput:
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Run a long scripted session through the DnDPy menus.")
+    parser.add_argument("--steps", type=int, default=100000, help="number of lines of input to send (default: %(default)s)")
+    parser.add_argument("--characters", type=int, default=5, help="number of character sheets to choose from (default: %(default)s)")
+    arguments = parser.parse_args(arguments)
+
+    directory = tempfile.mkdtemp(prefix="dndpy-soak-")
+    for character in builder.generate(arguments.characters, seed=1):
+        character.export(directory)
+    previous = os.getcwd()
+    os.chdir(directory)
+    script = SoakInput(arguments.steps, max(1, arguments.steps // 20))
+    try:
+        tracemalloc.start()
+        started = time.perf_counter()
+        theprogram.launcher(script=script, output=NullOutput())
+        elapsed = time.perf_counter() - started
+        tracemalloc.stop()
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print("{:,} steps in {:.1f}s ({:,.0f} steps/sec)".format(script.step, elapsed, script.step / elapsed))
+    print("Stack depth at the prompts: {} to {} frames".format(min(script.depths), max(script.depths)))
+    if script.memory:
+        settled = script.memory[len(script.memory)//4:]
+        print("Memory in use: {:,.1f} KiB after the first quarter, {:,.1f} KiB at the end, {:,.1f} KiB at most".format(settled[0]/1024, settled[-1]/1024, max(settled)/1024))
+    if script.step < arguments.steps:
+        print("The session ended early, after {:,} steps.".format(script.step))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
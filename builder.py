@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# Headless character construction. Character.setup(), levelup() and classevent() take every choice from a decisions object with two methods:
+#     number(kind, character, label) returns a whole number (the "level", or the raw "score" for the ability named by label)
+#     choose(kind, options, character) returns one of the options, which have already been narrowed down to valid choices
+# The program's interactive menus are the MenuDecisions provider in theprogram.py. The providers here make the same choices without any prompts, so characters can be built in bulk.
+
+import random
+
+import dice
+from theprogram import Character
+
+
+# Ability scores used by the greedy provider, highest first
+STANDARDARRAY = [15, 14, 13, 12, 10, 8]
+
+
+# Makes every decision at random. Raw scores are rolled as 4d6 dropping the lowest die, and the level is picked from the levels range unless a fixed level is given.
+class RandomDecisions:
+    def __init__(self, seed=None, level=None, levels=(1, 20)):
+        self.random = random.Random(seed)
+        self.level = level
+        self.levels = levels
+
+    def number(self, kind, character, label=None):
+        if kind == "level":
+            return self.level if self.level is not None else self.random.randint(*self.levels)
+        dice = sorted(self.random.randint(1, 6) for x in range(4))
+        return dice[1] + dice[2] + dice[3]
+
+    def choose(self, kind, options, character):
+        return self.random.choice(options)
+
+
+# Makes the choice that gives the character the best numbers. The standard array goes into the class's saving throw abilities first, increases go to the highest score still below 20, and new proficiencies and expertise go to the skills backed by the highest ability score.
+# Choices with nothing to compare, such as race or class, take the first option unless a fixed pick is given in picks, keyed by decision kind.
+class GreedyDecisions:
+    def __init__(self, level=1, picks=None):
+        self.level = level
+        self.picks = picks or {}
+
+    def number(self, kind, character, label=None):
+        if kind == "level":
+            return self.level
+        throws = character.classbuffs[character.setclass]["throws"]
+        order = throws + [score for score in character.scores if score not in throws]
+        return STANDARDARRAY[order.index(label)]
+
+    def choose(self, kind, options, character):
+        if kind in self.picks and self.picks[kind] in options:
+            return self.picks[kind]
+        if kind == "increase":
+            return max(options, key=lambda score: character.scores[score])
+        if kind in ("proficiency", "loreproficiency", "domainproficiency", "expertise"):
+            return max(options, key=lambda skill: character.scores[abilityof(skill)])
+        return options[0]
+
+
+# Plays back a fixed set of answers. choices maps each decision kind to either a single answer or a list of answers used in turn. Anything that runs out, or isn't listed, is passed on to the fallback provider.
+class ScriptedDecisions:
+    def __init__(self, choices, fallback=None):
+        self.choices = {kind: list(answer) if isinstance(answer, (list, tuple)) else answer for kind, answer in choices.items()}
+        self.fallback = fallback
+
+    def _next(self, kind):
+        answer = self.choices.get(kind)
+        if isinstance(answer, list):
+            return answer.pop(0) if answer else None
+        return answer
+
+    def number(self, kind, character, label=None):
+        answer = self._next(kind)
+        if isinstance(answer, dict):
+            answer = answer.get(label)
+        if answer is None:
+            return self._fallback().number(kind, character, label)
+        return answer
+
+    def choose(self, kind, options, character):
+        answer = self._next(kind)
+        if answer is None:
+            return self._fallback().choose(kind, options, character)
+        if answer not in options:
+            raise ValueError("{!r} is not a valid {} choice, expected one of {}".format(answer, kind, options))
+        return answer
+
+    def _fallback(self):
+        if self.fallback is None:
+            raise ValueError("no scripted answer left and no fallback provider given")
+        return self.fallback
+
+
+# Returns the ability score that a skill or saving throw is calculated from
+def abilityof(skill):
+    return Character.statability[skill]
+
+
+# Builds one character with the given name from a decisions provider without prompting or exporting. If six raw scores are given, they are used instead of asking the provider.
+def build(name, decisions, autoexport=False, rawscores=None):
+    character = Character(name)
+    character.setup(decisions, autoexport, rawscores=rawscores)
+    return character
+
+
+# Builds count characters one after another. Characters are yielded as they are made, so a large batch never has to be held in memory all at once. Unless a decisions provider is given, every choice is made at random from the seed.
+# If a method from abilityscores.METHODS is given, raw scores are generated by it in bulk, a chunk of characters at a time, instead of coming from the decisions provider.
+def generate(count, decisions=None, seed=None, prefix="Adventurer", method=None):
+    if decisions is None:
+        decisions = RandomDecisions(seed)
+    if method is None:
+        for index in range(1, count+1):
+            yield build("{} {}".format(prefix, index), decisions)
+        return
+    # Imported here, since it needs NumPy for bulk generation and builder is otherwise quick to import
+    import abilityscores
+    rng = dice.DiceStream(seed, "{}/scores".format(prefix))
+    for start in range(0, count, abilityscores.CHUNKROWS):
+        rows = abilityscores.generate(min(abilityscores.CHUNKROWS, count-start), method, rng)
+        for index, rawscores in enumerate(rows, start+1):
+            yield build("{} {}".format(prefix, index), decisions, rawscores=rawscores)
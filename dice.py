@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+# Batch dice engine. Rolls any number of NdX+mod rolls in one go without prompting the user, returning the per-die results and the totals of each roll.
+# NumPy is used when it is installed so that millions of dice can be rolled as arrays. Without it the engine falls back to the random module and plain lists, so the interactive program keeps working on a bare Python install.
+# NumPy, random and hashlib are only imported the first time they are needed, so importing this module (and everything that imports it) stays quick. Reading dice.numpy loads NumPy if it hasn't been loaded yet, and gives None if it isn't installed.
+
+import os
+
+
+# Largest number of dice that rolltotals() will hold in memory at once before summing
+CHUNKSIZE = 1 << 20
+
+# Shared generator used whenever a caller does not supply their own
+_generator = None
+
+# Seed that every named stream in this session is derived from, and the streams handed out so far. See stream().
+_sessionseed = None
+_streams = {}
+# Seeds given to single names by reseedstream() since the session seed was last set
+_streamseeds = {}
+# Goes up by one every time a seed changes, so that a roll log can tell when it needs to record the seeds again
+seedchanges = 0
+
+# Constants of the SplitMix64 generator that DiceStream is built on
+GAMMA = 0x9E3779B97F4A7C15
+MIXONE = 0xBF58476D1CE4E5B9
+MIXTWO = 0x94D049BB133111EB
+MASK = (1 << 64) - 1
+
+
+# Imports NumPy the first time it is asked for, returning None if it isn't installed
+def loadnumpy():
+    global numpy
+    try:
+        return numpy
+    except NameError:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+        return numpy
+
+
+# Loads NumPy when dice.numpy is read before anything here has needed it
+def __getattr__(name):
+    if name == "numpy":
+        return loadnumpy()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+# Returns the shared generator, creating it from the session seed the first time it is needed
+def generator():
+    global _generator
+    if _generator is None:
+        numpy = loadnumpy()
+        if numpy is not None:
+            _generator = numpy.random.default_rng(sessionseed())
+        else:
+            import random
+            _generator = random.Random(sessionseed())
+    return _generator
+
+
+# Replaces the shared generator with a freshly seeded one, and starts every named stream afresh from the same seed. Leaving the seed blank picks one from system entropy. Either way the seed is kept as the session seed, so the session can be replayed from it.
+def reseed(seed=None):
+    global _generator, _sessionseed, seedchanges
+    import random
+    if seed is None:
+        seed = int.from_bytes(os.urandom(8), "little")
+    numpy = loadnumpy()
+    random.seed(seed)
+    _generator = numpy.random.default_rng(seed) if numpy is not None else random.Random(seed)
+    _sessionseed = seed
+    _streams.clear()
+    _streamseeds.clear()
+    seedchanges += 1
+
+
+# Seed of the current session, picked from system entropy the first time it is needed unless reseed() has set one
+def sessionseed():
+    global _sessionseed, seedchanges
+    if _sessionseed is None:
+        _sessionseed = int.from_bytes(os.urandom(8), "little")
+        seedchanges += 1
+    return _sessionseed
+
+
+# Seeds given to single names by reseedstream() since the session seed was set, keyed by name. Every other name's stream comes from the session seed.
+def streamseeds():
+    return dict(_streamseeds)
+
+
+# Returns the stream of dice for a name, such as a character's name. Each name gets its own independent stream derived from the session seed, so one character's rolls never change another's, and the same seed always gives every character the same dice.
+def stream(name):
+    found = _streams.get(name)
+    if found is None:
+        found = _streams[name] = DiceStream(sessionseed(), name)
+    return found
+
+
+# Gives a name a fresh stream of dice from a new seed, leaving every other stream as it was. Leaving the seed blank picks one from system entropy. Returns the new stream.
+def reseedstream(name, seed=None):
+    global seedchanges
+    if seed is None:
+        seed = int.from_bytes(os.urandom(8), "little")
+    _streams[name] = DiceStream(seed, name)
+    _streamseeds[name] = seed
+    seedchanges += 1
+    return _streams[name]
+
+
+# Reproducible, seekable stream of dice. The Nth die of a stream depends only on the stream's seed, its name and N, using the counter-based SplitMix64 generator: die N is a mix of key + N*GAMMA, where the key is a hash of the seed and name.
+# Because no state carries over from one die to the next, a stream can jump to any position with seek() and replay a session from there, child streams can be split off by name with spawn(), and streams can be sent to other threads or processes and used there independently.
+# A stream can be passed as the generator to rollbatch() and rolltotals(). Faces are mapped from the top 32 bits of each 64-bit value, which keeps every face's chance within one part in a hundred million of fair for any die up to d100.
+class DiceStream:
+    def __init__(self, seed=None, name="", position=0):
+        if seed is None:
+            seed = int.from_bytes(os.urandom(8), "little")
+        self.seed = seed
+        self.name = name
+        from hashlib import blake2b
+        self.key = int.from_bytes(blake2b("{}/{}".format(seed, name).encode("utf-8"), digest_size=8).digest(), "little")
+        self.position = position
+
+    def __repr__(self):
+        return "DiceStream(seed={!r}, name={!r}, position={})".format(self.seed, self.name, self.position)
+
+    # Number of dice drawn from the stream so far, which is the position the next die comes from
+    def tell(self):
+        return self.position
+
+    # Moves the stream to a position, so that the next die is the one that was or will be drawn there
+    def seek(self, position):
+        if position < 0:
+            raise ValueError("position must be at least 0, got {}".format(position))
+        self.position = position
+
+    # Returns an independent child stream, for splitting work between threads or processes
+    def spawn(self, name):
+        return DiceStream(self.seed, "{}/{}".format(self.name, name))
+
+    # Returns count raw 64-bit values starting at the current position and moves past them. Uses NumPy when it is installed.
+    def _values(self, count):
+        start = self.position
+        self.position += count
+        numpy = loadnumpy()
+        if numpy is not None:
+            with numpy.errstate(over="ignore"):
+                z = numpy.arange(start+1, start+count+1, dtype=numpy.uint64) * numpy.uint64(GAMMA) + numpy.uint64(self.key)
+                z = (z ^ (z >> numpy.uint64(30))) * numpy.uint64(MIXONE)
+                z = (z ^ (z >> numpy.uint64(27))) * numpy.uint64(MIXTWO)
+                return z ^ (z >> numpy.uint64(31))
+        values = []
+        for counter in range(start+1, start+count+1):
+            z = (self.key + counter*GAMMA) & MASK
+            z = ((z ^ (z >> 30)) * MIXONE) & MASK
+            z = ((z ^ (z >> 27)) * MIXTWO) & MASK
+            values.append(z ^ (z >> 31))
+        return values
+
+    # Draws whole numbers from low up to but not including high, NumPy style. size can be a number or a shape, and the result is a NumPy array (or nested lists without NumPy) in that shape.
+    def integers(self, low, high, size=None):
+        shape = () if size is None else (size,) if isinstance(size, int) else tuple(size)
+        count = 1
+        for length in shape:
+            count *= length
+        span = high - low
+        values = self._values(count)
+        numpy = loadnumpy()
+        if numpy is not None:
+            faces = ((values >> numpy.uint64(32)) * numpy.uint64(span) >> numpy.uint64(32)).astype(numpy.int64) + low
+            return faces.reshape(shape) if shape else int(faces[0])
+        faces = [((value >> 32) * span >> 32) + low for value in values]
+        if not shape:
+            return faces[0]
+        for length in reversed(shape[1:]):
+            faces = [faces[index:index+length] for index in range(0, len(faces), length)]
+        return faces
+
+    # Draws one whole number from a to b inclusive, random module style
+    def randint(self, a, b):
+        return self.integers(a, b+1)
+
+
+# Holds the outcome of a batch of rolls. results has one row per roll and one column per die, and totals holds the sum of each row.
+class RollBatch:
+    def __init__(self, results, totals):
+        self.results = results
+        self.totals = totals
+
+    def __len__(self):
+        return len(self.totals)
+
+    # Returns the dice of a single roll as a list of ints
+    def row(self, index):
+        row = self.results[index]
+        numpy = loadnumpy()
+        return row.tolist() if numpy is not None and isinstance(row, numpy.ndarray) else list(row)
+
+    # Returns the total of a single roll as an int
+    def total(self, index):
+        return int(self.totals[index])
+
+
+# Checks the arguments shared by the batch functions and raises a ValueError describing the first bad one
+def _validate(amount, die, rolls):
+    if amount < 1:
+        raise ValueError("amount must be at least 1, got {}".format(amount))
+    if die < 1:
+        raise ValueError("die must have at least 1 side, got {}".format(die))
+    if rolls < 1:
+        raise ValueError("rolls must be at least 1, got {}".format(rolls))
+
+
+# Draws a rolls x amount block of dice from the generator. Any object with a NumPy-style integers(low, high, size) method can be used as the generator.
+def _draw(rng, die, rolls, amount):
+    if hasattr(rng, "integers"):
+        return rng.integers(1, die+1, size=(rolls, amount))
+    return [[rng.randint(1, die) for x in range(amount)] for y in range(rolls)]
+
+
+# Rolls amount dice with the given number of sides, rolls times over. As with roll(), the modifier is added to each die rather than once per roll.
+def rollbatch(amount, die, modifier=0, rolls=1, rng=None):
+    _validate(amount, die, rolls)
+    if rng is None:
+        rng = generator()
+    results = _draw(rng, die, rolls, amount)
+    if isinstance(results, list):
+        if modifier:
+            results = [[result+modifier for result in row] for row in results]
+        totals = [sum(row) for row in results]
+    else:
+        if modifier:
+            results += modifier
+        totals = results.sum(axis=1)
+    return RollBatch(results, totals)
+
+
+# Same as rollbatch() but only keeps the totals. Dice are drawn in chunks of at most CHUNKSIZE so that rolling a million dice per roll doesn't need a million-column array.
+def rolltotals(amount, die, modifier=0, rolls=1, rng=None):
+    _validate(amount, die, rolls)
+    if rng is None:
+        rng = generator()
+    numpy = loadnumpy()
+    if numpy is None or not hasattr(rng, "integers"):
+        return [sum(rng.randint(1, die) for x in range(amount)) + amount*modifier for y in range(rolls)]
+    totals = numpy.full(rolls, amount*modifier, dtype=numpy.int64)
+    rowsperchunk = max(1, CHUNKSIZE // amount)
+    for start in range(0, rolls, rowsperchunk):
+        stop = min(rolls, start+rowsperchunk)
+        remaining = amount
+        while remaining:
+            width = min(remaining, CHUNKSIZE)
+            totals[start:stop] += rng.integers(1, die+1, size=(stop-start, width)).sum(axis=1)
+            remaining -= width
+    return totals
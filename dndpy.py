@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+# Console entry point for the interactive program. theprogram.py is a library: importing it only defines the characters, menus and sheet handling, and never starts a session or prompts for anything. Running this module (or theprogram.py itself, which hands over to it) starts the main menu.
+#
+#     python dndpy.py                                  start the program
+#     python dndpy.py --log rolls.log                  log every roll made in the session
+#     python dndpy.py --profile profile.json           profile the session's hot paths
+#     python dndpy.py --seed 1234                      roll the same dice as a logged session that used this seed
+
+import argparse
+import os
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Create, level up and roll for D&D 5e characters.")
+    parser.add_argument("--log", default=os.environ.get("DNDPY_ROLLLOG"), help="log every roll made in the session to this file (default: $DNDPY_ROLLLOG)")
+    parser.add_argument("--profile", default=os.environ.get("DNDPY_PROFILE"), help="profile the session's hot paths and save the results to this file on exit (default: $DNDPY_PROFILE)")
+    parser.add_argument("--seed", type=int, help="seed for the dice, such as one printed by python rolllog.py seeds, to replay a session's rolls")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.seed is not None:
+        import dice
+        dice.reseed(arguments.seed)
+    from theprogram import launcher
+    if arguments.profile:
+        import atexit
+        import profiling
+        profiling.enable()
+        atexit.register(profiling.save, arguments.profile)
+    log = None
+    if arguments.log:
+        from rolllog import RollLog
+        log = RollLog(arguments.log)
+    launcher(log=log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# Write-coalescing persistence for character sheets.
+# Instead of rewriting a character's sheet every time it changes, changes are recorded in an ExportJournal. The journal keeps only the latest version of each sheet and writes them out together at a checkpoint, either when flush() is called or after a set interval. A party levelled up ten times therefore costs one sheet write per character.
+# Every recorded change is also appended to a journal file before anything else happens. If the program stops before a checkpoint, the next ExportJournal opened on the same directory replays the file and writes out the sheets that were waiting.
+# Sheets are always written to a temporary file and renamed into place, so a sheet is never left half written.
+
+import atexit
+import csv
+import json
+import os
+import threading
+
+
+# Name of the journal file kept alongside the character sheets
+JOURNALNAME = ".charactersheets.journal"
+
+
+# Writes a character sheet atomically: the sheet is written under a temporary name and then renamed over the old one. The temporary name starts with a dot so that it never looks like a sheet itself.
+# durable syncs the sheet's contents to disk before the rename, so the renamed file can never turn up empty after a power loss. The rename itself is only on disk once the directory has been synced with syncdirectory().
+def writesheet(path, row, durable=False):
+    directory, filename = os.path.split(path)
+    temporary = os.path.join(directory, "." + filename + ".tmp")
+    with open(temporary, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(row.keys()))
+        writer.writeheader()
+        writer.writerow(row)
+        if durable:
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+    os.replace(temporary, path)
+
+
+# Syncs a directory to disk, so that files renamed into it stay renamed after a power loss. Directories can't be opened for syncing on Windows, so there this does nothing.
+def syncdirectory(directory):
+    if os.name != "posix":
+        return
+    descriptor = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+# Collects sheet changes and writes them out in batches. Characters are recorded with record(), which takes anything with a pathname and a sheetrow() method.
+# interval is the number of seconds after the first pending change that the journal flushes itself. Leaving it blank means sheets are only written at explicit checkpoints, when flush() is called or the program exits.
+# durable makes every journal entry be synced to disk before record() returns, and every checkpoint sync the sheets it writes before the journal is emptied, which protects against power loss as well as the program stopping, at the cost of speed.
+class ExportJournal:
+    def __init__(self, directory=".", interval=None, durable=False):
+        self.directory = directory
+        self.path = os.path.join(directory, JOURNALNAME)
+        self.interval = interval
+        self.durable = durable
+        self.pending = {}
+        self.lock = threading.RLock()
+        self.timer = None
+        self.recover()
+        self.file = open(self.path, "a", encoding="utf-8")
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    # Number of sheets waiting to be written
+    def __len__(self):
+        return len(self.pending)
+
+    # Records the current state of a character. Only the latest state of each character is written at the next checkpoint.
+    def record(self, character):
+        filename = "charactersheet_" + character.pathname + ".csv"
+        row = character.sheetrow()
+        with self.lock:
+            self.file.write(json.dumps({"file": filename, "row": row}) + "\n")
+            self.file.flush()
+            if self.durable:
+                os.fsync(self.file.fileno())
+            self.pending[filename] = row
+            if self.interval is not None and self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    # Checkpoint: writes every pending sheet, then empties the journal file since nothing in it is needed any more. Returns the number of sheets written.
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            count = len(self.pending)
+            for filename, row in self.pending.items():
+                writesheet(os.path.join(self.directory, filename), row, self.durable)
+            # The journal entries are the only other copy of the sheets, so they are kept until the sheets are safely on disk
+            if self.durable and count:
+                syncdirectory(self.directory)
+            self.pending.clear()
+            if not self.file.closed:
+                self.file.truncate(0)
+                self.file.seek(0)
+            return count
+
+    checkpoint = flush
+
+    # Flushes anything still pending and closes the journal file, which is then empty and can be removed. Called automatically when the program exits.
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.flush()
+            self.file.close()
+            os.remove(self.path)
+            atexit.unregister(self.close)
+
+    # Replays a journal file left behind by a program that stopped before its last checkpoint. A partly written final entry is ignored, since the sheet it belonged to was never reported as saved.
+    def recover(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return 0
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            self.pending[entry["file"]] = entry["row"]
+        count = len(self.pending)
+        for filename, row in self.pending.items():
+            writesheet(os.path.join(self.directory, filename), row, self.durable)
+        if self.durable and count:
+            syncdirectory(self.directory)
+        self.pending.clear()
+        os.remove(self.path)
+        return count
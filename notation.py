@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+
+# Dice notation compiler. Turns expressions such as 4d6kh3, 2d20kl1+5, 8d6!, 2d6r2+1d4+3 or d% into Expression objects that can roll the expression once, sample it millions of times as arrays, and give its exact distribution.
+# Parsing is done once per expression: parse() keeps compiled expressions in an LRU cache keyed on the text, and each expression keeps its own exact distribution once it has been worked out, so repeating an expression in a session or a simulation skips straight to the rolling.
+#
+# An expression is a sum of terms separated by + or -. A term is a whole number or a roll of dice, written [count]d<sides> (d% is a d100) and followed by any of:
+#     khN / kN   keep the highest N dice        dhN   drop the highest N dice
+#     klN        keep the lowest N dice         dlN   drop the lowest N dice
+#     rN         reroll any die showing N or less, once, keeping the new roll
+#     !          exploding dice: a die showing its highest face is rolled again and added on
+# Rerolls apply to every die rolled, including the extra dice from explosions. A die explodes at most EXPLODELIMIT times, which keeps the exact distribution finite; sampling follows the same rule, so both always agree.
+
+import math
+import re
+from functools import lru_cache
+
+import dice
+from probability import Distribution, convolve
+
+numpy = dice.numpy
+
+
+# Number of compiled expressions kept in parse()'s cache
+PARSECACHESIZE = 1024
+
+# Most extra dice a single exploding die can add
+EXPLODELIMIT = 10
+
+TOKEN = re.compile(r"\s*(?:(?P<dice>(?P<count>\d*)d(?P<sides>\d+|%)(?P<modifiers>(?:(?:kh|kl|dh|dl|k|r)\d+|!)*))|(?P<number>\d+)|(?P<sign>[+-]))", re.IGNORECASE)
+MODIFIER = re.compile(r"(kh|kl|dh|dl|k|r)(\d+)|(!)", re.IGNORECASE)
+
+
+# One roll of dice within an expression
+class DiceTerm:
+    __slots__ = ("count", "sides", "keep", "highest", "reroll", "explode", "_counts")
+
+    def __init__(self, count, sides, keep=None, highest=True, reroll=0, explode=False):
+        self.count = count
+        self.sides = sides
+        # Number of dice kept, or None to keep them all
+        self.keep = keep
+        self.highest = highest
+        self.reroll = reroll
+        self.explode = explode
+        self._counts = None
+
+    def __str__(self):
+        text = "{}d{}".format(self.count, self.sides)
+        if self.reroll:
+            text += "r{}".format(self.reroll)
+        if self.explode:
+            text += "!"
+        if self.keep is not None and self.keep != self.count:
+            text += "{}{}".format("kh" if self.highest else "kl", self.keep)
+        return text
+
+    # Outcome counts of a single die with rerolls and explosions applied, as (lowest face, counts)
+    def diecounts(self):
+        if self._counts is None:
+            sides = self.sides
+            # One roll, rerolled once if it shows reroll or less: every face can come up on the second roll after any of the reroll faces
+            single = [(sides if face > self.reroll else 0) + self.reroll for face in range(1, sides+1)]
+            counts = single
+            if self.explode:
+                # Working back from the last die allowed to explode: the highest face leads on to another die, and everything else ends the chain
+                for depth in range(EXPLODELIMIT):
+                    outcomes = sum(counts)
+                    chained = [count*outcomes for count in single[:-1]] + [0]*(len(counts)+1)
+                    for index, count in enumerate(counts):
+                        chained[sides+index] += single[-1]*count
+                    counts = chained
+            self._counts = (1, tuple(counts))
+        return self._counts
+
+    # Exact distribution of the term's total
+    def distribution(self):
+        low, counts = self.diecounts()
+        keep = self.count if self.keep is None else self.keep
+        if keep == self.count:
+            return Distribution(low*self.count, _power(counts, self.count))
+        return Distribution(low*keep, _keepcounts(counts, self.count, keep, self.highest))
+
+    # Totals of rolls separate rolls of the term, as an array. Needs a generator with a NumPy-style integers() method.
+    def sample(self, rolls, rng):
+        sides = self.sides
+        faces = self._faces(rng, (rolls, self.count))
+        if self.explode:
+            total = faces.copy()
+            live = faces == sides
+            for depth in range(EXPLODELIMIT):
+                exploding = int(live.sum())
+                if not exploding:
+                    break
+                extra = self._faces(rng, exploding)
+                total[live] += extra
+                live[live] = extra == sides
+            faces = total
+        if self.keep is not None and self.keep != self.count:
+            faces.sort(axis=1)
+            faces = faces[:, self.count-self.keep:] if self.highest else faces[:, :self.keep]
+        return faces.sum(axis=1)
+
+    def _faces(self, rng, shape):
+        faces = rng.integers(1, self.sides+1, size=shape)
+        if self.reroll:
+            low = faces <= self.reroll
+            rerolled = int(low.sum())
+            if rerolled:
+                faces[low] = rng.integers(1, self.sides+1, size=rerolled)
+        return faces
+
+    # Rolls the term once, one die at a time. Returns the total, and every face that came up in the order rolled, including dice that were rerolled or dropped.
+    def rollonce(self, rng):
+        if hasattr(rng, "integers"):
+            draw = lambda: int(rng.integers(1, self.sides+1))
+        else:
+            draw = lambda: rng.randint(1, self.sides)
+        rolled = []
+        values = []
+        for index in range(self.count):
+            value = 0
+            for depth in range(EXPLODELIMIT+1):
+                face = draw()
+                rolled.append(face)
+                if face <= self.reroll:
+                    face = draw()
+                    rolled.append(face)
+                value += face
+                if not self.explode or face != self.sides:
+                    break
+            values.append(value)
+        if self.keep is not None and self.keep != self.count:
+            values.sort()
+            values = values[self.count-self.keep:] if self.highest else values[:self.keep]
+        return sum(values), rolled
+
+
+# Counts for the sum of amount independent copies of counts, by repeated halving as in probability.dicecounts()
+def _power(counts, amount):
+    if amount == 1:
+        return counts
+    half = amount // 2
+    first = _power(counts, half)
+    return convolve(first, first if half == amount-half else _power(counts, amount-half))
+
+
+# Counts for the sum of the highest (or lowest) keep of amount dice, each with the given outcome counts.
+# Goes through the faces from the best down, deciding how many of the dice show each face. With used dice placed so far, m more dice on a face can be picked in C(amount-used, m) ways and come up in count**m ways, and the first keep dice placed are the ones kept.
+def _keepcounts(counts, amount, keep, highest):
+    faces = range(len(counts)-1, -1, -1) if highest else range(len(counts))
+    # ways[used] maps the sum of the kept faces (counted from the lowest face) to the number of ways of getting there
+    ways = [{} for used in range(amount+1)]
+    ways[0][0] = 1
+    for face in faces:
+        count = counts[face]
+        if not count:
+            continue
+        for used in range(amount-1, -1, -1):
+            if not ways[used]:
+                continue
+            for more in range(1, amount-used+1):
+                weight = math.comb(amount-used, more) * count**more
+                kept = face * max(0, min(more, keep-used))
+                target = ways[used+more]
+                for total, number in ways[used].items():
+                    target[total+kept] = target.get(total+kept, 0) + number*weight
+    result = [0] * ((len(counts)-1)*keep + 1)
+    for total, number in ways[amount].items():
+        result[total] += number
+    return tuple(result)
+
+
+# A compiled dice expression: a sum of dice terms and whole numbers, each with a sign of +1 or -1
+class Expression:
+    __slots__ = ("text", "terms", "constant", "_distribution")
+
+    def __init__(self, text, terms, constant):
+        self.text = text
+        self.terms = tuple(terms)
+        self.constant = constant
+        self._distribution = None
+
+    def __repr__(self):
+        return "Expression({!r})".format(str(self))
+
+    def __str__(self):
+        text = ""
+        for sign, term in self.terms:
+            text += ("-" if sign < 0 else "+" if text else "") + str(term)
+        if self.constant or not text:
+            text += "{:+d}".format(self.constant) if text else str(self.constant)
+        return text
+
+    # Number of dice rolled, not counting explosions and rerolls
+    def dicecount(self):
+        return sum(term.count for sign, term in self.terms)
+
+    # Largest die in the expression
+    def largestdie(self):
+        return max((term.sides for sign, term in self.terms), default=0)
+
+    # Smallest die in the expression
+    def smallestdie(self):
+        return min((term.sides for sign, term in self.terms), default=0)
+
+    # Exact distribution of the expression's total, worked out the first time it is asked for
+    def distribution(self):
+        if self._distribution is None:
+            total = Distribution(self.constant, (1,))
+            for sign, term in self.terms:
+                part = term.distribution()
+                if sign < 0:
+                    part = Distribution(-part.high, reversed(part.counts))
+                total = total + part
+            self._distribution = total
+        return self._distribution
+
+    # Rolls the expression rolls times over and returns the totals, as a NumPy array when NumPy is installed and a list otherwise. rng is any generator accepted by dice.rollbatch(), and defaults to the shared one.
+    def sample(self, rolls=1, rng=None):
+        if rolls < 1:
+            raise ValueError("rolls must be at least 1, got {}".format(rolls))
+        if rng is None:
+            rng = dice.generator()
+        if numpy is None or not hasattr(rng, "integers"):
+            return [self.rollonce(rng)[0] for roll in range(rolls)]
+        totals = numpy.full(rolls, self.constant, dtype=numpy.int64)
+        # Rolls are made in chunks so that no more than about dice.CHUNKSIZE dice are held at once
+        rowsperchunk = max(1, dice.CHUNKSIZE // max(1, self.dicecount()))
+        for start in range(0, rolls, rowsperchunk):
+            stop = min(rolls, start+rowsperchunk)
+            for sign, term in self.terms:
+                totals[start:stop] += sign * term.sample(stop-start, rng)
+        return totals
+
+    # Rolls the expression once. Returns the total and, for each dice term, its die and every face rolled for it, for roll logs.
+    def rollonce(self, rng=None):
+        if rng is None:
+            rng = dice.generator()
+        total = self.constant
+        faces = []
+        for sign, term in self.terms:
+            value, rolled = term.rollonce(rng)
+            total += sign * value
+            faces.append((term.sides, rolled))
+        return total, faces
+
+    def roll(self, rng=None):
+        return self.rollonce(rng)[0]
+
+
+# Whether a piece of text is a complete dice expression that rolls at least one die. Plain numbers, signed or not, and anything that doesn't parse are not notation.
+def isnotation(text):
+    try:
+        return bool(parse(text.strip()).terms)
+    except ValueError:
+        return False
+
+
+# Compiles a dice expression, raising a ValueError that points at the problem if it isn't valid notation. Compiled expressions are cached, so parsing the same text again costs a dictionary lookup.
+@lru_cache(maxsize=PARSECACHESIZE)
+def parse(text):
+    terms = []
+    constant = 0
+    empty = True
+    sign = None
+    position = 0
+    stripped = text.rstrip()
+    while position < len(stripped):
+        match = TOKEN.match(stripped, position)
+        if match is None or match.end() == position:
+            raise ValueError("can't read the dice notation {!r} at {!r}".format(text, stripped[position:].lstrip()))
+        position = match.end()
+        if match.group("sign"):
+            if sign is not None:
+                raise ValueError("{!r} has two signs in a row".format(text))
+            sign = -1 if match.group("sign") == "-" else 1
+            continue
+        if sign is None and not empty:
+            raise ValueError("{!r} is missing a + or - between terms".format(text))
+        sign = 1 if sign is None else sign
+        if match.group("number"):
+            constant += sign * int(match.group("number"))
+        else:
+            terms.append((sign, _diceterm(text, match)))
+        empty = False
+        sign = None
+    if sign is not None or empty:
+        raise ValueError("{!r} is not a complete dice expression".format(text))
+    return Expression(text, terms, constant)
+
+
+# Builds the DiceTerm for a matched [count]d<sides> token and its modifiers
+def _diceterm(text, match):
+    count = int(match.group("count") or 1)
+    sides = 100 if match.group("sides") == "%" else int(match.group("sides"))
+    if count < 1:
+        raise ValueError("{!r} rolls no dice".format(text))
+    if sides < 1:
+        raise ValueError("dice in {!r} must have at least 1 side".format(text))
+    term = DiceTerm(count, sides)
+    modifiers = match.group("modifiers")
+    if MODIFIER.sub("", modifiers):
+        raise ValueError("can't read the dice modifiers {!r} in {!r}".format(modifiers, text))
+    for kind, number, exploding in MODIFIER.findall(modifiers):
+        kind = kind.lower()
+        if exploding:
+            if term.explode:
+                raise ValueError("{!r} explodes the same dice twice".format(text))
+            if sides == 1:
+                raise ValueError("a d1 can't explode, it would never stop")
+            term.explode = True
+        elif kind == "r":
+            if term.reroll:
+                raise ValueError("{!r} rerolls the same dice twice".format(text))
+            if not 0 < int(number) < sides:
+                raise ValueError("can only reroll faces from 1 to {} on a d{}, got r{}".format(sides-1, sides, number))
+            term.reroll = int(number)
+        else:
+            if term.keep is not None:
+                raise ValueError("{!r} keeps or drops dice twice in one term".format(text))
+            number = int(number)
+            if not 0 <= number <= count or (kind in ("kh", "kl", "k") and number == 0) or (kind in ("dh", "dl") and number == count):
+                raise ValueError("can't {} {} of {} dice in {!r}".format("keep" if kind.startswith("k") else "drop", number, count, text))
+            term.keep = number if kind.startswith("k") else count-number
+            term.highest = kind in ("kh", "k", "dl")
+    return term
+
+
+# Empties the caches of compiled expressions, mainly useful when timing from a cold start
+def clearcache():
+    parse.cache_clear()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+# Party-wide rolls. A Party holds any number of characters and rolls a group check, a saving throw or initiative for all of them at once, drawing every die in a single batch instead of one character at a time.
+# The stats of the whole party are gathered into one table the first time they are needed, so an encounter with dozens of combatants costs a few array operations per roll. NumPy is used when it is installed, and plain lists otherwise.
+
+import argparse
+from collections import namedtuple
+
+import dice
+from theprogram import Character, loadsheets
+
+numpy = dice.numpy
+
+
+# Stats that can be rolled as saving throws: the first five stats, which carry the class saving throw proficiencies
+SAVES = tuple(Character.statnames[:5])
+
+MODES = ("normal", "advantage", "disadvantage")
+
+# Skill recorded in roll logs for initiative rolls
+INITIATIVE = "Initiative"
+
+# One character's part in a group check or saving throw. faces holds both dice when rolling with advantage or disadvantage.
+CheckRoll = namedtuple("CheckRoll", ["character", "stat", "faces", "modifier", "total", "success"])
+
+# One character's place in the turn order
+Turn = namedtuple("Turn", ["character", "roll", "modifier", "total"])
+
+
+# The outcome of a group check or saving throw. The group passes when at least half of its members succeed.
+class GroupResult:
+    def __init__(self, stat, dc, mode, rolls):
+        self.stat = stat
+        self.dc = dc
+        self.mode = mode
+        self.rolls = rolls
+        self.successes = sum(1 for roll in rolls if roll.success)
+        self.passed = self.successes*2 >= len(rolls)
+
+    def __repr__(self):
+        return "{} DC {}: {} of {} succeeded, {}".format(self.stat, self.dc, self.successes, len(self.rolls), "passed" if self.passed else "failed")
+
+    def __iter__(self):
+        return iter(self.rolls)
+
+    def __len__(self):
+        return len(self.rolls)
+
+
+# A group of characters rolled for together. If a roll log from rolllog.py is given, every die rolled is logged against the character it was rolled for.
+class Party:
+    def __init__(self, characters, log=None):
+        self.characters = list(characters)
+        self.log = log
+        self._table = None
+
+    def __len__(self):
+        return len(self.characters)
+
+    # Table of every character's packed values, one row per character: the six ability scores and then the stats. Call refresh() after changing a member's scores or stats.
+    def table(self):
+        if self._table is None:
+            rows = []
+            for character in self.characters:
+                character.recalculate()
+                rows.append(character.packed()[6])
+            if numpy is not None:
+                self._table = numpy.frombuffer(b"".join(rows), dtype=numpy.int8).reshape(len(rows), len(Character.abilities)+len(Character.statnames)).astype(numpy.int64)
+            else:
+                self._table = [list(memoryview(row).cast("b")) for row in rows]
+        return self._table
+
+    def refresh(self):
+        self._table = None
+
+    # Every member's modifier for a stat
+    def modifiers(self, stat):
+        column = len(Character.abilities) + Character.statindex[stat]
+        table = self.table()
+        return table[:, column] if numpy is not None else [row[column] for row in table]
+
+    # Rolls count d20s for every member, as one row per member
+    def _draw(self, count, rng):
+        if rng is None:
+            rng = dice.generator()
+        if numpy is not None and hasattr(rng, "integers"):
+            return numpy.asarray(rng.integers(1, 21, size=(len(self.characters), count)))
+        return [[rng.randint(1, 20) for die in range(count)] for character in self.characters]
+
+    # Rolls a check of a stat against a DC for the whole party. mode can be "normal", "advantage" or "disadvantage".
+    def check(self, stat, dc, mode="normal", rng=None):
+        if stat not in Character.statindex:
+            raise ValueError("unknown stat {!r}".format(stat))
+        if mode not in MODES:
+            raise ValueError("mode must be one of {}, got {!r}".format(", ".join(MODES), mode))
+        if not self.characters:
+            return GroupResult(stat, dc, mode, [])
+        modifiers = self.modifiers(stat)
+        faces = self._draw(1 if mode == "normal" else 2, rng)
+        if numpy is not None and not isinstance(faces, list):
+            die = faces[:, 0] if mode == "normal" else faces.max(axis=1) if mode == "advantage" else faces.min(axis=1)
+            totals = (die + modifiers).tolist()
+            faces = faces.tolist()
+            modifiers = modifiers.tolist()
+        else:
+            pick = {"normal": lambda row: row[0], "advantage": max, "disadvantage": min}[mode]
+            modifiers = [int(modifier) for modifier in modifiers]
+            totals = [pick(row) + modifier for row, modifier in zip(faces, modifiers)]
+        if self.log is not None:
+            for character, row, modifier in zip(self.characters, faces, modifiers):
+                self.log.record(character.name, stat, 20, modifier, row)
+        return GroupResult(stat, dc, mode, [CheckRoll(character, stat, tuple(row), modifier, total, total >= dc) for character, row, modifier, total in zip(self.characters, faces, modifiers, totals)])
+
+    # Rolls a saving throw for the whole party. Only the stats in SAVES can be rolled as saving throws.
+    def save(self, stat, dc, mode="normal", rng=None):
+        if stat not in SAVES:
+            raise ValueError("saving throws can be made for {}, not {!r}".format(", ".join(SAVES), stat))
+        return self.check(stat, dc, mode, rng)
+
+    # Rolls initiative for the whole party and returns the turn order. Each member rolls a d20 and adds their Dexterity modifier. Ties go to the higher Dexterity score, and are otherwise settled by a roll-off.
+    def initiative(self, rng=None):
+        if not self.characters:
+            return []
+        if rng is None:
+            rng = dice.generator()
+        faces = self._draw(2, rng)
+        dexterity = Character.abilityindex["Dexterity"]
+        if numpy is not None and not isinstance(faces, list):
+            scores = self.table()[:, dexterity]
+            modifiers = (scores - 10) // 2
+            totals = faces[:, 0] + modifiers
+            # The second die is the roll-off. Sorting by the last key first, the order is by total, then by score, then by roll-off, all highest first.
+            order = numpy.lexsort((-faces[:, 1], -scores, -totals)).tolist()
+            rolls, modifiers, totals = faces[:, 0].tolist(), modifiers.tolist(), totals.tolist()
+        else:
+            scores = [row[dexterity] for row in self.table()]
+            modifiers = [(score-10) // 2 for score in scores]
+            rolls = [row[0] for row in faces]
+            totals = [roll + modifier for roll, modifier in zip(rolls, modifiers)]
+            order = sorted(range(len(self.characters)), key=lambda index: (-totals[index], -scores[index], -faces[index][1]))
+        if self.log is not None:
+            for character, roll in zip(self.characters, rolls):
+                self.log.record(character.name, INITIATIVE, 20, 0, [roll])
+        return [Turn(self.characters[index], rolls[index], modifiers[index], totals[index]) for index in order]
+
+
+# Command line tool for rolling for every character sheet in a directory at once
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Roll group checks, saving throws and initiative for a whole party of DnDPy characters.")
+    parser.add_argument("--directory", default=".", help="directory holding the character sheets (default: the current directory)")
+    parser.add_argument("--seed", type=int, help="seed for the dice, to repeat a set of rolls")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, description in (("check", "roll a group check of a stat"), ("save", "roll a saving throw for everyone")):
+        subparser = subparsers.add_parser(command, help=description)
+        subparser.add_argument("stat", choices=SAVES if command == "save" else Character.statnames, metavar="stat")
+        subparser.add_argument("dc", type=int)
+        subparser.add_argument("--mode", choices=MODES, default="normal")
+    subparsers.add_parser("initiative", help="roll initiative and show the turn order")
+    arguments = parser.parse_args(arguments)
+    if arguments.seed is not None:
+        dice.reseed(arguments.seed)
+    party = Party(loadsheets(arguments.directory))
+    if not party.characters:
+        print("No character sheets found.")
+        return
+    if arguments.command == "initiative":
+        for turn, entry in enumerate(party.initiative(), 1):
+            print("{:>4}. {:<30}{:>4} ({:>2} {:+d})".format(turn, entry.character.name, entry.total, entry.roll, entry.modifier))
+        return
+    result = getattr(party, arguments.command)(arguments.stat, arguments.dc, arguments.mode)
+    for roll in result:
+        print("{:<30}{:>4} ({} {:+d}) {}".format(roll.character.name, roll.total, "/".join(str(face) for face in roll.faces), roll.modifier, "success" if roll.success else "failure"))
+    print("{} of {} succeeded: the party {}.".format(result.successes, len(result), "passes" if result.passed else "fails"))
+
+
+if __name__ == "__main__":
+    main()
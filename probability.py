@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# Exact probability engine for dice rolls. Distributions are built by convolution and held as integer outcome counts, so every probability it returns is exact.
+# Sub-results are memoized in bounded LRU caches. Repeated queries, and larger queries that share a sub-result (100d20 reuses 50d20, 25d20 and so on), skip the work entirely.
+
+import bisect
+from fractions import Fraction
+from functools import lru_cache
+
+
+# Number of dice-sum count tables and finished distributions kept in the caches
+COUNTCACHESIZE = 512
+DISTRIBUTIONCACHESIZE = 2048
+
+
+# An exact discrete distribution over the integers low, low+1, ... where counts[i] is the number of ways of rolling low+i out of total equally likely outcomes.
+# Instances are immutable and shared between callers through the caches, so nothing on them should be changed after creation.
+class Distribution:
+    __slots__ = ("low", "counts", "total", "_cumulative")
+
+    def __init__(self, low, counts):
+        self.low = low
+        self.counts = tuple(counts)
+        self.total = sum(self.counts)
+        self._cumulative = None
+
+    def __repr__(self):
+        return "Distribution({}..{})".format(self.low, self.high)
+
+    @property
+    def high(self):
+        return self.low + len(self.counts) - 1
+
+    # Running totals of the counts, built the first time a cdf or percentile is asked for
+    @property
+    def cumulative(self):
+        if self._cumulative is None:
+            running = 0
+            cumulative = []
+            for count in self.counts:
+                running += count
+                cumulative.append(running)
+            self._cumulative = cumulative
+        return self._cumulative
+
+    # Every possible outcome paired with its exact probability
+    def items(self):
+        return [(self.low+index, Fraction(count, self.total)) for index, count in enumerate(self.counts) if count]
+
+    # Probability of rolling exactly value
+    def pmf(self, value):
+        if value < self.low or value > self.high:
+            return Fraction(0)
+        return Fraction(self.counts[value-self.low], self.total)
+
+    # Probability of rolling value or lower
+    def cdf(self, value):
+        if value < self.low:
+            return Fraction(0)
+        if value >= self.high:
+            return Fraction(1)
+        return Fraction(self.cumulative[value-self.low], self.total)
+
+    # Probability of rolling value or higher, which is the chance of meeting a DC of value
+    def atleast(self, value):
+        return 1 - self.cdf(value-1)
+
+    def mean(self):
+        return Fraction(sum(index*count for index, count in enumerate(self.counts)), self.total) + self.low
+
+    def variance(self):
+        offset = self.mean() - self.low
+        return Fraction(sum(count*(index-offset)**2 for index, count in enumerate(self.counts)), self.total)
+
+    # Smallest outcome whose cdf is at least fraction, so percentile(0.5) is the median
+    def percentile(self, fraction):
+        if not 0 <= fraction <= 1:
+            raise ValueError("percentile must be between 0 and 1, got {}".format(fraction))
+        target = Fraction(fraction) * self.total
+        return self.low + bisect.bisect_left(self.cumulative, target)
+
+    # Returns the same distribution moved up or down by offset
+    def shifted(self, offset):
+        if offset == 0:
+            return self
+        return Distribution(self.low+offset, self.counts)
+
+    # Adding two distributions gives the distribution of the sum of two independent rolls
+    def __add__(self, other):
+        if isinstance(other, int):
+            return self.shifted(other)
+        return Distribution(self.low+other.low, convolve(self.counts, other.counts))
+
+    __radd__ = __add__
+
+
+# Multiplies two count polynomials together exactly. Each sequence is packed into one large integer with enough room per coefficient that no carries can overlap, the two integers are multiplied, and the product is unpacked again. This leans on Python's fast big-integer multiplication instead of an O(n*m) loop.
+def convolve(first, second):
+    if len(first) == 1:
+        return tuple(first[0]*count for count in second)
+    if len(second) == 1:
+        return tuple(second[0]*count for count in first)
+    width = (max(first) * max(second) * min(len(first), len(second))).bit_length()
+    nbytes = width // 8 + 1
+    packedfirst = int.from_bytes(b"".join(count.to_bytes(nbytes, "little") for count in first), "little")
+    packedsecond = int.from_bytes(b"".join(count.to_bytes(nbytes, "little") for count in second), "little")
+    length = len(first) + len(second) - 1
+    product = (packedfirst * packedsecond).to_bytes(nbytes*length, "little")
+    return tuple(int.from_bytes(product[index:index+nbytes], "little") for index in range(0, nbytes*length, nbytes))
+
+
+# Counts for the sum of amount dice with die sides, starting at a sum of amount. Built by splitting the dice in half so that the cache only ever needs about two entries per halving.
+@lru_cache(maxsize=COUNTCACHESIZE)
+def dicecounts(amount, die):
+    if amount == 1:
+        return (1,) * die
+    half = amount // 2
+    return convolve(dicecounts(half, die), dicecounts(amount-half, die))
+
+
+# Exact distribution of the total of roll(amount, die, modifier). As with roll(), the modifier is added to every die, so the total moves by amount*modifier.
+@lru_cache(maxsize=DISTRIBUTIONCACHESIZE)
+def distribution(amount, die, modifier=0):
+    if amount < 1:
+        raise ValueError("amount must be at least 1, got {}".format(amount))
+    if die < 1:
+        raise ValueError("die must have at least 1 side, got {}".format(die))
+    return Distribution(amount*(1+modifier), dicecounts(amount, die))
+
+
+# Distribution of a d20 check for one of a character's stats, as rolled from the program menu
+def checkdistribution(character, skill):
+    return distribution(1, 20, character.stats[skill])
+
+
+# Chance that a character meets or beats a DC on a d20 check for one of their stats
+def checkchance(character, skill, dc):
+    return checkdistribution(character, skill).atleast(dc)
+
+
+# Empties the memoized results, mainly useful when timing the engine from a cold start
+def clearcache():
+    dicecounts.cache_clear()
+    distribution.cache_clear()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+# Opt-in profiling of the program's hot paths: recalculating and exporting characters, loading character sheets, rolling dice and rendering sheets and menus.
+# Profiling is switched on with enable(), or by setting the DNDPY_PROFILE environment variable to the name of a file to write the results to when the program exits. While it is on, each function listed in TARGETS is swapped for a wrapper that records how many times it was called, how long it took (in total, excluding the profiled calls it made, and as percentiles), and how many memory blocks it left allocated. disable() puts the original functions back, so while profiling is off the hot paths run exactly the code they always have and cost nothing extra.
+# Results can be saved as JSON, and as a folded stack file (one "outer;inner microseconds" line per call path) that flamegraph.pl, speedscope and similar tools can draw.
+#
+#     DNDPY_PROFILE=profile.json python theprogram.py    profile a session
+#     python profiling.py show profile.json              print the results of a session
+
+import argparse
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+from sys import getallocatedblocks
+from time import perf_counter_ns
+
+
+ENVIRONMENT = "DNDPY_PROFILE"
+
+# Functions that are profiled, as names in theprogram.py. The time of roll() includes any time spent waiting at its prompts.
+TARGETS = ("Character.recalculate", "Character.export", "Character.rendersheet", "Character.charactersheet", "SheetIndex.scan", "SheetIndex.load", "SheetIndex.save", "loadsheet", "loadsheets", "roll", "rendersheets", "columns", "bordered")
+
+# Percentiles reported for each function
+PERCENTILES = (0.5, 0.9, 0.99)
+
+# Wrapped functions, as (owner, attribute, original) so that they can be put back
+_installed = []
+# What each thread has recorded. Every thread records into its own ThreadRecord without taking a lock, and the records are only combined when the results are read.
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+# Latencies are counted in buckets rather than kept one by one, so memory doesn't grow with the number of calls. Durations under 16ns get a bucket each, and above that each power of two is split into eight buckets, so a percentile is always within an eighth of the true value. This returns the middle of the range of durations that fall in a bucket.
+def _bucketmiddle(bucket):
+    if bucket < 16:
+        return bucket
+    shift, mantissa = divmod(bucket, 8)
+    shift -= 1
+    mantissa += 8
+    return (mantissa << shift) + (1 << shift) // 2
+
+
+# Everything recorded about one function. Times are in nanoseconds.
+class Timing:
+    __slots__ = ("calls", "total", "own", "maximum", "blocks", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.own = 0
+        self.maximum = 0
+        self.blocks = 0
+        self.buckets = {}
+
+    def add(self, elapsed, own, blocks):
+        self.calls += 1
+        self.total += elapsed
+        self.own += own
+        self.blocks += blocks
+        if elapsed > self.maximum:
+            self.maximum = elapsed
+        shift = elapsed.bit_length() - 4
+        bucket = shift*8 + (elapsed >> shift) if shift > 0 else elapsed
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    # Adds in everything recorded by another Timing
+    def merge(self, other):
+        self.calls += other.calls
+        self.total += other.total
+        self.own += other.own
+        self.blocks += other.blocks
+        self.maximum = max(self.maximum, other.maximum)
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    # Duration that fraction of the calls took at most
+    def percentile(self, fraction):
+        target = fraction * self.calls
+        running = 0
+        for bucket in sorted(self.buckets):
+            running += self.buckets[bucket]
+            if running >= target:
+                return min(_bucketmiddle(bucket), self.maximum)
+        return self.maximum
+
+    def summary(self):
+        summary = {"calls": self.calls, "total_ms": self.total / 1e6, "own_ms": self.own / 1e6, "mean_us": self.total / self.calls / 1e3 if self.calls else 0.0, "max_us": self.maximum / 1e3, "blocks": self.blocks}
+        for fraction in PERCENTILES:
+            summary["p{:g}_us".format(fraction*100)] = self.percentile(fraction) / 1e3
+        return summary
+
+
+# Everything one thread has recorded: the names of the profiled calls it is in the middle of, innermost last, the time spent so far in the calls each of them made, and its timings and folded stacks
+class ThreadRecord:
+    __slots__ = ("names", "children", "timings", "folded")
+
+    def __init__(self):
+        self.names = []
+        self.children = []
+        self.timings = {}
+        self.folded = {}
+
+
+# The calling thread's record, made the first time the thread calls a profiled function
+def _record():
+    try:
+        return _local.record
+    except AttributeError:
+        record = _local.record = ThreadRecord()
+        with _lock:
+            _records.append(record)
+        return record
+
+
+# Returns a wrapper that profiles every call to function under name
+def _wrap(name, function):
+    @functools.wraps(function)
+    def wrapper(*arguments, **keywords):
+        record = _record()
+        names = record.names
+        children = record.children
+        names.append(name)
+        children.append(0)
+        blocks = getallocatedblocks()
+        start = perf_counter_ns()
+        try:
+            return function(*arguments, **keywords)
+        finally:
+            elapsed = perf_counter_ns() - start
+            blocks = getallocatedblocks() - blocks
+            path = ";".join(names) if len(names) > 1 else name
+            own = elapsed - children.pop()
+            names.pop()
+            if children:
+                children[-1] += elapsed
+            timing = record.timings.get(name)
+            if timing is None:
+                timing = record.timings[name] = Timing()
+            timing.add(elapsed, own, blocks)
+            record.folded[path] = record.folded.get(path, 0) + own
+    return wrapper
+
+
+def enabled():
+    return bool(_installed)
+
+
+# Starts profiling every function in TARGETS. Module level functions are also replaced in every other loaded module that imported them by name, such as server.py.
+# program is the module the targets are in, which only needs to be given when theprogram.py is being run as a script and so is loaded as __main__.
+def enable(program=None):
+    if _installed:
+        return
+    if program is None:
+        import theprogram as program
+    theprogram = program
+    for target in TARGETS:
+        owner = theprogram
+        *path, attribute = target.split(".")
+        for part in path:
+            owner = getattr(owner, part)
+        original = owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)
+        wrapper = _wrap(target, original)
+        setattr(owner, attribute, wrapper)
+        _installed.append((owner, attribute, original))
+        if not path:
+            for module in list(sys.modules.values()):
+                if module is not theprogram and getattr(module, attribute, None) is original:
+                    setattr(module, attribute, wrapper)
+                    _installed.append((module, attribute, original))
+
+
+# Stops profiling and puts the original functions back. What has been recorded so far is kept until reset().
+def disable():
+    while _installed:
+        owner, attribute, original = _installed.pop()
+        setattr(owner, attribute, original)
+
+
+# Forgets everything recorded so far
+def reset():
+    with _lock:
+        for record in _records:
+            record.timings.clear()
+            record.folded.clear()
+
+
+# Runs a block with profiling switched on, switching it off again afterwards if it was off before
+@contextlib.contextmanager
+def profiled():
+    wasenabled = enabled()
+    enable()
+    try:
+        yield
+    finally:
+        if not wasenabled:
+            disable()
+
+
+# What has been recorded for each function, as a dictionary of plain numbers keyed by function name
+def results():
+    timings = {}
+    with _lock:
+        for record in _records:
+            for name, timing in list(record.timings.items()):
+                timings.setdefault(name, Timing()).merge(timing)
+    return {name: timing.summary() for name, timing in sorted(timings.items())}
+
+
+# Folded stacks: each path of nested profiled calls, joined by semicolons, with the time spent in its innermost function in microseconds
+def folded():
+    paths = {}
+    with _lock:
+        for record in _records:
+            for path, own in list(record.folded.items()):
+                paths[path] = paths.get(path, 0) + own
+    return "".join("{} {}\n".format(path, own // 1000) for path, own in sorted(paths.items()) if own >= 1000)
+
+
+# Writes the results as JSON to path, and the folded stacks alongside it with the extension .folded
+def save(path):
+    with open(path, "w") as file:
+        json.dump({"functions": results()}, file, indent=1)
+    with open(os.path.splitext(path)[0] + ".folded", "w") as file:
+        file.write(folded())
+    return path
+
+
+# Results as a table, slowest total time first
+def report(functions=None):
+    if functions is None:
+        functions = results()
+    lines = ["{:<26}{:>10}{:>12}{:>12}{:>10}{:>10}{:>10}{:>10}{:>10}".format("function", "calls", "total ms", "own ms", "p50 us", "p90 us", "p99 us", "max us", "blocks")]
+    for name, summary in sorted(functions.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+        lines.append("{:<26}{:>10,}{:>12.2f}{:>12.2f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10,}".format(name, summary["calls"], summary["total_ms"], summary["own_ms"], summary["p50_us"], summary["p90_us"], summary["p99_us"], summary["max_us"], summary["blocks"]))
+    return "\n".join(lines)
+
+
+# Switches profiling on if the DNDPY_PROFILE environment variable names a file, and saves the results to it when the program exits
+def fromenvironment(program=None):
+    path = os.environ.get(ENVIRONMENT)
+    if path:
+        enable(program)
+        atexit.register(save, path)
+    return path
+
+
+# Command line tool for reading saved results
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Show the results of a profiled DnDPy session.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("show", help="print the results saved in a JSON file").add_argument("results")
+    arguments = parser.parse_args(arguments)
+    with open(arguments.results) as file:
+        print(report(json.load(file)["functions"]))
+
+
+if __name__ == "__main__":
+    main()
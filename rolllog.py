@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+# Append-only binary log of dice rolls, with streaming fairness statistics.
+# Each die rolled is stored as a small fixed-size record: when it was rolled, the character and skill it was rolled for, the die, the modifier and the face that came up. Character and skill names are written once per session and referred to by number after that. Records go through a large write buffer, so logging a roll costs a few microseconds.
+# The dice seeds are logged too: the session seed when a log is opened, and the seeds again whenever they change, such as when a character's luck is reset. Reseeding with a logged seed replays the session's dice exactly.
+# RollStats reads a log (or takes rolls as they happen) one record at a time and keeps a histogram and a chi-square test of fairness for each type of die, and each character's average and luck, without ever holding the rolls themselves. A log of millions of rolls can be audited in a fixed amount of memory.
+
+import argparse
+import atexit
+import math
+import os
+import struct
+import time
+from collections import namedtuple
+
+import dice
+
+
+MAGIC = b"DNDROLL1"
+
+# Record types. Every record starts with its type.
+ROLLRECORD = 0
+NAMERECORD = 1
+SESSIONRECORD = 2
+SEEDRECORD = 3
+
+# A roll: type, timestamp in nanoseconds, character number, skill number, die, modifier, face
+ROLLFORMAT = struct.Struct("<BqIHHhH")
+# Lowest and highest modifier a roll record can hold
+LOWESTMODIFIER = -(1 << 15)
+HIGHESTMODIFIER = (1 << 15) - 1
+# A name: type, number, length of the UTF-8 name that follows
+NAMEFORMAT = struct.Struct("<BIH")
+# A seed: type, number of the character it was given to (SESSIONSEED for the session seed), length of the seed written out in decimal that follows
+SEEDFORMAT = struct.Struct("<BIH")
+SESSIONSEED = 0xFFFFFFFF
+
+# Size of the write buffer, and of the blocks a log is read in
+BUFFERSIZE = 1 << 20
+
+# Skill recorded for rolls that aren't made for any stat, such as custom rolls
+CUSTOM = "Custom"
+
+Roll = namedtuple("Roll", ["timestamp", "character", "skill", "die", "modifier", "face"])
+
+
+# Writes rolls to the end of a log file, creating it if it doesn't exist. Names are numbered afresh each time a log is opened, so a log can be appended to by any number of sessions one after another.
+# If a RollStats is given, every roll written is also added to it, keeping the statistics live.
+class RollLog:
+    def __init__(self, path, stats=None):
+        self.path = path
+        self.stats = stats
+        self.names = {}
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab", buffering=BUFFERSIZE)
+        if new:
+            self.file.write(MAGIC)
+        self.file.write(bytes([SESSIONRECORD]))
+        self._seeds()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    # Returns the number standing for a name, writing the name to the log the first time it is used
+    def _number(self, name):
+        number = self.names.get(name)
+        if number is None:
+            number = self.names[name] = len(self.names)
+            encoded = name.encode("utf-8")
+            self.file.write(NAMEFORMAT.pack(NAMERECORD, number, len(encoded)) + encoded)
+        return number
+
+    # Writes the session seed and every seed given to a single character, and remembers which seeds those were
+    def _seeds(self):
+        seeds = [(SESSIONSEED, dice.sessionseed())]
+        seeds += [(self._number(name), seed) for name, seed in dice.streamseeds().items()]
+        for number, seed in seeds:
+            encoded = str(seed).encode("ascii")
+            self.file.write(SEEDFORMAT.pack(SEEDRECORD, number, len(encoded)) + encoded)
+        self.seedchanges = dice.seedchanges
+
+    # Logs the faces that came up on one or more dice rolled together. character and skill are names, and the modifier is the one added to each die.
+    def record(self, character, skill, die, modifier, faces, timestamp=None):
+        if not LOWESTMODIFIER <= modifier <= HIGHESTMODIFIER:
+            raise ValueError("modifier must be between {} and {} to be logged, got {}".format(LOWESTMODIFIER, HIGHESTMODIFIER, modifier))
+        if timestamp is None:
+            timestamp = time.time_ns()
+        if dice.seedchanges != self.seedchanges:
+            self._seeds()
+        characternumber = self._number(character or "")
+        skillnumber = self._number(skill or CUSTOM)
+        pack = ROLLFORMAT.pack
+        self.file.write(b"".join([pack(ROLLRECORD, timestamp, characternumber, skillnumber, die, modifier, face) for face in faces]))
+        if self.stats is not None:
+            for face in faces:
+                self.stats.add(character or "", die, face)
+
+    # Writes everything buffered so far to the file
+    def flush(self):
+        if not self.file.closed:
+            self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            atexit.unregister(self.close)
+
+
+# Reads every roll in a log in order, a block at a time, yielding a Roll for each. If a list is given as seeds, every seed logged is added to it as it is read, as the name of the character it was given to (None for the session seed) and the seed.
+def replay(path, seeds=None):
+    names = {}
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a roll log".format(path))
+        buffer = b""
+        while True:
+            block = file.read(BUFFERSIZE)
+            if not block:
+                break
+            buffer += block
+            position = 0
+            end = len(buffer)
+            while position < end:
+                kind = buffer[position]
+                if kind == ROLLRECORD:
+                    # Rolls come in long runs between the occasional name, so the whole run is unpacked in one go. The type byte of every record in the run is 0, which finds where it ends.
+                    complete = (end - position) // ROLLFORMAT.size
+                    types = buffer[position:position+complete*ROLLFORMAT.size:ROLLFORMAT.size]
+                    run = complete - len(types.lstrip(b"\0"))
+                    if run == 0:
+                        break
+                    stop = position + run*ROLLFORMAT.size
+                    for kind, timestamp, character, skill, die, modifier, face in ROLLFORMAT.iter_unpack(buffer[position:stop]):
+                        yield Roll(timestamp, names.get(character, ""), names.get(skill, CUSTOM), die, modifier, face)
+                    position = stop
+                elif kind == NAMERECORD or kind == SEEDRECORD:
+                    # Names and seeds have the same layout, so one check covers both
+                    if position + NAMEFORMAT.size > end:
+                        break
+                    kind, number, length = NAMEFORMAT.unpack_from(buffer, position)
+                    if position + NAMEFORMAT.size + length > end:
+                        break
+                    start = position + NAMEFORMAT.size
+                    text = buffer[start:start+length].decode("utf-8")
+                    if kind == NAMERECORD:
+                        names[number] = text
+                    elif seeds is not None:
+                        seeds.append((None if number == SESSIONSEED else names.get(number, ""), int(text)))
+                    position = start + length
+                elif kind == SESSIONRECORD:
+                    names = {}
+                    position += 1
+                else:
+                    raise ValueError("{} is damaged: unknown record type {} at byte {}".format(path, kind, file.tell() - len(buffer) + position))
+            # Whatever is left over is the start of a record that continues in the next block. A partly written record at the very end of the log, left by a program that stopped mid-write, is ignored.
+            buffer = buffer[position:]
+
+
+# Chance of a chi-square statistic at least this large from a fair die, for the given degrees of freedom. This is the regularised upper incomplete gamma function Q(df/2, statistic/2).
+def chisquarep(statistic, df):
+    if statistic <= 0:
+        return 1.0
+    a = df / 2
+    x = statistic / 2
+    logprefix = a*math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        # Series for the lower function P, which converges quickly here
+        term = total = 1 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1 - total*math.exp(logprefix))
+    # Continued fraction for Q (modified Lentz's method)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    i = 0
+    while True:
+        i += 1
+        an = -i * (i - a)
+        b += 2
+        d = an*d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an/c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, math.exp(logprefix) * h)
+
+
+# Running statistics over a stream of rolls. For each type of die it keeps a histogram of the faces, and for each character and type of die the number of rolls and their total. Nothing else is kept, so memory only grows with the number of die types and characters, never with the number of rolls.
+class RollStats:
+    def __init__(self):
+        self.histograms = {}
+        self.characters = {}
+
+    def add(self, character, die, face):
+        histogram = self.histograms.get(die)
+        if histogram is None:
+            histogram = self.histograms[die] = [0] * die
+        if 1 <= face <= die:
+            histogram[face-1] += 1
+        totals = self.characters.get(character)
+        if totals is None:
+            totals = self.characters[character] = {}
+        count, total = totals.get(die, (0, 0))
+        totals[die] = (count+1, total+face)
+
+    # Adds every roll in a log
+    def replay(self, path):
+        add = self.add
+        for roll in replay(path):
+            add(roll.character, roll.die, roll.face)
+        return self
+
+    # Number of rolls seen of a die, or of every die if none is given
+    def count(self, die=None):
+        if die is not None:
+            return sum(self.histograms.get(die, ()))
+        return sum(sum(histogram) for histogram in self.histograms.values())
+
+    # Chi-square test of whether a die has been rolling fairly. Returns the statistic, its degrees of freedom and the chance of a fair die doing at least this badly. A tiny chance means the die looks loaded.
+    def chisquare(self, die):
+        histogram = self.histograms[die]
+        rolls = sum(histogram)
+        if rolls == 0 or die < 2:
+            return (0.0, die-1, 1.0)
+        expected = rolls / die
+        statistic = sum((observed-expected)**2 for observed in histogram) / expected
+        return (statistic, die-1, chisquarep(statistic, die-1))
+
+    # A character's average face on a die
+    def average(self, character, die):
+        count, total = self.characters[character][die]
+        return total / count
+
+    # How lucky a character has been, as a z-score: how many standard errors their faces are above what fair dice would give on average, across every die they rolled. Around 0 is normal, and beyond about 3 either way is remarkable.
+    def luck(self, character):
+        deviation = 0.0
+        variance = 0.0
+        for die, (count, total) in self.characters[character].items():
+            deviation += total - count*(die+1)/2
+            variance += count * (die*die-1) / 12
+        return deviation / math.sqrt(variance) if variance else 0.0
+
+    # The characters in order from luckiest to unluckiest, with their luck
+    def luckiest(self):
+        return sorted(((character, self.luck(character)) for character in self.characters), key=lambda pair: pair[1], reverse=True)
+
+    def report(self):
+        lines = ["{:<8}{:>14}{:>10}{:>14}{:>12}".format("die", "rolls", "mean", "chi-square", "p")]
+        for die in sorted(self.histograms):
+            histogram = self.histograms[die]
+            rolls = sum(histogram)
+            statistic, df, p = self.chisquare(die)
+            mean = sum(face*count for face, count in enumerate(histogram, 1)) / rolls if rolls else 0
+            lines.append("{:<8}{:>14,}{:>10.3f}{:>14.2f}{:>12.4g}".format("d{}".format(die), rolls, mean, statistic, p))
+        lines.append("")
+        lines.append("{:<30}{:>12}{:>10}".format("character", "rolls", "luck"))
+        for character, luck in self.luckiest():
+            rolls = sum(count for count, total in self.characters[character].values())
+            lines.append("{:<30}{:>12,}{:>+10.2f}".format(character or "(no character)", rolls, luck))
+        return "\n".join(lines)
+
+
+# Command line tool for auditing roll logs
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Audit DnDPy roll logs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="show fairness statistics and each character's luck").add_argument("log", nargs="+")
+    dump = subparsers.add_parser("dump", help="print every roll in a log")
+    dump.add_argument("log")
+    subparsers.add_parser("seeds", help="print every seed logged, to replay a session with").add_argument("log")
+    arguments = parser.parse_args(arguments)
+    if arguments.command == "stats":
+        stats = RollStats()
+        for path in arguments.log:
+            stats.replay(path)
+        print(stats.report())
+    elif arguments.command == "seeds":
+        seeds = []
+        for roll in replay(arguments.log, seeds):
+            pass
+        for name, seed in seeds:
+            print("{}: {}".format("session" if name is None else name or "-", seed))
+    else:
+        for roll in replay(arguments.log):
+            print("{} {} {} d{}{:+d}: {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(roll.timestamp / 1e9)), roll.character or "-", roll.skill, roll.die, roll.modifier, roll.face))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# Roster store that keeps any number of characters in a single SQLite file instead of one CSV file per character.
+# Characters are stored in their packed form (see Character.packed()), so loading one doesn't involve any parsing. The name, class, race and level columns are indexed so that a roster of thousands can be searched and listed without loading every character.
+# The existing charactersheet_<name>.csv files can be imported into a roster and exported back out again.
+
+import argparse
+import os
+import sqlite3
+
+from theprogram import Character, loadsheet, sheetpattern
+
+
+DEFAULTPATH = "roster.sqlite3"
+
+# Columns in the order that Character.packed() returns them
+COLUMNS = ("name", "pathname", "level", "setclass", "race", "background", "packedvalues", "proficient", "doubled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS characters (
+    pathname TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    setclass TEXT NOT NULL,
+    race TEXT NOT NULL,
+    background TEXT NOT NULL,
+    packedvalues BLOB NOT NULL,
+    proficient INTEGER NOT NULL,
+    doubled INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS characters_name ON characters (name);
+CREATE INDEX IF NOT EXISTS characters_setclass ON characters (setclass);
+CREATE INDEX IF NOT EXISTS characters_race ON characters (race);
+CREATE INDEX IF NOT EXISTS characters_level ON characters (level);
+"""
+
+# Filters that find() and listing() accept, mapped to the column they search
+FILTERS = {"name": "name", "setclass": "setclass", "race": "race", "level": "level", "background": "background"}
+
+
+# A roster of characters held in one SQLite file. Can be used as a context manager so that the file is closed afterwards.
+class Roster:
+    def __init__(self, path=DEFAULTPATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # Write-ahead logging lets readers carry on while a bulk insert is running
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM characters").fetchone()[0]
+
+    def __contains__(self, pathname):
+        return self.connection.execute("SELECT 1 FROM characters WHERE pathname = ?", (pathname,)).fetchone() is not None
+
+    def close(self):
+        self.connection.close()
+
+    # Adds a character to the roster, replacing any stored character with the same path name
+    def save(self, character):
+        self.saveall([character])
+
+    # Adds many characters in a single transaction. Any iterable of characters can be passed, including a generator.
+    def saveall(self, characters):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO characters ({}) VALUES ({})".format(", ".join(COLUMNS), ", ".join("?"*len(COLUMNS))), (character.packed() for character in characters))
+
+    # Returns the character with the given path name, or None if there isn't one
+    def load(self, pathname):
+        row = self.connection.execute("SELECT {} FROM characters WHERE pathname = ?".format(", ".join(COLUMNS)), (pathname,)).fetchone()
+        return Character.unpacked(*row) if row is not None else None
+
+    # Returns every character matching the filters, for example find(setclass="Bard", level=5). With no filters the whole roster is loaded.
+    def find(self, **filters):
+        return [Character.unpacked(*row) for row in self._select(COLUMNS, filters)]
+
+    # Same as find() but only returns the name, path name, level, class, race and background of each character, which is enough for a menu
+    def listing(self, **filters):
+        return self._select(COLUMNS[:6], filters).fetchall()
+
+    def delete(self, pathname):
+        with self.connection:
+            self.connection.execute("DELETE FROM characters WHERE pathname = ?", (pathname,))
+
+    def _select(self, columns, filters):
+        unknown = set(filters) - set(FILTERS)
+        if unknown:
+            raise ValueError("cannot filter on {}, expected some of {}".format(", ".join(sorted(unknown)), ", ".join(FILTERS)))
+        query = "SELECT {} FROM characters".format(", ".join(columns))
+        if filters:
+            query += " WHERE " + " AND ".join("{} = ?".format(FILTERS[key]) for key in filters)
+        return self.connection.execute(query + " ORDER BY name", tuple(filters.values()))
+
+    # Imports every charactersheet_<name>.csv file in a directory. Returns the path names of any sheets that were missing information and were skipped.
+    def importcsv(self, directory="."):
+        skipped = []
+        characters = []
+        for file in sorted(os.listdir(directory)):
+            if sheetpattern.match(file):
+                character = loadsheet(os.path.join(directory, file))
+                if character is None:
+                    skipped.append(file)
+                else:
+                    characters.append(character)
+        self.saveall(characters)
+        return skipped
+
+    # Writes a charactersheet_<name>.csv file for every character matching the filters into a directory
+    def exportcsv(self, directory=".", **filters):
+        count = 0
+        for character in self.find(**filters):
+            character.export(directory)
+            count += 1
+        return count
+
+
+# Command line tool for moving characters between CSV sheets and a roster file
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Import and export DnDPy character sheets to and from a roster file.")
+    parser.add_argument("--roster", default=DEFAULTPATH, help="roster file to use (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("import", help="import CSV sheets from a directory").add_argument("directory", nargs="?", default=".")
+    subparsers.add_parser("export", help="export the roster to CSV sheets in a directory").add_argument("directory", nargs="?", default=".")
+    subparsers.add_parser("list", help="list the characters in the roster")
+    arguments = parser.parse_args(arguments)
+    with Roster(arguments.roster) as roster:
+        if arguments.command == "import":
+            skipped = roster.importcsv(arguments.directory)
+            for file in skipped:
+                print("Skipped {}: missing required information.".format(file))
+            print("The roster now holds {} characters.".format(len(roster)))
+        elif arguments.command == "export":
+            print("Exported {} character sheets.".format(roster.exportcsv(arguments.directory)))
+        else:
+            for name, pathname, level, setclass, race, background in roster.listing():
+                print("{} | Level {} | {} | {} | {}".format(name, level, race, setclass, background))
+
+
+if __name__ == "__main__":
+    main()
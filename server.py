@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+
+# Multi-player session server. Any number of players can connect to one process over TCP, load characters, make checks and rolls, level up and view their sheets at the same time.
+# Loaded characters are kept in a cache that every session shares, so two players using the same character see the same sheet. Changes to a character are made one at a time behind a lock for that character, and are written out through an ExportJournal so that a busy game night doesn't rewrite the same sheet over and over.
+# Level ups ask the player for their choices with the same menus as the console program. They run in a pool of threads kept for level ups, so that everyone else carries on while one player is deciding. Reading sheets from disk also happens off the event loop.
+#
+#     python server.py serve      start a server for the character sheets in the current directory
+#     python server.py connect    connect to a running server
+#     python server.py play       start a server and connect to it in one go
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import dice
+import notation
+from journal import ExportJournal
+from rolllog import RollLog, RollStats
+from theprogram import MAXLEVEL, Character, MenuDecisions, SheetIndex, columns, numbered
+
+
+DEFAULTHOST = "127.0.0.1"
+DEFAULTPORT = 5151
+
+# Largest modifier, up or down, that a custom roll can add to each die
+MODIFIERLIMIT = 100
+
+# Seconds between the journal writing out changed sheets
+JOURNALINTERVAL = 5.0
+
+# Most level ups that can be waiting on their players at once. Each one holds a thread while the player decides, so they get a pool of their own rather than sharing asyncio's default one.
+LEVELUPTHREADS = 64
+
+# Most names remembered as having no sheet
+MISSINGLIMIT = 1024
+
+# Commands a player can send, with their descriptions
+COMMANDS = {"list": "list the characters that can be loaded", "load <name>": "load a character", "sheet": "view your character sheet", "check <stat>": "roll a d20 check for a stat, e.g. check animal handling", "roll <amount> <die> [modifier]": "roll some dice, e.g. roll 2 6 1", "roll <notation>": "roll dice notation, e.g. roll 4d6kh3 or roll 2d20kl1+5", "levelup": "level your character up", "reseed": "reset your luck", "luck": "show how fair the dice have been and who has been lucky", "who": "list who is playing", "help": "show this list", "quit": "leave the game"}
+
+
+# Characters shared between every session, loaded from the sheets in a directory the first time anyone asks for them
+# Names that have no sheet are remembered along with the directory's modification time, so asking for them again doesn't read the directory until a sheet has been added or changed.
+class CharacterCache:
+    def __init__(self, directory="."):
+        self.directory = directory
+        self.characters = {}
+        self.locks = {}
+        self.missing = {}
+
+    # Every sheet in the directory, through the sheet index
+    def sheets(self):
+        index = SheetIndex(self.directory)
+        sheets = index.sheets()
+        index.save()
+        return sheets
+
+    # Returns the character with the given name or path name if it has already been loaded, or None
+    def loaded(self, name):
+        wanted = name.lower()
+        for character in self.characters.values():
+            if wanted in (character.name.lower(), character.pathname.lower()):
+                return character
+        return None
+
+    # Reads the character with the given name or path name from its sheet, without adding it to the cache. Returns None if there isn't one or its sheet can't be read.
+    def find(self, name):
+        wanted = name.lower()
+        for sheet in self.sheets():
+            if sheet.name.lower() == wanted or sheet.filename.lower() == "charactersheet_{}.csv".format(wanted):
+                return sheet.character
+        return None
+
+    # Returns the character with the given name or path name, loading it if nobody has yet. Returns None if there isn't one or its sheet can't be read.
+    def get(self, name):
+        character = self.loaded(name)
+        if character is None:
+            character = self.find(name)
+            if character is not None:
+                self.characters[character.pathname] = character
+        return character
+
+    # Does the same as get() from the event loop, reading the sheets in a worker thread so other sessions aren't held up
+    async def fetch(self, name):
+        character = self.loaded(name)
+        if character is not None:
+            return character
+        wanted = name.lower()
+        if wanted in self.missing and self.missing[wanted] == self.stamp():
+            return None
+        character = await asyncio.to_thread(self.find, name)
+        # Taken after reading the sheets, as the sheet index does, since reading them can write the index into the directory
+        stamp = self.stamp()
+        # Another session may have loaded the same character while the sheets were being read, and everyone has to share one copy
+        loaded = self.loaded(name)
+        if loaded is not None:
+            return loaded
+        if character is not None:
+            self.characters[character.pathname] = character
+        elif stamp is not None:
+            # The name remembered longest is forgotten first
+            if len(self.missing) >= MISSINGLIMIT:
+                del self.missing[next(iter(self.missing))]
+            self.missing[wanted] = stamp
+        return character
+
+    # Modification time of the directory, which changes whenever a sheet is added, removed or rewritten. None if it can't be read.
+    def stamp(self):
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return None
+
+    # Lock that must be held while changing a character
+    def lock(self, character):
+        if character.pathname not in self.locks:
+            self.locks[character.pathname] = asyncio.Lock()
+        return self.locks[character.pathname]
+
+
+# Decisions provider that puts each choice to a connected player. It is called from the worker thread that a level up runs in, and waits there while the session asks the player.
+class RemoteDecisions(MenuDecisions):
+    def __init__(self, session, loop):
+        self.session = session
+        self.loop = loop
+
+    def number(self, kind, character, label=None):
+        return self._ask(self.prompts.get(kind, "").format(str(label).lower()), self.highest.get(kind))
+
+    def choose(self, kind, options, character):
+        return options[self._ask(self.menu(kind, options, character) + self.prompts.get(kind, ""), len(options)) - 1]
+
+    def _ask(self, text, count):
+        return asyncio.run_coroutine_threadsafe(self.session.select(text, count), self.loop).result()
+
+
+# One connected player
+class Session:
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.character = None
+        self.player = "{}:{}".format(*writer.get_extra_info("peername", ("local", 0))[:2])
+
+    async def send(self, text):
+        self.writer.write(text.encode("utf-8"))
+        await self.writer.drain()
+
+    # Reads the player's next line, raising ConnectionError if they have gone
+    async def readline(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("{} disconnected".format(self.player))
+        return line.decode("utf-8", "replace").strip()
+
+    # Sends a menu or prompt and returns the number the player selects, which must be between 1 and count (or any whole number of at least 1 if count is None)
+    async def select(self, text, count):
+        await self.send(text)
+        while True:
+            try:
+                selection = int(await self.readline())
+                if selection < 1 or count is not None and selection > count:
+                    raise ValueError
+                return selection
+            except ValueError:
+                await self.send("Invalid selection, try again.\n")
+
+    async def run(self):
+        await self.send("Welcome to Kate's Py&D. Type help for a list of commands.\n")
+        while True:
+            await self.send("> ")
+            words = (await self.readline()).split()
+            if not words:
+                continue
+            command = words[0].lower()
+            handler = getattr(self, "do_" + command, None)
+            if handler is None:
+                await self.send("Unknown command {}. Type help for a list of commands.\n".format(command))
+                continue
+            if await handler(words[1:]) is False:
+                return
+
+    # Returns the session's character, telling the player to load one first if there isn't one
+    async def loaded(self):
+        if self.character is None:
+            await self.send("Load a character first.\n")
+        return self.character
+
+    async def do_help(self, arguments):
+        await self.send("".join("{:<34}{}\n".format(command, description) for command, description in COMMANDS.items()))
+
+    async def do_list(self, arguments):
+        sheets = await asyncio.to_thread(self.server.cache.sheets)
+        if not sheets:
+            await self.send("There are no character sheets.\n")
+            return
+        await self.send("\n".join(columns(numbered([sheet.name for sheet in sheets]), False)) + "\n")
+
+    async def do_load(self, arguments):
+        if not arguments:
+            await self.send("Which character? Type list to see them.\n")
+            return
+        character = await self.server.cache.fetch(" ".join(arguments))
+        if character is None:
+            await self.send("There is no character sheet for {} that can be loaded.\n".format(" ".join(arguments)))
+            return
+        self.character = character
+        await self.send("Loaded {}, level {} {} {}.\n".format(character.name, character.level, character.race, character.setclass))
+
+    async def do_sheet(self, arguments):
+        if await self.loaded():
+            await self.send(self.character.rendersheet())
+
+    async def do_check(self, arguments):
+        if not await self.loaded():
+            return
+        wanted = " ".join(arguments).lower()
+        stat = next((stat for stat in Character.statnames if stat.lower() == wanted), None)
+        if stat is None:
+            await self.send("Unknown stat. Choose one of: {}.\n".format(", ".join(Character.statnames)))
+            return
+        modifier = self.character.stats[stat]
+        result = dice.rollbatch(1, 20, modifier, rng=dice.stream(self.character.name)).total(0)
+        self.server.record(self.character.name, stat, 20, modifier, [result-modifier])
+        await self.send("{} rolls {} ({:+d}): {}\n".format(self.character.name, stat.lower(), modifier, result))
+
+    async def do_roll(self, arguments):
+        if arguments and notation.isnotation(" ".join(arguments)):
+            await self.rollnotation(" ".join(arguments))
+            return
+        try:
+            amount, die = int(arguments[0]), int(arguments[1])
+            modifier = int(arguments[2]) if len(arguments) > 2 else 0
+        except (IndexError, ValueError):
+            await self.send("Usage: roll <amount> <die> [modifier]\n")
+            return
+        if die > 100 or die < 2 or abs(modifier) > MODIFIERLIMIT:
+            await self.send("Don't be ridiculous, try again.\n")
+            return
+        if amount < 1 or amount > 100:
+            await self.send("Don't be greedy. Try again.\n")
+            return
+        batch = dice.rollbatch(amount, die, modifier, rng=dice.stream(self.character.name) if self.character else None)
+        self.server.record(self.character.name if self.character else None, None, die, modifier, [result-modifier for result in batch.row(0)])
+        if amount == 1:
+            await self.send("Result: {}\n".format(batch.total(0)))
+        else:
+            await self.send("Results: {}\nTotal: {}\n".format(batch.row(0), batch.total(0)))
+
+    async def rollnotation(self, text):
+        try:
+            expression = notation.parse(text)
+        except ValueError as error:
+            await self.send("{}\n".format(str(error).capitalize()))
+            return
+        if expression.largestdie() > 100 or expression.smallestdie() < 2 or expression.dicecount() > 100:
+            await self.send("Don't be ridiculous, try again.\n")
+            return
+        name = self.character.name if self.character else None
+        total, faces = expression.rollonce(dice.stream(name) if name else None)
+        for die, rolled in faces:
+            self.server.record(name, None, die, 0, rolled)
+        await self.send("{}: {}\n".format(expression, total))
+
+    async def do_levelup(self, arguments):
+        character = await self.loaded()
+        if character is None:
+            return
+        lock = self.server.cache.lock(character)
+        if lock.locked():
+            await self.send("Someone else is changing {}, waiting for them to finish.\n".format(character.name))
+        async with lock:
+            # Checked once the lock is held, since another session may have levelled the character up while this one waited
+            if character.level >= MAXLEVEL:
+                await self.send("{} is already level {}, the highest level there is.\n".format(character.name, MAXLEVEL))
+                return
+            loop = asyncio.get_running_loop()
+            decisions = RemoteDecisions(self, loop)
+            # The choices are made on a copy, so other sessions never see a half levelled character and nothing changes if the player drops out at a prompt
+            levelled = character.copy()
+            await loop.run_in_executor(self.server.levelups, levelled.levelup, character.level+1, False, decisions)
+            character.restore(levelled.snapshot())
+            character.recalculate()
+            character.save(self.server.journal)
+        await self.send("{} is now level {}.\n".format(character.name, character.level))
+
+    async def do_reseed(self, arguments):
+        # Only the player's own character gets new dice, so nobody else's luck changes
+        character = await self.loaded()
+        if character is None:
+            return
+        dice.reseedstream(character.name)
+        await self.send("Your fortune has been refreshed. Good luck!\n")
+
+    async def do_luck(self, arguments):
+        if self.server.stats.count() == 0:
+            await self.send("No rolls have been made yet.\n")
+            return
+        await self.send(self.server.stats.report() + "\n")
+
+    async def do_who(self, arguments):
+        await self.send("".join("{} playing {}\n".format(session.player, session.character.name if session.character else "nobody yet") for session in self.server.sessions))
+
+    async def do_quit(self, arguments):
+        await self.send("Goodbye!\n")
+        return False
+
+
+# The server itself. Sheets are read from and written to directory. If a log path is given, every roll is written to a roll log there.
+# Statistics on every roll made since the server started are kept live for the luck command.
+class SessionServer:
+    def __init__(self, directory=".", interval=JOURNALINTERVAL, log=None):
+        self.cache = CharacterCache(directory)
+        self.journal = ExportJournal(directory, interval=interval)
+        self.sessions = set()
+        self.stats = RollStats()
+        self.log = RollLog(log, self.stats) if log is not None else None
+        self.levelups = ThreadPoolExecutor(LEVELUPTHREADS, thread_name_prefix="levelup")
+
+    async def handle(self, reader, writer):
+        session = Session(self, reader, writer)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+
+    # Starts listening and returns the asyncio server. The port can be 0 to pick any free port.
+    async def start(self, host=DEFAULTHOST, port=DEFAULTPORT):
+        return await asyncio.start_server(self.handle, host, port)
+
+    # Adds the faces rolled on some dice to the statistics, and to the roll log if there is one
+    def record(self, character, skill, die, modifier, faces):
+        if self.log is not None:
+            self.log.record(character, skill, die, modifier, faces)
+        else:
+            for face in faces:
+                self.stats.add(character or "", die, face)
+
+    # Writes out any changed sheets, closes the journal and roll log and lets the level up threads go
+    def close(self):
+        self.levelups.shutdown(wait=False)
+        self.journal.close()
+        if self.log is not None:
+            self.log.close()
+
+
+# Connects to a server and passes lines between it and the terminal until either side stops
+async def connect(host=DEFAULTHOST, port=DEFAULTPORT):
+    reader, writer = await asyncio.open_connection(host, port)
+    loop = asyncio.get_running_loop()
+    lines = asyncio.Queue()
+
+    # Standard input is read in a daemon thread, so that a prompt still waiting for a line never keeps the program open after the server has gone
+    def readinput():
+        for line in sys.stdin:
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+    threading.Thread(target=readinput, daemon=True).start()
+
+    async def output():
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            sys.stdout.write(data.decode("utf-8", "replace"))
+            sys.stdout.flush()
+
+    printing = asyncio.ensure_future(output())
+    try:
+        while True:
+            nextline = asyncio.ensure_future(lines.get())
+            await asyncio.wait([printing, nextline], return_when=asyncio.FIRST_COMPLETED)
+            if printing.done():
+                nextline.cancel()
+                return
+            line = nextline.result()
+            if line is None:
+                # Out of input, as when it is piped in: the server is told nothing more is coming and its replies are shown until it finishes
+                if writer.can_write_eof():
+                    writer.write_eof()
+                await printing
+                return
+            writer.write(line.encode("utf-8"))
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(host, port, directory, log=None):
+    server = SessionServer(directory, log=log)
+    listening = await server.start(host, port)
+    print("Serving character sheets from {} on {}:{}. Press ctrl+c to stop.".format(directory, host, port))
+    try:
+        async with listening:
+            await listening.serve_forever()
+    finally:
+        server.close()
+
+
+# Starts a server on a free local port and connects this terminal to it
+async def play(directory, log=None):
+    server = SessionServer(directory, log=log)
+    listening = await server.start(DEFAULTHOST, 0)
+    try:
+        await connect(DEFAULTHOST, listening.sockets[0].getsockname()[1])
+    finally:
+        listening.close()
+        server.close()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Play DnDPy with many players in one process.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, description in (("serve", "start a server"), ("connect", "connect to a server"), ("play", "start a server and connect to it")):
+        subparser = subparsers.add_parser(command, help=description)
+        if command != "play":
+            subparser.add_argument("--host", default=DEFAULTHOST, help="address to use (default: %(default)s)")
+            subparser.add_argument("--port", type=int, default=DEFAULTPORT, help="port to use (default: %(default)s)")
+        if command != "connect":
+            subparser.add_argument("--directory", default=".", help="directory holding the character sheets (default: the current directory)")
+            subparser.add_argument("--log", help="file to log every roll to")
+            subparser.add_argument("--seed", type=int, help="seed for the dice, such as one printed by python rolllog.py seeds, to replay a session's rolls")
+    arguments = parser.parse_args(arguments)
+    if getattr(arguments, "seed", None) is not None:
+        dice.reseed(arguments.seed)
+    # Setting DNDPY_PROFILE to a file name profiles the server's hot paths and saves the results there on exit
+    if os.environ.get("DNDPY_PROFILE"):
+        import profiling
+        profiling.fromenvironment()
+    try:
+        if arguments.command == "serve":
+            asyncio.run(serve(arguments.host, arguments.port, arguments.directory, arguments.log))
+        elif arguments.command == "connect":
+            asyncio.run(connect(arguments.host, arguments.port))
+        else:
+            asyncio.run(play(arguments.directory, arguments.log))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
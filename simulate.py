@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Monte Carlo simulator for skill checks. Rolls millions of d20 checks for any number of characters and stats across a pool of processes and reports how often each one meets a DC.
+# Work is split into fixed-size chunks and each chunk gets its own child of a single NumPy SeedSequence. This gives every chunk an independent random stream, and a given seed reproduces the same results however many workers are used.
+# This module needs NumPy.
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy
+
+import probability
+
+
+# Number of trials per check that are handed to a worker at a time
+CHUNKTRIALS = 1 << 20
+
+MODES = ("normal", "advantage", "disadvantage")
+
+
+# The outcome of simulating one stat check for one character
+class CheckResult:
+    def __init__(self, name, skill, modifier, dc, successes, trials, mode, confidence):
+        self.name = name
+        self.skill = skill
+        self.modifier = modifier
+        self.dc = dc
+        self.successes = successes
+        self.trials = trials
+        self.mode = mode
+        self.rate = successes / trials
+        self.interval = wilson(successes, trials, confidence)
+        self.expected = exactchance(modifier, dc, mode)
+
+    def __repr__(self):
+        return "{} {} ({:+d}) vs DC {}: {:.4%} [{:.4%}, {:.4%}]".format(self.name, self.skill, self.modifier, self.dc, self.rate, self.interval[0], self.interval[1])
+
+
+# Every result from a simulation run, along with how long it took
+class SimulationReport:
+    def __init__(self, results, elapsed, workers):
+        self.results = results
+        self.elapsed = elapsed
+        self.workers = workers
+        self.rolls = sum(result.trials for result in results)
+        self.throughput = self.rolls / elapsed if elapsed else float("inf")
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __repr__(self):
+        lines = [repr(result) for result in self.results]
+        lines.append("{:,} checks in {:.3f}s on {} worker(s): {:,.0f} checks/sec".format(self.rolls, self.elapsed, self.workers, self.throughput))
+        return "\n".join(lines)
+
+
+# Wilson score interval for a success rate, which behaves well even when the rate is close to 0 or 1
+def wilson(successes, trials, confidence=0.95):
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    rate = successes / trials
+    denominator = 1 + z*z/trials
+    centre = (rate + z*z/(2*trials)) / denominator
+    spread = z * math.sqrt(rate*(1-rate)/trials + z*z/(4*trials*trials)) / denominator
+    return (max(0.0, centre-spread), min(1.0, centre+spread))
+
+
+# Exact chance of the check succeeding, used to sanity check the simulated rate
+def exactchance(modifier, dc, mode="normal"):
+    chance = float(probability.distribution(1, 20, modifier).atleast(dc))
+    if mode == "advantage":
+        return 1 - (1-chance)**2
+    if mode == "disadvantage":
+        return chance**2
+    return chance
+
+
+# Rolls one chunk of checks for every modifier and returns how many of each met the DC. This runs inside the worker processes.
+def _simulatechunk(modifiers, dc, trials, mode, seedsequence):
+    rng = numpy.random.default_rng(seedsequence)
+    successes = []
+    for modifier in modifiers:
+        rolls = rng.integers(1, 21, size=trials, dtype=numpy.int8)
+        if mode == "advantage":
+            numpy.maximum(rolls, rng.integers(1, 21, size=trials, dtype=numpy.int8), out=rolls)
+        elif mode == "disadvantage":
+            numpy.minimum(rolls, rng.integers(1, 21, size=trials, dtype=numpy.int8), out=rolls)
+        # Comparing the die against dc - modifier avoids widening the int8 rolls to add the modifier
+        successes.append(int(numpy.count_nonzero(rolls >= dc-modifier)))
+    return successes
+
+
+# Simulates trials d20 checks for each pair of character and skill against the DC. mode can be "normal", "advantage" or "disadvantage".
+# Leaving workers blank uses one process per CPU; with one worker everything runs in this process.
+def simulatechecks(characters, skills, dc, trials=1000000, mode="normal", workers=None, seed=None, confidence=0.95):
+    if mode not in MODES:
+        raise ValueError("mode must be one of {}, got {!r}".format(", ".join(MODES), mode))
+    if trials < 1:
+        raise ValueError("trials must be at least 1, got {}".format(trials))
+    if not hasattr(characters, "__iter__"):
+        characters = [characters]
+    if isinstance(skills, str):
+        skills = [skills]
+    pairs = [(character, skill) for character in characters for skill in skills]
+    modifiers = [character.stats[skill] for character, skill in pairs]
+    chunks = [min(CHUNKTRIALS, trials-start) for start in range(0, trials, CHUNKTRIALS)]
+    seeds = numpy.random.SeedSequence(seed).spawn(len(chunks))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(chunks)))
+    started = time.perf_counter()
+    if workers == 1:
+        chunkresults = [_simulatechunk(modifiers, dc, size, mode, child) for size, child in zip(chunks, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_simulatechunk, modifiers, dc, size, mode, child) for size, child in zip(chunks, seeds)]
+            chunkresults = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    totals = [sum(column) for column in zip(*chunkresults)]
+    results = []
+    for (character, skill), modifier, successes in zip(pairs, modifiers, totals):
+        results.append(CheckResult(character.name, skill, modifier, dc, successes, trials, mode, confidence))
+    return SimulationReport(results, elapsed, workers)
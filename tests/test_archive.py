@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import archive
+import builder
+from theprogram import Character
+
+
+@pytest.fixture(scope="module")
+def characters():
+    return list(builder.generate(20, seed=3))
+
+
+# Enough copies of the characters to fill more than one chunk of records, followed by one whose name is too long to store
+def overlong(characters):
+    many = [characters[index % len(characters)].copy() for index in range(archive.CHUNKRECORDS+4)]
+    many.append(Character("x"*(archive.NAMESIZE+1)))
+    return many
+
+
+def test_failed_extend_leaves_the_archive_as_it_was(tmp_path, characters):
+    path = archive.create(str(tmp_path / "characters.archive"), characters)
+    size = os.path.getsize(path)
+    with archive.Archive(path, writable=True) as records:
+        with pytest.raises(ValueError):
+            records.extend(overlong(characters))
+        assert len(records) == len(characters)
+        assert records[-1].packed() == characters[-1].packed()
+    assert os.path.getsize(path) == size
+
+
+def test_failed_create_leaves_no_archive(tmp_path, characters):
+    path = str(tmp_path / "characters.archive")
+    with pytest.raises(ValueError):
+        archive.create(path, overlong(characters))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_import_skips_names_too_long_to_store(tmp_path, characters, capsys):
+    for character in characters[:3]:
+        character.export(str(tmp_path))
+    builder.build("y"*(archive.NAMESIZE+1), builder.RandomDecisions(1)).export(str(tmp_path))
+    path = str(tmp_path / "characters.archive")
+    archive.main(["--archive", path, "import", str(tmp_path)])
+    assert "Skipped" in capsys.readouterr().out
+    with archive.Archive(path) as records:
+        assert len(records) == 3
@@ -0,0 +1,80 @@
+import io
+
+import pytest
+
+import builder
+from theprogram import MAXLEVEL, OPTIONS, RACEBUFFS, RACEINDEX, Character, MenuDecisions, characteroptions, scripted
+
+
+# Sets a character up through the menus, answering the prompts from lines
+def setupscripted(lines):
+    character = Character("Bob")
+    output = io.StringIO()
+    with scripted("\n".join(lines) + "\n", output):
+        character.setup(MenuDecisions(), autoexport=False)
+    return character, output.getvalue()
+
+
+def test_large_raw_score_is_asked_for_again():
+    character, output = setupscripted(["1", "1", "1", "1", "1", "200", "15", "14", "13", "12", "10", "8", "1", "1", "1", "1"])
+    assert "Invalid input, try again." in output
+    # The race's bonuses are added on top of the raw scores that were entered
+    assert list(character.scores.values()) == [score + buff for score, buff in zip([15, 14, 13, 12, 10, 8], RACEBUFFS[RACEINDEX[character.race]])]
+
+
+def test_large_level_is_asked_for_again():
+    character, output = setupscripted(["500", "3", "1", "1", "1", "1", "15", "14", "13", "12", "10", "8", "1", "1", "1", "1"])
+    assert "Invalid input, try again." in output
+    assert character.level == 3
+
+
+def test_out_of_range_score_raises_value_error():
+    character = Character("Bob")
+    with pytest.raises(ValueError):
+        character.scores["Strength"] = 200
+
+
+# Answers the ability score method menu and the prompts after it from lines, returning the raw scores chosen
+def rawscoresscripted(lines):
+    output = io.StringIO()
+    with scripted("\n".join(lines) + "\n", output):
+        return MenuDecisions().rawscores(Character("Bob")), output.getvalue()
+
+
+def test_standard_array_is_placed_by_the_player():
+    # Puts the lowest value left in each ability, so the array goes in backwards
+    rawscores, output = rawscoresscripted(["4", "6", "5", "4", "3", "2"])
+    assert rawscores == [8, 10, 12, 13, 14, 15]
+
+
+def test_point_buy_is_spent_by_the_player():
+    # 15, 15 and 15 cost 27 points, leaving only 8s for the rest
+    rawscores, output = rawscoresscripted(["3", "8", "8", "8", "1", "1", "1"])
+    assert rawscores == [15, 15, 15, 8, 8, 8]
+    assert "You have 0 points left." in output
+
+
+def test_levelup_past_the_highest_level_is_refused():
+    character = builder.build("Tess", builder.RandomDecisions(7, level=MAXLEVEL))
+    before = character.packed()
+    with pytest.raises(ValueError):
+        character.levelup(MAXLEVEL+1, False, builder.RandomDecisions(7))
+    assert character.packed() == before
+    output = io.StringIO()
+    with scripted("2\n", output):
+        assert characteroptions(character) == OPTIONS
+    assert "already level {}".format(MAXLEVEL) in output.getvalue()
+    assert character.packed() == before
+
+
+def test_levelup_is_rolled_back_when_saving_fails(monkeypatch):
+    character = builder.build("Tess", builder.RandomDecisions(7, level=3))
+    before = character.packed()
+
+    def fail(self, journal=None):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Character, "save", fail)
+    with pytest.raises(OSError):
+        character.levelup(4, True, builder.RandomDecisions(7))
+    assert character.packed() == before
@@ -0,0 +1,81 @@
+import pytest
+
+import builder
+import theprogram
+from theprogram import KNOWLEDGENAMES, KNOWLEDGESKILLS, NATURENAMES, NATURESKILLS, SKILLNAMES, SKILLS, STATBITS, Character, CLASSEVENTTABLE, MenuDecisions
+
+
+# Levels with class events before they were driven by the feature tables
+BRANCHINGCLASSEVENTS = {"Bard": [3, 10], "Cleric": [1], "Fighter": [6, 14], "Rogue": [1, 6, 10, 15]}
+
+
+# classevent() as it was written before the feature tables, kept to check the tables make exactly the same choices
+def branchingclassevent(self, level, decisions=None):
+    if decisions is None:
+        decisions = MenuDecisions()
+    cl = self.setclass
+    if cl == "Bard":
+        if level == 3:
+            college = decisions.choose("college", ["College of Lore", "College of Valor"], self)
+            if college == "College of Lore":
+                for x in range(1, 4):
+                    if not self.gainproficiency(decisions, "loreproficiency", SKILLNAMES, SKILLS):
+                        break
+            for x in range(1, 3):
+                self.gainexpertise(decisions)
+        if level == 10:
+            for x in range(1, 3):
+                self.gainexpertise(decisions)
+    if cl == "Cleric" and level == 1:
+        domains = ["Knowledge", "Life", "Light", "Nature", "Tempest", "Trickery", "War"]
+        domain = decisions.choose("domain", domains, self)
+        if domain == "Knowledge":
+            for x in range(1, 3):
+                choice = self.gainproficiency(decisions, "domainproficiency", KNOWLEDGENAMES, KNOWLEDGESKILLS)
+                if not choice:
+                    break
+                self.addproficiencies(STATBITS[choice], True)
+        if domain == "Nature":
+            self.gainproficiency(decisions, "domainproficiency", NATURENAMES, NATURESKILLS)
+    if cl == "Fighter" and level == 6 or cl == "Fighter" and level == 14:
+        self.increasescores(decisions)
+    if cl == "Rogue":
+        if level == 1:
+            choice = decisions.choose("rogueoption", ["Thieves tools proficiency +1", "Gain expertise in two proficiencies"], self)
+            if choice == "Gain expertise in two proficiencies":
+                for x in range(1, 3):
+                    self.gainexpertise(decisions)
+        if level == 6 and self._doubled:
+            for x in range(1, 3):
+                self.gainexpertise(decisions)
+        if level == 10:
+            self.increasescores(decisions)
+        if level == 15 and not self._proficient & STATBITS["Wisdom"]:
+            self.addproficiencies(STATBITS["Wisdom"])
+
+
+# Makes every choice at random from a seed, except for a fixed class and level
+class ClassDecisions(builder.RandomDecisions):
+    def __init__(self, seed, setclass, level):
+        super().__init__(seed, level)
+        self.setclass = setclass
+
+    def choose(self, kind, options, character):
+        if kind == "class":
+            return self.setclass
+        return super().choose(kind, options, character)
+
+
+def test_feature_tables_cover_the_same_levels():
+    assert {key for key in CLASSEVENTTABLE} == {(setclass, level) for setclass, levels in BRANCHINGCLASSEVENTS.items() for level in levels}
+
+
+@pytest.mark.parametrize("setclass", list(Character.classbuffs))
+def test_seeded_builds_match_the_branching_classevent(setclass, monkeypatch):
+    for level in range(1, 21):
+        for seed in range(4):
+            built = builder.build("Tess", ClassDecisions(seed, setclass, level))
+            with monkeypatch.context() as patched:
+                patched.setattr(theprogram.Character, "classevent", branchingclassevent)
+                expected = builder.build("Tess", ClassDecisions(seed, setclass, level))
+            assert built.packed() == expected.packed(), (setclass, level, seed)
@@ -0,0 +1,39 @@
+import os
+import stat
+
+import builder
+import journal
+
+
+def test_durable_flush_syncs_sheets_before_emptying_the_journal(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    journalpath = os.path.join(directory, journal.JOURNALNAME)
+    events = []
+    fsync = os.fsync
+    replace = os.replace
+
+    # Notes whether each sync was of a file or the directory, and how much of the journal was left at the time
+    def recordfsync(descriptor):
+        kind = "directory" if stat.S_ISDIR(os.fstat(descriptor).st_mode) else "file"
+        events.append((kind, os.path.getsize(journalpath) if os.path.exists(journalpath) else 0))
+        fsync(descriptor)
+
+    def recordreplace(source, destination):
+        events.append(("replace", os.path.basename(destination)))
+        replace(source, destination)
+
+    monkeypatch.setattr(journal.os, "fsync", recordfsync)
+    monkeypatch.setattr(journal.os, "replace", recordreplace)
+    character = builder.build("Tess", builder.RandomDecisions(7, level=3))
+    with journal.ExportJournal(directory, durable=True) as sheets:
+        sheets.record(character)
+        del events[:]
+        sheets.flush()
+        after = os.path.getsize(journalpath)
+    kinds = [event[0] for event in events]
+    # The sheet is synced before it is renamed into place, and the directory after
+    assert kinds == ["file", "replace", "directory"]
+    assert events[1] == ("replace", "charactersheet_Tess.csv")
+    # The journal still held the entry when the directory was synced, and was only emptied afterwards
+    assert events[2][1] > 0
+    assert after == 0
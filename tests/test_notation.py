@@ -0,0 +1,36 @@
+import io
+
+import pytest
+
+import notation
+from theprogram import roll, scripted
+
+
+@pytest.mark.parametrize("text", ["d20", "4d6kh3", "2d20kl1+5", " 1d8 - 1 ", "d%"])
+def test_dice_expressions_are_notation(text):
+    assert notation.isnotation(text)
+
+
+@pytest.mark.parametrize("text", ["20", "-5", "+5", "5+3", "2d", "d", "1 6 -3", ""])
+def test_numbers_and_broken_expressions_are_not_notation(text):
+    assert not notation.isnotation(text)
+
+
+# Answers the custom roll prompts from lines, returning what was printed
+def customroll(lines):
+    output = io.StringIO()
+    with scripted("\n".join(lines) + "\n", output):
+        roll()
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("text", ["-5", "1", "d1", "2d1+3"])
+def test_custom_roll_refuses_dice_smaller_than_a_d2(text):
+    output = customroll([text, "6", "", ""])
+    assert "Don't be ridiculous, try again." in output
+    assert "Result:" in output
+
+
+def test_custom_roll_accepts_notation():
+    output = customroll(["2d6+1", ""])
+    assert "2d6+1:" in output
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+import dice
+from rolllog import RollLog, replay
+from server import SessionServer
+
+
+def test_out_of_range_modifier_is_refused_by_the_log(tmp_path):
+    with RollLog(str(tmp_path / "rolls.log")) as log:
+        with pytest.raises(ValueError):
+            log.record("Tess", None, 6, 100000, [3])
+        log.record("Tess", None, 6, 2, [3])
+    assert [roll.modifier for roll in replay(str(tmp_path / "rolls.log"))] == [2]
+
+
+def test_out_of_range_modifier_is_refused_by_the_server(tmp_path):
+    async def run():
+        server = SessionServer(str(tmp_path), log=str(tmp_path / "rolls.log"))
+        listening = await server.start("127.0.0.1", 0)
+        port = listening.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"roll 1 6 100000\nroll 1 6 1\nquit\n")
+        await writer.drain()
+        output = (await reader.read()).decode("utf-8")
+        writer.close()
+        listening.close()
+        await listening.wait_closed()
+        server.journal.close()
+        server.log.close()
+        return output
+
+    output = asyncio.run(run())
+    assert "Don't be ridiculous" in output
+    # The session carries on after refusing the roll
+    assert "Result:" in output and "Goodbye!" in output
+
+
+def test_seeds_are_logged_and_replay_the_dice(tmp_path):
+    path = str(tmp_path / "rolls.log")
+    dice.reseed()
+    with RollLog(path) as log:
+        faces = [dice.stream("Tess").randint(1, 20) for roll in range(10)]
+        log.record("Tess", None, 20, 0, faces)
+        dice.reseedstream("Tess", 1234)
+        log.record("Tess", None, 20, 0, [dice.stream("Tess").randint(1, 20)])
+    seeds = []
+    assert len(list(replay(path, seeds))) == 11
+    session = seeds[0]
+    assert session[0] is None and session[1] == dice.sessionseed()
+    assert seeds[-1] == ("Tess", 1234)
+    # Reseeding with the logged seed rolls the same dice again
+    dice.reseed(session[1])
+    assert [dice.stream("Tess").randint(1, 20) for roll in range(10)] == faces
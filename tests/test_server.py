@@ -0,0 +1,101 @@
+import asyncio
+import threading
+
+import pytest
+
+import builder
+from server import CharacterCache, SessionServer
+
+
+# Decisions provider that gives up at the first choice, as a player dropping out at a prompt does
+class Abandon:
+    def number(self, kind, character, label=None):
+        raise ConnectionError("gone")
+
+    def choose(self, kind, options, character):
+        raise ConnectionError("gone")
+
+
+def test_levelup_is_rolled_back_when_a_choice_fails():
+    character = builder.build("Tess", builder.RandomDecisions(7, level=3))
+    before = character.packed()
+    # Level 4 brings an ability score improvement, so the level up has to ask for a choice
+    with pytest.raises(ConnectionError):
+        character.levelup(4, False, Abandon())
+    assert character.packed() == before
+
+
+def test_disconnecting_during_a_remote_levelup_leaves_the_shared_character_alone(tmp_path):
+    builder.build("Tess", builder.RandomDecisions(7, level=3)).export(str(tmp_path))
+
+    async def run():
+        server = SessionServer(str(tmp_path))
+        listening = await server.start("127.0.0.1", 0)
+        port = listening.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"load Tess\nlevelup\n")
+        await writer.drain()
+        # Waits for the first improvement prompt, then hangs up
+        await reader.readuntil(b"increase by 1 point")
+        # The level up waits for the player in a thread of the server's own pool, not one of asyncio's shared workers
+        waiting = [thread.name for thread in threading.enumerate() if thread.name.startswith("levelup")]
+        writer.close()
+        await asyncio.sleep(0.2)
+        character = server.cache.get("Tess")
+        pending = len(server.journal)
+        listening.close()
+        await listening.wait_closed()
+        server.close()
+        return character, pending, waiting
+
+    character, pending, waiting = asyncio.run(run())
+    assert character.level == 3
+    assert pending == 0
+    assert waiting
+
+
+def test_levelup_past_the_highest_level_is_refused_by_the_server(tmp_path):
+    builder.build("Tess", builder.RandomDecisions(7, level=20)).export(str(tmp_path))
+
+    async def run():
+        server = SessionServer(str(tmp_path))
+        listening = await server.start("127.0.0.1", 0)
+        port = listening.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"load Tess\nlevelup\nquit\n")
+        await writer.drain()
+        output = (await reader.read()).decode("utf-8")
+        writer.close()
+        level = server.cache.get("Tess").level
+        listening.close()
+        await listening.wait_closed()
+        server.journal.close()
+        return output, level
+
+    output, level = asyncio.run(run())
+    assert "already level 20" in output
+    assert level == 20
+
+
+def test_missing_names_are_not_looked_up_again_until_the_directory_changes(tmp_path, monkeypatch):
+    cache = CharacterCache(str(tmp_path))
+    lookups = []
+    find = CharacterCache.find
+
+    def counted(self, name):
+        lookups.append(name)
+        return find(self, name)
+
+    monkeypatch.setattr(CharacterCache, "find", counted)
+
+    async def run():
+        first = await cache.fetch("Nobody")
+        second = await cache.fetch("nobody")
+        builder.build("Nobody", builder.RandomDecisions(7, level=3)).export(str(tmp_path))
+        third = await cache.fetch("Nobody")
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first is None and second is None
+    assert third is not None and third.name == "Nobody"
+    assert lookups == ["Nobody", "Nobody"]
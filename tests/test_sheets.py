@@ -0,0 +1,75 @@
+import csv
+import io
+
+import pytest
+
+import builder
+from theprogram import csvkeys, loadsheet, readsheets
+
+
+# A sheet as earlier versions exported it, with the scores, stats and proficiencies written as Python dictionaries. quote picks the quotes used around the names, since hand edited sheets sometimes use double quotes.
+def legacyrow(character, quote="'"):
+    def literal(value):
+        text = repr(value)
+        return text.replace("'", quote) if quote != "'" else text
+    proficiencies = {"proficiencies": list(character.proficiencies["proficiencies"]), "doubled": list(character.proficiencies["doubled"])}
+    return {"Name": character.name, "Path Name": character.pathname, "Level": character.level, "Class": character.setclass, "Race": character.race, "Background": character.background, "Ability scores": literal(dict(character.scores)), "Stats": literal(dict(character.stats)), "Proficiencies": literal(proficiencies)}
+
+
+def writelegacy(path, character, quote="'"):
+    with open(path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(csvkeys))
+        writer.writeheader()
+        writer.writerow(legacyrow(character, quote))
+
+
+@pytest.fixture(scope="module")
+def characters():
+    characters = list(builder.generate(12, seed=8))
+    for character in characters:
+        character.recalculate()
+    return characters
+
+
+@pytest.mark.parametrize("quote", ["'", '"'])
+def test_legacy_sheet_loads_with_every_field(tmp_path, characters, quote):
+    for character in characters:
+        path = str(tmp_path / "charactersheet_{}.csv".format(character.pathname))
+        writelegacy(path, character, quote)
+        loaded = loadsheet(path)
+        assert loaded.packed() == character.packed()
+        assert loaded.proficiencies == character.proficiencies
+
+
+def test_legacy_sheet_round_trips_through_the_current_format(tmp_path, characters):
+    character = characters[0]
+    path = str(tmp_path / "charactersheet_{}.csv".format(character.pathname))
+    writelegacy(path, character)
+    loadsheet(path).export(str(tmp_path))
+    with open(path) as file:
+        assert "{" not in file.read()
+    assert loadsheet(path).packed() == character.packed()
+
+
+def test_legacy_rows_read_in_bulk(characters):
+    stream = io.StringIO()
+    writer = csv.DictWriter(stream, fieldnames=list(csvkeys))
+    writer.writeheader()
+    for character in characters:
+        writer.writerow(legacyrow(character))
+    stream.seek(0)
+    assert [loaded.packed() for loaded in readsheets(stream)] == [character.packed() for character in characters]
+
+
+def test_stats_missing_from_very_old_sheets_read_as_zero(tmp_path, characters):
+    character = characters[0]
+    row = legacyrow(character)
+    stats = dict(character.stats)
+    del stats["Intelligence"]
+    row["Stats"] = repr(stats)
+    path = str(tmp_path / "charactersheet_{}.csv".format(character.pathname))
+    with open(path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(csvkeys))
+        writer.writeheader()
+        writer.writerow(row)
+    assert loadsheet(path).stats["Intelligence"] == 0
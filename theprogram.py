@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 
-import csv
+# csv, json, ast, re and the journal module are imported by the functions that use them rather than here, so that importing this module as a library stays quick. See benchmarks/importtime.py.
+import contextlib
+import functools
 import math
 import os
-import re
-import ast
-import random
+import sys
+import operator
+from array import array
+from collections.abc import Mapping, MutableMapping
+from types import MappingProxyType
+
+import dice
 
 
 # Defines a custom error that can be raised to give more information on why a user input failed
@@ -13,23 +19,149 @@ class CustomExcept(Exception):
     pass
     
 
+# Dictionary-style view over a run of a character's packed values, such as the six ability scores or the calculated stats. Reading and writing goes straight to the character's array, so code that treats character.scores or character.stats as a dictionary keeps working.
+class ValueView(MutableMapping):
+    __slots__ = ("character", "names", "index", "offset", "tracked")
+
+    def __init__(self, character, names, index, offset, tracked):
+        self.character = character
+        self.names = names
+        self.index = index
+        self.offset = offset
+        self.tracked = tracked
+
+    def __getitem__(self, name):
+        return self.character._values[self.offset+self.index[name]]
+
+    def __setitem__(self, name, value):
+        position = self.index[name]
+        values = self.character._values
+        # Changing an ability score is recorded so that the stats calculated from it can be brought up to date
+        if self.tracked and values[self.offset+position] != value:
+            self.character._changedscores |= 1 << position
+        try:
+            values[self.offset+position] = value
+        except OverflowError:
+            raise ValueError("{} must be between -128 and 127, got {}".format(name, value)) from None
+
+    def __delitem__(self, name):
+        raise TypeError("{} can't be removed from a character".format(name))
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def copy(self):
+        return dict(self.items())
+
+
+# List-style view over one of a character's proficiency bitmasks. Each bit stands for one stat, in the order of Character.statnames, so checking or adding a proficiency is a single bit operation.
+class ProficiencyView:
+    __slots__ = ("character", "attribute")
+    __hash__ = None
+
+    def __init__(self, character, attribute):
+        self.character = character
+        self.attribute = attribute
+
+    def mask(self):
+        return getattr(self.character, self.attribute)
+
+    def __contains__(self, item):
+        position = Character.statindex.get(item)
+        return position is not None and self.mask() >> position & 1 == 1
+
+    def __iter__(self):
+        mask = self.mask()
+        return iter([name for position, name in enumerate(Character.statnames) if mask >> position & 1])
+
+    def __len__(self):
+        return bin(self.mask()).count("1")
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    # Sets or clears the bits for the given stats, recording them as changed so that recalculate() picks them up
+    def _update(self, bits, add):
+        mask = self.mask()
+        setattr(self.character, self.attribute, mask | bits if add else mask & ~bits)
+        self.character._changedstats |= bits
+
+    def append(self, item):
+        self._update(1 << Character.statindex[item], True)
+
+    def extend(self, items):
+        self._update(Character.statmask(items), True)
+
+    def remove(self, item):
+        if item not in self:
+            raise ValueError("{!r} is not in the list".format(item))
+        self._update(1 << Character.statindex[item], False)
+
+    def clear(self):
+        self._update(self.mask(), False)
+
+
+# Dictionary-style view holding a character's "proficiencies" and "doubled" (expertise) lists
+class ProficienciesView(Mapping):
+    __slots__ = ("character",)
+    attributes = {"proficiencies": "_proficient", "doubled": "_doubled"}
+
+    def __init__(self, character):
+        self.character = character
+
+    def __getitem__(self, key):
+        return ProficiencyView(self.character, self.attributes[key])
+
+    def __setitem__(self, key, items):
+        view = self[key]
+        view.clear()
+        view.extend(items)
+
+    def __iter__(self):
+        return iter(self.attributes)
+
+    def __len__(self):
+        return len(self.attributes)
+
+    def __repr__(self):
+        return repr({key: list(self[key]) for key in self.attributes})
+
+
 # Defines a character class. Each character that is created will be part of this class, with each part of the character sheet as a variable
 class Character:
-    name = ""
-    level = 0
-    race = ""
-    setclass = ""
-    background = ""
-    # Variable for a path-friendly version of the character name
-    pathname = ""
-    # Variable for selected ability score proficiencies
-    proficiencies = {"proficiencies": [], "doubled": []}
+    # Characters are kept compact so that large rosters fit in memory: the scores and stats are packed into one small integer array, and the proficiencies and expertise are bitmasks over the stats.
+    __slots__ = ("name", "pathname", "level", "race", "setclass", "background", "_values", "_proficient", "_doubled", "_changedscores", "_changedstats", "calculatedmodifier", "calculatedclass", "_rendered")
     
-    # Variable for raw ability scores
-    scores = {"Strength": 0, "Dexterity": 0, "Constitution": 0, "Intelligence": 0, "Wisdom": 0, "Charisma": 0}
+    # Names of the raw ability scores, in the order they are asked for and displayed
+    abilities = ["Strength", "Dexterity", "Constitution", "Intelligence", "Wisdom", "Charisma"]
     
-    # Variable for calculated skill stats
-    stats = {'Strength': 0, 'Dexterity': 0, 'Constitution': 0, 'Wisdom': 0, 'Charisma': 0, 'Acrobatics': 0, 'Animal handling': 0, 'Arcana': 0, 'Athletics': 0, 'Deception': 0, 'History': 0, 'Insight': 0, 'Intimidation': 0, 'Investigation': 0, 'Medicine': 0, 'Nature': 0, 'Perception': 0, 'Performance': 0, 'Persuasion': 0, 'Religion': 0, 'Sleight of hand': 0, 'Stealth': 0, 'Survival': 0}
+    # Names of the calculated skill stats, in the order they are displayed. The first five are saving throws. The Intelligence saving throw comes last, after the skills, where it has always been added when the stats are calculated.
+    statnames = ['Strength', 'Dexterity', 'Constitution', 'Wisdom', 'Charisma', 'Acrobatics', 'Animal handling', 'Arcana', 'Athletics', 'Deception', 'History', 'Insight', 'Intimidation', 'Investigation', 'Medicine', 'Nature', 'Perception', 'Performance', 'Persuasion', 'Religion', 'Sleight of hand', 'Stealth', 'Survival', 'Intelligence']
+
+    # The first five stats are the saving throws that class throw proficiencies apply to
+    savingthrows = statnames[:5]
+
+    # Position of each ability score and stat in the packed arrays and bitmasks
+    abilityindex = {name: index for index, name in enumerate(abilities)}
+    statindex = {name: index for index, name in enumerate(statnames)}
     
     # Universal variable to determine skill buffs based on race
     racebuffs = {'Mountain dwarf': {'Strength': 2}, 'Dragonborn': {'Strength': 2, 'Charisma': 1}, 'Half-orc': {'Strength': 2, 'Constitution': 1}, 'Human': {'Strength': 1, 'Dexterity': 1, 'Constitution': 1, 'Intelligence': 1, 'Wisdom': 1, 'Charisma': 1}, 'Elf': {'Dexterity': 2}, 'Halfling': {'Dexterity': 2}, 'Forest gnome': {'Dexterity': 1}, 'Dwarf': {'Constitution': 2}, 'Stout halfling': {'Constitution': 1}, 'Rock gnome': {'Constitution': 1}, 'High elf': {'Intelligence': 1, 'Charisma': 2}, 'Gnome': {'Intelligence': 2}, 'Tiefling': {'Intelligence': 1, 'Charisma': 2}, 'Hill dwarf': {'Wisdom': 1}, 'Wood elf': {'Wisdom': 1}, 'Drow': {'Charisma': 1}, 'Lightfoot halfling': {'Charisma': 1}}
@@ -37,8 +169,32 @@ class Character:
     # Universal variable to determine skill and saving throw buffs based on class
     classbuffs = {'Barbarian': {'throws': ['Strength', 'Constitution'], 'howmany': 2, 'skills': ['Animal handling', 'Athletics', 'Intimidation', 'Nature', 'Perception', 'Survival']}, 'Bard': {'throws': ['Dexterity', 'Charisma'], 'howmany': 3, 'skills': ["Strength", "Athletics", "Dexterity", "Acrobatics", "Sleight of hand", "Stealth", "Intelligence", "Arcana", "History", "Investigation", "Nature", "Religion", "Wisdom", "Animal handling", "Insight", "Medicine", "Perception", "Survival", "Charisma", "Deception", "Intimidation", "Performance", "Persuasion"]}, 'Cleric': {'throws': ['Wisdom', 'Charisma'], 'howmany': 2, 'skills': ['History', 'Insight', 'Medicine', 'Persuasion', 'Religion']}, 'Druid': {'throws': ['Intelligence', 'Wisdom'], 'howmany': 2, 'skills': ['Arcana', 'Animal handling', 'Insight', 'Medicine', 'Nature', 'Perception', 'Religion', 'Survival']}, 'Fighter': {'throws': ['Strength', 'Constitution'], 'howmany': 2, 'skills': ['Acrobatics', 'Animal handling', 'Athletics', 'History', 'Insight', 'Intimidation', 'Perception', 'Survival']}, 'Monk': {'throws': ['Strength', 'Dexterity'], 'howmany': 2, 'skills': ['Acrobatics', 'Athletics', 'History', 'Insight', 'Religion', 'Stealth']}, 'Paladin': {'throws': ['Wisdom', 'Charisma'], 'howmany': 2, 'skills': ['Athletics', 'Insight', 'Intimidation', 'Medicine', 'Persuasion', 'Religion']}, 'Ranger': {'throws': ['Strength', 'Dexterity'], 'howmany': 3, 'skills': ['Animal handling', 'Athletics', 'Insight', 'Investigation', 'Nature', 'Perception', 'Stealth', 'Survival']}, 'Rogue': {'throws': ['Dexterity', 'Intelligence'], 'howmany': 4, 'skills': ['Acrobatics', 'Athletics', 'Deception', 'Insight', 'Intimidation', 'Investigation', 'Perception', 'Performance', 'Persuasion', 'Sleight of hand', 'Stealth']}, 'Sorcerer': {'throws': ['Constitution', 'Charisma'], 'howmany': 2, 'skills': ['Arcana', 'Deception', 'Insight', 'Intimidation', 'Persuasion', 'Religion']}, 'Warlock': {'throws': ['Wisdom', 'Charisma'], 'howmany': 2, 'skills': ['Arcana', 'Deception', 'History', 'Intimidation', 'Investigation', 'Nature', 'Religion']}, 'Wizard': {'throws': ['Intelligence', 'Wisdom'], 'howmany': 2, 'skills': ['Arcana', 'History', 'Insight', 'Investigation', 'Medicine', 'Religion']}}
 
+    # Universal variable for class and subclass features, by class and then by the level they are gained at. Each feature is a dictionary naming what it does:
+    #     "increase" is an ability score improvement
+    #     "proficiency" picks count new proficiencies of the given kind out of options (any skill if no options are given), with their modifier doubled if doubled is True
+    #     "expertise" picks count proficiencies to gain expertise in. With ifexpertise set, it only happens if the character already has expertise.
+    #     "grant" gives the listed proficiencies
+    #     "choice" asks for one of the keys of options, then applies the features listed under the chosen option
+    # The features are compiled into a dispatch table when the program starts (see CLASSEVENTTABLE), so a new class or subclass only needs an entry here.
+    classfeatures = {
+        'Bard': {
+            # Bards choose their college at level 3, and the College of Lore gains 3 proficiencies. Level 3 Bards also choose 2 proficiencies to gain expertise in, and 2 more at level 10.
+            3: [{"feature": "choice", "kind": "college", "options": {"College of Lore": [{"feature": "proficiency", "kind": "loreproficiency", "count": 3}], "College of Valor": []}}, {"feature": "expertise", "count": 2}],
+            10: [{"feature": "expertise", "count": 2}]},
+        'Cleric': {
+            # At level 1, Clerics join a domain. Knowledge clerics gain two proficiencies with their proficiency multiplier doubled, and Nature clerics gain one.
+            1: [{"feature": "choice", "kind": "domain", "options": {"Knowledge": [{"feature": "proficiency", "kind": "domainproficiency", "options": ["Arcana", "Nature", "History", "Religion"], "count": 2, "doubled": True}], "Life": [], "Light": [], "Nature": [{"feature": "proficiency", "kind": "domainproficiency", "options": ["Animal handling", "Nature", "Survival"], "count": 1}], "Tempest": [], "Trickery": [], "War": []}}]},
+        'Fighter': {
+            6: [{"feature": "increase"}],
+            14: [{"feature": "increase"}]},
+        'Rogue': {
+            1: [{"feature": "choice", "kind": "rogueoption", "options": {"Thieves tools proficiency +1": [], "Gain expertise in two proficiencies": [{"feature": "expertise", "count": 2}]}}],
+            6: [{"feature": "expertise", "count": 2, "ifexpertise": True}],
+            10: [{"feature": "increase"}],
+            15: [{"feature": "grant", "proficiencies": ["Wisdom"]}]}}
+
     # Universal variable for level events based on class
-    classevents = {'Bard': ['3', '10'], 'Cleric': ['1'], 'Fighter': ['6', '14'], 'Rogue': ['1', '6', '10', '15']}
+    classevents = {setclass: sorted(levels) for setclass, levels in classfeatures.items()}
 
     # Universal variable to determine skill buffs based on background
     backgroundbuffs = {'Acolyte': ['Insight', 'Religion'], 'Charlatan': ['Deception', 'Sleight of hand'], 'Criminal': ['Deception', 'Stealth'], 'Spy': ['Deception', 'Stealth'], 'Entertainer': ['Acrobatics', 'Performance'], 'Gladiator': ['Acrobatics', 'Performance'], 'Folk hero': ['Animal handling', 'Survival'], 'Guild artisan': ['Insight', 'Persuasion'], 'Guild Merchant': ['Insight', 'Persuasion'], 'Hermit': ['Medicine', 'Religion'], 'Noble': ['History', 'Persuasion'], 'Knight': ['History', 'Persuasion'], 'Outlander': ['Athletics', 'Survival'], 'Sage': ['Arcana', 'History'], 'Sailor': ['Athletics', 'Perception'], 'Pirate': ['Athletics', 'Perception'], 'Soldier': ['Athletics', 'Intimidation'], 'Urchin': ['Sleight of hand', 'Stealth']}
@@ -46,7 +202,14 @@ class Character:
     # Universal variable to aid in calculating skill stats based on ability scores
     abilitycalculation = {'Strength': ['Strength', 'Athletics'], 'Dexterity': ['Dexterity', 'Acrobatics', 'Sleight of hand', 'Stealth'], 'Constitution': ['Constitution'], 'Intelligence': ['Intelligence', 'Arcana', 'History', 'Investigation', 'Nature', 'Religion'], 'Wisdom': ['Wisdom', 'Animal handling', 'Insight', 'Medicine', 'Perception', 'Survival'], 'Charisma': ['Charisma', 'Deception', 'Intimidation', 'Performance', 'Persuasion']}
 
+    # Precomputed index of the ability score each stat is calculated from, so a changed score only needs its own stats recalculated
+    statability = {skill: score for score, skills in abilitycalculation.items() for skill in skills}
+
     def __init__(self, name=None, loaded=None):
+        self.name = ""
+        self.pathname = ""
+        # Each character gets its own score, stat and proficiency storage so that changing one character never changes another.
+        self.blank()
         # If a character is being created for the first time, the input name can be passed through to set that and automatically generate the path-friendly name. If a character is being loaded, the dictionary generated from the CSV file can be passed and each required variable will be processed.
         if name is not None:
             self.name = name
@@ -54,448 +217,504 @@ class Character:
         if loaded is not None:
             self.name = loaded['Name']
             self.pathname = loaded['Path Name']
-            self.level = ast.literal_eval(loaded['Level'])
+            self.level = int(loaded['Level'])
             self.setclass = loaded['Class']
             self.race = loaded['Race']
             self.background = loaded['Background']
-            # Python will see the values that are dictionaries as strings by default. ast.literal_eval converts them to a python object.
-            self.scores = ast.literal_eval(loaded['Ability scores'])
-            self.stats = ast.literal_eval(loaded['Stats'])
-            self.proficiencies = ast.literal_eval(loaded['Proficiencies'])
+            # The scores, stats and proficiencies are read straight into the packed storage. See parsevalues() and parseproficiencies() for the formats they can be in.
+            self._values = array("b", parsevalues(loaded['Ability scores'], loaded['Stats']))
+            self._proficient, self._doubled = parseproficiencies(loaded['Proficiencies'])
+            # The loaded stats were calculated before they were exported, so nothing needs recalculating until something changes
+            self.markcalculated()
+
+    # Class function to clear everything but the character's name, ready for the setup to be run
+    def blank(self):
+        self.level = 0
+        self.race = ""
+        self.setclass = ""
+        self.background = ""
+        # The six ability scores followed by the calculated stats
+        self._values = array("b", bytes(len(self.abilities)+len(self.statnames)))
+        self._proficient = 0
+        self._doubled = 0
+        # Bitmasks of the ability scores and stats changed since the stats were last calculated
+        self._changedscores = 0
+        self._changedstats = 0
+        # The proficiency modifier and class that the current stats were calculated with. None means the stats have never been calculated.
+        self.calculatedmodifier = None
+        self.calculatedclass = None
+        # The last rendered character sheet, along with the details it was rendered from. See rendersheet().
+        self._rendered = None
+
+    # Raw ability scores, which can be read and written like a dictionary. Assigning a whole dictionary copies its values in and marks every stat for recalculation.
+    @property
+    def scores(self):
+        return ValueView(self, self.abilities, self.abilityindex, 0, True)
+
+    @scores.setter
+    def scores(self, scores):
+        view = ValueView(self, self.abilities, self.abilityindex, 0, True)
+        for score, value in dict(scores).items():
+            view[score] = value
+        self.calculatedmodifier = None
+
+    # Calculated skill stats, which can be read and written like a dictionary
+    @property
+    def stats(self):
+        return ValueView(self, self.statnames, self.statindex, len(self.abilities), False)
+
+    @stats.setter
+    def stats(self, stats):
+        view = self.stats
+        for stat, value in dict(stats).items():
+            view[stat] = value
+
+    # Selected proficiencies and expertise, as a dictionary holding the "proficiencies" and "doubled" lists
+    @property
+    def proficiencies(self):
+        return ProficienciesView(self)
+
+    @proficiencies.setter
+    def proficiencies(self, proficiencies):
+        proficiencies = dict(proficiencies)
+        self._proficient = self.statmask(proficiencies.get("proficiencies", []))
+        self._doubled = self.statmask(proficiencies.get("doubled", []))
+        self.calculatedmodifier = None
+
+    # Class function to turn a list of stat names into a bitmask of their positions
+    @classmethod
+    def statmask(cls, names):
+        mask = 0
+        for name in names:
+            mask |= 1 << cls.statindex[name]
+        return mask
+
+    # Class function to record that the stats are up to date with the current scores, proficiencies, level and class
+    def markcalculated(self):
+        self._changedscores = 0
+        self._changedstats = 0
+        self.calculatedmodifier = self.proficiencymodifier()
+        self.calculatedclass = self.setclass
+
+    # Class function to return the character's fields in their packed form: the details, the score and stat array as bytes, and the two proficiency bitmasks. Used by the roster store.
+    def packed(self):
+        return (self.name, self.pathname, self.level, self.setclass, self.race, self.background, self._values.tobytes(), self._proficient, self._doubled)
+
+    # Creates a character straight from the fields returned by packed(), without any parsing. The stats are taken to be already calculated.
+    @classmethod
+    def unpacked(cls, name, pathname, level, setclass, race, background, values, proficient, doubled):
+        if len(values) != len(cls.abilities) + len(cls.statnames):
+            raise ValueError("packed values for {} hold {} bytes, expected {}".format(name, len(values), len(cls.abilities)+len(cls.statnames)))
+        character = cls.__new__(cls)
+        character.name = name
+        character.pathname = pathname
+        character.level = level
+        character.setclass = setclass
+        character.race = race
+        character.background = background
+        character._values = array("b", values)
+        character._proficient = proficient
+        character._doubled = doubled
+        character._rendered = None
+        character.markcalculated()
+        return character
+
+    # Class function to return everything about the character that changes as it is set up or levelled, for restore() to put back
+    def snapshot(self):
+        return (self.packed(), self._changedscores, self._changedstats, self.calculatedmodifier, self.calculatedclass)
+
+    # Class function to put the character back exactly as it was when snapshot() was taken
+    def restore(self, snapshot):
+        packed, self._changedscores, self._changedstats, self.calculatedmodifier, self.calculatedclass = snapshot
+        self.name, self.pathname, self.level, self.setclass, self.race, self.background, values, self._proficient, self._doubled = packed
+        self._values = array("b", values)
+        self._rendered = None
+
+    # Class function to return an independent copy of the character, which can be changed without affecting this one
+    def copy(self):
+        character = self.__class__.__new__(self.__class__)
+        character.restore(self.snapshot())
+        return character
+
+    # Class function for the proficiency modifier at the character's current level
+    def proficiencymodifier(self):
+        return 1 + int(math.ceil(float(self.level) * 0.25))
             
     
-    # Class function to set up new character.
-    def setup(self):
-        # User sets character level
-        while True:
-            try:
-                level = int(input("Character level:\n"))
-                if level < 1:
-                    raise ValueError
-                self.level = level
-                break
-            except ValueError:
-                print("Invalid selection, try again.")
-        # User selects character race
-        racelist = list(self.racebuffs.keys())
-        formattedraces = columns(numbered(racelist), False)
-        columns(formattedraces)
-        while True:
-            try:
-                selection = int(input("Select character race:\n"))
-                if selection < 1 or selection > len(racelist):
-                    raise ValueError
-                race = racelist[selection-1]
-                self.race = race
-                break
-            except ValueError:
-                print("Invalid selection, try again.")
-        # User selects character class.
-        classlist = list(self.classbuffs.keys())
-        formattedclass = columns(numbered(classlist), False)
-        columns(formattedclass)
-        while True:
-            try:
-                selection = int(input("Character class: \n"))
-                if selection < 1 or selection > len(classlist):
-                    raise ValueError
-                setclass = classlist[selection-1]
-                self.setclass = setclass
-                break
-            except ValueError:
-                print("Invalid selection, try again.")
-        # User selects character background
-        backgroundlist = list(self.backgroundbuffs.keys())
-        formattedbackground = columns(numbered(backgroundlist), False)
-        columns(formattedbackground)
-        while True:
-            try:
-                selection = int(input("Character background:\n"))
-                if selection < 1 or selection > len(backgroundlist):
-                    raise ValueError
-                background = backgroundlist[selection-1]
-                self.background = background
-                break
-            except ValueError:
-                print("Invalid selection, try again.")
+    # Class function to set up new character. Every choice is taken from the decisions object, which prompts the user through menus by default. Passing one of the providers from builder.py sets a character up without any prompts.
+    # If a journal from journal.py is passed, the finished sheet is recorded in it to be written at its next checkpoint instead of being exported straight away.
+    def setup(self, decisions=None, autoexport=True, journal=None, rawscores=None):
+        if decisions is None:
+            decisions = MenuDecisions()
+        self.blank()
+        # Character level, race, class and background
+        self.level = decisions.number("level", self)
+        self.race = decisions.choose("race", list(self.racebuffs.keys()), self)
+        self.setclass = decisions.choose("class", list(self.classbuffs.keys()), self)
+        self.background = decisions.choose("background", list(self.backgroundbuffs.keys()), self)
         # Adds background-based proficiencies to proficiency list
-        for item in self.backgroundbuffs[background]:
-            self.proficiencies["proficiencies"].append(item)
+        self.addproficiencies(BACKGROUNDSKILLS[BACKGROUNDINDEX[self.background]])
         # Take raw score for each ability. Checks for any race buffs and adds buff to the score.
-        for score in list(self.scores.keys()):
-            while True:
-                try:
-                    rawscore = int(input("Enter raw {} score.\n".format(score.lower())))
-                    if rawscore < 1:
-                        raise ValueError
-                    if score in self.racebuffs[race]:
-                        rawscore += self.racebuffs[race][score]
-                    self.scores[score] = rawscore
-                    break
-                except ValueError:
-                    print("Invalid input, try again.")
-        # User selects class-based proficiencies
-        proficiencyoptions = self.classbuffs[setclass]["skills"]
-        times = self.classbuffs[setclass]["howmany"]
-        if not all(item in self.proficiencies["proficiencies"] for item in proficiencyoptions):
-            selected = []
-            for x in range(1,times+1):
-                columns(numbered(proficiencyoptions))
-                while True:
-                    try:
-                        if all(item in self.proficiencies["proficiencies"] for item in proficiencyoptions):
-                            break
-                        selection = int(input("Select a proficiency:\n"))
-                        if selection < 1 or selection > len(proficiencyoptions):
-                            raise ValueError
-                        choice = proficiencyoptions[selection-1]
-                        if choice in selected:
-                            raise CustomExcept
-                        selected.append(choice)
-                        self.proficiencies["proficiencies"].append(choice)
-                        break
-                    except ValueError:
-                        print("Invalid selection, try again.")
-                    except CustomExcept:
-                        print("You are already proficient, select another option.")
+        # The six raw scores can be passed in, such as ones generated in bulk by abilityscores.py, or given all at once by a decisions provider with a rawscores() method. Otherwise each one is asked for in turn.
+        if rawscores is None and hasattr(decisions, "rawscores"):
+            rawscores = decisions.rawscores(self)
+        scores = self.scores
+        for index, (score, buff) in enumerate(zip(self.abilities, RACEBUFFS[RACEINDEX[self.race]])):
+            rawscore = decisions.number("score", self, score) if rawscores is None else int(rawscores[index])
+            scores[score] = rawscore + buff
+        # Class-based proficiencies. Only skills the character isn't already proficient in are offered.
+        classindex = CLASSINDEX[self.setclass]
+        for x in range(CLASSHOWMANY[classindex]):
+            if not self.gainproficiency(decisions, "proficiency", CLASSSKILLNAMES[classindex], CLASSSKILLS[classindex]):
+                break
         # Does an initial calculation of the character's stats without exporting. This is so that if they are referenced during a class-based level event, they will be available.
         self.recalculate()
         # Runs the level up function once for each level a character has achieved in sequence. Auto-export is set to False so a new CSV file isn't generated for every level.
         for x in range(1, self.level+1):
-            self.levelup(x, False)
+            self.levelup(x, False, decisions)
         # Recalculates the character sheet a final time, then runs the export function to create a file for the character in the current directory.
         self.recalculate()
-        self.export()
+        if autoexport:
+            self.save(journal)
             
         
     # Class function for increasing the level of a character. The the autoexport parameter (default set to True) determines whether or not a new CSV file for the character will be created. This is useful when iterating over several levels at one time.
-    def levelup(self, level, autoexport=True):
-        # Checks to see if a character is eligible for level-based score increases. If a character's class has additional levels at which this happens, it will be handled in the classevent function
-        if level in [4, 8, 12, 16, 19]:
-            scores = list(self.scores.keys())
-            for x in range(1, 3):
-                formattedscores = []
-                for item in scores:
-                    formattedscores.append("{} [{}]".format(item, self.scores[item]))
-                columns(numbered(formattedscores))
-                print("Choose an ability score to increase by 1 point.")
-                while True:
-                    try:
-                        selection = int(input(""))
-                        if selection < 1 or selection > len(scores):
-                            raise ValueError
-                        selectedscore = scores[selection - 1]
-                        if self.scores[selectedscore] == 20:
-                            raise CustomExcept
-                        self.scores[selectedscore] += 1
-                        break
-                    except ValueError:
-                        print("Invalid selection, try again.")
-                    except CustomExcept:
-                        print("Ability scores cannot exceed 20, please select a different score.")
-        # Checks to see if a character has any level events and runs the classevent function if one is present.
-        if self.setclass in list(self.classevents.keys()) and level in self.classevents[self.setclass]:
-            classevent(level)
-        if autoexport == True:
+    # As with setup(), passing a journal defers the export to the journal's next checkpoint, so levelling a character several times only writes its sheet once.
+    # Levels above MAXLEVEL are refused with a ValueError.
+    def levelup(self, level, autoexport=True, decisions=None, journal=None):
+        if not 1 <= level <= MAXLEVEL:
+            raise ValueError("level must be between 1 and {}, got {}".format(MAXLEVEL, level))
+        if decisions is None:
+            decisions = MenuDecisions()
+        # If anything fails part way through, such as a remote player disconnecting at a prompt or the sheet failing to save, the character is put back as it was before the level up
+        snapshot = self.snapshot()
+        try:
             self.level = level
-            self.recalculate()
-            self.export()
+            # Checks to see if a character is eligible for level-based score increases. If a character's class has additional levels at which this happens, it will be handled in the classevent function
+            if level in ASILEVELS:
+                self.increasescores(decisions)
+            # Checks to see if a character has any level events and runs the classevent function if one is present.
+            if (self.setclass, level) in CLASSEVENTTABLE:
+                self.classevent(level, decisions)
+            if autoexport == True:
+                self.recalculate()
+                self.save(journal)
+        except BaseException:
+            self.restore(snapshot)
+            raise
+
+    # Class function for an ability score improvement: two ability scores of the character's choosing go up by 1 point. Scores that have already reached 20 are not offered.
+    def increasescores(self, decisions):
+        for x in range(1, 3):
+            options = [score for score in self.scores if self.scores[score] < 20]
+            if not options:
+                break
+            self.scores[decisions.choose("increase", options, self)] += 1
+
+    # Class function to add proficiencies (or expertise, if doubled is True) in every stat in a bitmask
+    def addproficiencies(self, mask, doubled=False):
+        if doubled:
+            self._doubled |= mask
+        else:
+            self._proficient |= mask
+        self._changedstats |= mask
+
+    # Class function for picking a new proficiency out of the options the character isn't proficient in yet. Returns the chosen skill, or None if there was nothing left to choose.
+    # mask is the bitmask of the options if it is already known, such as one of the compiled rule tables, which saves working it out.
+    def gainproficiency(self, decisions, kind, options, mask=None):
+        if mask is None:
+            mask = self.statmask(options)
+        remaining = mask & ~self._proficient
+        if not remaining:
+            return None
+        choice = decisions.choose(kind, [item for item in options if remaining & STATBITS[item]], self)
+        self.addproficiencies(STATBITS[choice])
+        return choice
+
+    # Class function for picking a proficiency to gain expertise in, which doubles its proficiency modifier
+    def gainexpertise(self, decisions):
+        remaining = self._proficient & ~self._doubled
+        if not remaining:
+            return None
+        choice = decisions.choose("expertise", [item for item, bit in STATBITS.items() if remaining & bit], self)
+        self.addproficiencies(STATBITS[choice], True)
+        return choice
             
     
-    # Class function to handle character class special level events
-    def classevent(self, level):
-        cl = self.setclass
-        if cl == "Bard":
-            if level == 3:
-                # Character can choose their bard college. If they choose the college of lore, they gain 3 proficiencies
-                print("Choose your college:\n(1): College of Lore    (2): College of Valor")
-                while True:
-                    try:
-                        chosencollege = int(input())
-                        if chosencollege != 1 and chosencollege != 2:
-                            raise ValueError
-                        break
-                    except ValueError:
-                        print("Invalid selection, try again.")
-                if chosencollege == 1 and not all(item in self.proficiencies["proficiencies"] for item in list(self.stats.keys())[5:]):
-                    chosenprofs = []
-                    options = []
-                    for item in list(self.stats.keys())[5:]:
-                        if item in self.proficiencies["proficiencies"]:
-                            continue
-                        else:
-                            options.append(item)
-                    optionsformat = columns(numbered(options), False)
-                    columns(optionsformat)
-                    for x in range(1, 4):
-                        while True:
-                            try:
-                                if options == [] or all(item in self.proficiencies["proficiencies"] for item in options):
-                                    break
-                                chosenprof = int(input("Choose 3 proficiencies.    {}\n".format(chosenprofs)))
-                                if options[chosenprof-1] in chosenprofs:
-                                    raise CustomExcept
-                                elif chosenprof < 1 or chosenprof > len(options):
-                                    raise ValueError
-                                else:
-                                    chosenprofs.append(options[chosenprof-1])
-                                    self.proficiencies["proficiencies"].append(options[chosenprof-1])
-                                    break
-                            except CustomExcept:
-                                print("Please select each proficiency only once.")
-                            except ValueError:
-                                print("Invalid selection, try again.")
-                chosenexpertise = []
-                # Level 3 Bards also choose 2 proficiencies to gain expertise in.
-                for x in range(1, 3):
-                    profoptions = self.proficiencies["proficiencies"]
-                    for item in numbered(profoptions):
-                        print(item)
-                    while True:
-                        try:
-                            chosen = int(input("Choose your expertise.    {}\n".format(chosenexpertise)))
-                            if chosen < 1 or chosen > len(profoptions):
-                                raise ValueError
-                            pickedname = profoptions[chosen-1]
-                            if pickedname in chosenexpertise or pickedname in self.proficiencies["doubled"]:
-                                raise CustomExcept
-                            self.proficiencies["doubled"].append(pickedname)
-                            chosenexpertise.append(pickedname)
-                            break
-                        except ValueError:
-                            print("Invalid selection, try again.")
-                        except CustomExcept:
-                            print("You're already an expert, please select another option.")
-            # At level 10, bards gain expertise in two more proficiencies
-            if level == 10:                       
-                chosenexpertise = []
-                for x in range(1, 3):
-                    profoptions = []
-                    for item in self.proficiencies["proficiencies"]:
-                        if item in self.proficiencies["doubled"]:
-                            continue
-                        else:
-                            profoptions.append(item)                    
-                    for item in numbered(profoptions):
-                        print(item)
-                    while True:
-                        try:
-                            chosen = int(input("Choose your expertise.    {}\n".format(chosenexpertise)))
-                            if chosen < 1 or chosen > len(profoptions):
-                                raise ValueError
-                            pickedname = profoptions[chosen-1]
-                            if pickedname in chosenexpertise or pickedname in self.proficiencies["doubled"]:
-                                raise CustomExcept
-                            self.proficiencies["doubled"].append(pickedname)
-                            chosenexpertise.append(pickedname)
-                            break
-                        except ValueError:
-                            print("Invalid selection, try again.")
-                        except CustomExcept:
-                            print("You're already an expert, please select another option.")
-        if cl == "Cleric" and level == 1:
-            # At level 1, Clerics join a domain. Depending on their domain, they may gain proficiencies
-            domains = ["Knowledge", "Life", "Light", "Nature", "Tempest", "Trickery", "War"]
-            print("Choose a divine domain:")
-            columns(numbered(domains))
-            while True:
-                try:
-                    selection = int(input())
-                    if selection < 1 or selection > len(domains):
-                        raise ValueError
-                    break
-                except ValueError:
-                    print("Invalid selection, try again.")
-            domain = domains[selecion-1]
-            knowledgeoptions = ["Arcana", "Nature", "History", "Religion"]
-            natureoptions = ["Animal handling", "Nature", "Survival"]
-            if domain == "Knowledge" and not all(option in self.proficiencies["proficiencies"] for option in knowledgeoptions):
-                options = knowledgeoptions
-                for item in numbered(options):
-                    print(item)
-                print("Pick a skill to gain proficiency in. Proficiency multiplier will be doubled.")
-                for x in range(1, 3):
-                    while True:
-                        try:
-                            selection = int(input("\n"))
-                            if selection < 1 or selection > len(options):
-                                raise ValueError
-                            if options[selection-1] in self.proficiencies["proficiencies"]:
-                                raise CustomExcept
-                            self.proficiencies["proficiencies"].append(option[selection-1])
-                            self.proficiencies["doubled"].append(option[selection-1])
-                            break
-                        except ValueError:
-                            print("Invalid selection, please try again.")
-                        except CustomExcept:
-                            print("You may only become proficient in this skill once. Please select a different skill.")
-            if domain == "Nature" and not all(option in self.proficiencies["proficiencies"] for option in natureoptions):
-                options = natureoptions
-                for item in numbered(options):
-                    print(item)
-                print("Choose a skill to gain proficiency")
-                while True:
-                    try:
-                        selection = int(input("\n"))
-                        if selection < 1 or selection > len(options):
-                            raise ValueError
-                        if options[selection-1] in self.proficiencies["proficiencies"]:
-                            raise CustomExcept
-                        self.proficiencies["proficiencies"].append(options[selection-1])
-                        break
-                    except ValueError:
-                        print("Invalid selection, try again.")
-                    except CustomExcept:
-                        print("You are already proficient in this skill, please choose another.")
-        if cl == "Fighter" and level == 6 or cl == "Fighter" and level == 14:
-            scores = list(self.scores.keys())
-            for x in range(1, 3):
-                formattedscores = []
-                for item in scores:
-                    formattedscores.append("{} [{}]".format(item, self.scores[item]))
-                columns(numbered(formattedscores))
-                print("Choose an ability score to increase by 1 point.")
-                while True:
-                    try:
-                        selection = int(input())
-                        if selection < 1 or selection > len(scores):
-                            raise ValueError
-                        selectedscore = scores[selection-1]
-                        if self.scores[selectedscore] == 20:
-                            raise CustomExcept
-                        self.scores[selectedscore] += 1
-                        break
-                    except ValueError:
-                        print("Invalid selection, try again.")
-                    except CustomExcept:
-                        print("Ability scores cannot exceed 20, please select a different score.")
-        if cl == "Rogue":
-            if level == 1:
-                print("Choose a class option:\n(1): Thieves tools proficiency +1        (2): Gan expertise in two proficiencies")
-                while True:
-                    try:
-                        choice = int(input("\n"))
-                        if choice < 1 or choice > 2:
-                            raise ValueError
-                        break
-                    except ValueError:
-                        print("Invalid selection, try again.")
-                if choice == 2:
-                    chosen = []
-                    for x in range(1, 3):
-                        columns(numbered(self.proficiencies["proficiencies"]))
-                        while True:
-                            try:
-                                selection = int(input("Pick an expertise.   {}".format(chosen)))
-                                if selection < 1 or selection > len(self.proficiencies["proficiencies"]):
-                                    raise ValueError
-                                selectedproficiency = self.proficiencies["proficiencies"][selection-1]
-                                if selectedproficiency in self.proficiencies["doubled"]:
-                                    raise CustomExcept
-                                self.proficiencies["doubled"].append(selectedproficiency)
-                                chosen.append(selectedproficiency)
-                                break
-                            except ValueError:
-                                print("Invalid input, try again.")
-                            except CustomExcept:
-                                print("You are already an expert in this, try again")
-            if level == 6 and self.proficiencies["doubled"] != []:
-                chosen = []
-                for x in range(1, 3):
-                    columns(numbered(self.proficiencies["proficiencies"]))
-                    while True:
-                        try:
-                            selection = int(input("Pick an expertise.   {}".format(chosen)))
-                            if selection < 1 or selection > len(self.proficiencies["proficiencies"]):
-                                raise ValueError
-                            selectedproficiency = self.proficiencies["proficiencies"][selection - 1]
-                            if selectedproficiency in self.proficiencies["doubled"]:
-                                raise CustomExcept
-                            self.proficiencies["doubled"].append(selectedproficiency)
-                            chosen.append(selectedproficiency)
-                            break
-                        except ValueError:
-                            print("Invalid input, try again.")
-                        except CustomExcept:
-                            print("You are already an expert in this, try again")
-            if level == 10:
-                scores = list(self.scores.keys())
-                for x in range(1, 3):
-                    formattedscores = []
-                    for item in scores:
-                        formattedscores.append("{} [{}]".format(item, self.scores[item]))
-                    columns(numbered(formattedscores))
-                    print("Choose an ability score to increase by 1 point.")
-                    while True:
-                        try:
-                            selection = int(input("\n"))
-                            if selection < 1 or selection > len(scores):
-                                raise ValueError
-                            selectedscore = scores[selection - 1]
-                            if self.scores[selectedscore] == 20:
-                                raise CustomExcept
-                            self.scores[selectedscore] += 1
-                            break
-                        except ValueError:
-                            print("Invalid selection, try again.")
-                        except CustomExcept:
-                            print("Ability scores cannot exceed 20, please select a different score.")
-            if level == 15:
-                self.proficiencies["proficiencies"].append("Wisdom")
-                
-
-    # Class function to recalculate character sheet after a skill score or proficiency has changed
+    # Class function to handle character class special level events, by running the compiled features for the character's class at that level
+    def classevent(self, level, decisions=None):
+        if decisions is None:
+            decisions = MenuDecisions()
+        for step, arguments in CLASSEVENTTABLE.get((self.setclass, level), ()):
+            step(self, decisions, *arguments)
+    
+    # Class function to recalculate character sheet after a skill score or proficiency has changed. Only the stats that depend on something that changed since the last calculation are worked out again.
     def recalculate(self):
-        # Sets each skill score based on its related ability score using a formula to calculate the appropriate number.
-        for score in list(self.abilitycalculation.keys()):
-            for skill in self.abilitycalculation[score]:
-                skillscore = (self.scores[score]-10) // 2
-                self.stats[skill] = skillscore
-        # Uses a formula to calculate the proficiency modifier based on character level. Checks each proficiency for an expertise and applies the modifier accordingly.
-        modifier = 1 + int(math.ceil(float(self.level) * 0.25))
-        for item in self.proficiencies["proficiencies"]:
-            if item in self.proficiencies["doubled"]:
-                self.stats[item] += (modifier*2)
-            else:
-                self.stats[item] += modifier
-        for item in list(self.stats.keys())[:5]:
-            # Checks for class-based skill throw proficiencies
-            if item in self.classbuffs[self.setclass]["throws"]:
-                self.stats[item] += modifier
-            
+        modifier = self.proficiencymodifier()
+        throws = CLASSTHROWS.get(self.setclass, 0)
+        if self.calculatedmodifier is None:
+            # Nothing has been calculated yet, so every stat is worked out
+            affected = ALLSTATS
+        else:
+            # A gained or lost proficiency or expertise only affects that stat, and a changed ability score affects every stat calculated from it
+            affected = self._changedstats
+            changed = self._changedscores
+            for index in range(len(self.abilities)):
+                if changed >> index & 1:
+                    affected |= ABILITYSTATS[index]
+            # A new proficiency modifier affects every proficient stat and saving throw, and a new class changes which saving throws apply
+            if modifier != self.calculatedmodifier:
+                affected |= self._proficient | throws
+            if self.setclass != self.calculatedclass:
+                affected |= throws | CLASSTHROWS.get(self.calculatedclass, 0)
+        if affected:
+            values = self._values
+            offset = len(self.abilities)
+            for stat in range(len(self.statnames)):
+                bit = 1 << stat
+                if not affected & bit:
+                    continue
+                # Sets each skill score based on its related ability score using a formula to calculate the appropriate number. Adds the proficiency modifier for proficiencies, doubled for expertise, and again for class-based saving throw proficiencies.
+                value = (values[STATABILITY[stat]]-10) // 2
+                if self._proficient & bit:
+                    value += modifier*2 if self._doubled & bit else modifier
+                if throws & bit:
+                    value += modifier
+                values[offset+stat] = value
+        self.markcalculated()
+
     # Class function to print a formatted, readable version of the character sheet to screen.
     def charactersheet(self):
-        skills = list(self.stats.keys())[5:]
-        savingthrows = list(self.stats.keys())[:5]
-        print(" "+"-"*110)
-        print(" "+"| {} |".format(self.name).center(109, "|"))
-        print(" "+"-"*110)
-        print("| Level {} | {} | {} | {} |".format(self.level, self.race, self.setclass, self.background).center(110))
-        print(" "+"-"*110)
-        throwsinformation = ["| Saving Throws |".center(110, "-")]
-        throwswithstats = []
-        for item in savingthrows:
-            throwswithstats.append("{}: [{}]".format(item, self.stats[item]))
-        throwsinformation.append("{} | {} | {} | {} | {}".format(throwswithstats[0], throwswithstats[1], throwswithstats[2], throwswithstats[3], throwswithstats[4]).center(110))
-        print(bordered(throwsinformation))
-        skillsinformation = []
-        for item in skills:
-            skillsinformation.append("{}: [{}]".format(item, self.stats[item]))
-        print("|"+"| Skills |".center(108)+"  |")
-        print(" "+"-"*110)
-        skillsinformation = columns(skillsinformation, False)
-        columns(skillsinformation)
-        print(" "+"-"*110)
+        sys.stdout.write(self.rendersheet())
+
+    # Class function to return the character sheet as one block of text, ready to be written out in one go. The text is kept and reused until the character's details or stats change.
+    def rendersheet(self):
+        key = (self.name, self.level, self.race, self.setclass, self.background, self._values.tobytes()[len(self.abilities):])
+        if self._rendered is not None and self._rendered[0] == key:
+            return self._rendered[1]
+        stats = self.stats
+        throwswithstats = ["{}: [{}]".format(item, stats[item]) for item in self.savingthrows]
+        skillsinformation = ["{}: [{}]".format(item, stats[item]) for item in self.statnames[len(self.savingthrows):]]
+        lines = [SHEETRULE, " "+"| {} |".format(self.name).center(109, "|"), SHEETRULE, "| Level {} | {} | {} | {} |".format(self.level, self.race, self.setclass, self.background).center(110), SHEETRULE]
+        lines.append(bordered([THROWSHEADER, " | ".join(throwswithstats).center(110)]))
+        lines.append(SKILLSHEADER)
+        lines.append(SHEETRULE)
+        lines.extend(columns(columns(skillsinformation, False), False))
+        lines.append(SHEETRULE)
+        text = "\n".join(lines) + "\n"
+        self._rendered = (key, text)
+        return text
     
-    # Class function to export a character sheet once character building has been completed.
-    def export(self):
-        csvout = {"Name": self.name, "Path Name": self.pathname, "Level": self.level, "Class": self.setclass, "Race": self.race, "Background": self.background, "Ability scores": self.scores, "Stats": self.stats, "Proficiencies": self.proficiencies}
-        fields = list(csvout.keys())
-        filename = "charactersheet_" + self.pathname + ".csv"
-        with open(filename, "w", newline="") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fields)
-            writer.writeheader()
-            writer.writerow(csvout)
+    # Class function to export a character sheet once character building has been completed. The sheet is written to the current directory unless another directory is given.
+    # The sheet is written to a temporary file and renamed into place, so an interrupted export never leaves a half written sheet behind.
+    def export(self, directory=""):
+        filename = os.path.join(directory, "charactersheet_" + self.pathname + ".csv")
+        from journal import writesheet
+        writesheet(filename, self.sheetrow())
+
+    # Class function to return the row of the character sheet as a dictionary of field names and their formatted values
+    def sheetrow(self):
+        return {"Name": self.name, "Path Name": self.pathname, "Level": self.level, "Class": self.setclass, "Race": self.race, "Background": self.background, "Ability scores": formatnumbers(self.scores.values()), "Stats": formatnumbers(self.stats.values()), "Proficiencies": formatproficiencies(self.proficiencies)}
+
+    # Class function to save the character's sheet, either through a journal if one is given or by exporting it straight away
+    def save(self, journal=None):
+        if journal is None:
+            self.export()
+        else:
+            journal.record(self)
+
+
+# Rule tables compiled once from the named tables on the Character class, used by setup(), classevent(), recalculate() and the sheet loaders. Every table is frozen (a tuple or a read-only mapping), and sets of stats are bitmasks in the order of Character.statnames, so checking whether a character is already proficient, or has taken every option, is a single bitwise operation.
+# STATABILITY holds the position of the ability score behind each stat, ABILITYSTATS the bitmask of stats behind each ability score, CLASSTHROWS the bitmask of saving throws each class is proficient in, and STATBITS the bit for each stat name.
+STATABILITY = tuple(Character.abilityindex[Character.statability[name]] for name in Character.statnames)
+ABILITYSTATS = tuple(Character.statmask(Character.abilitycalculation[name]) for name in Character.abilities)
+ALLSTATS = (1 << len(Character.statnames)) - 1
+CLASSTHROWS = MappingProxyType({setclass: Character.statmask(item for item in buffs["throws"] if item in Character.savingthrows) for setclass, buffs in Character.classbuffs.items()})
+STATBITS = MappingProxyType({name: 1 << index for name, index in Character.statindex.items()})
+
+# Races, classes and backgrounds are numbered in the order they are offered, and each table below is indexed by those numbers.
+# RACEBUFFS holds the buff to each ability score, in the order of Character.abilities. CLASSSKILLS and BACKGROUNDSKILLS are the bitmasks of skills offered by each class and given by each background, and CLASSSKILLNAMES keeps the class skills in the order they are offered.
+RACEINDEX = MappingProxyType({name: index for index, name in enumerate(Character.racebuffs)})
+CLASSINDEX = MappingProxyType({name: index for index, name in enumerate(Character.classbuffs)})
+BACKGROUNDINDEX = MappingProxyType({name: index for index, name in enumerate(Character.backgroundbuffs)})
+RACEBUFFS = tuple(tuple(buffs.get(score, 0) for score in Character.abilities) for buffs in Character.racebuffs.values())
+CLASSHOWMANY = tuple(buffs["howmany"] for buffs in Character.classbuffs.values())
+CLASSSKILLNAMES = tuple(tuple(buffs["skills"]) for buffs in Character.classbuffs.values())
+CLASSSKILLS = tuple(Character.statmask(skills) for skills in CLASSSKILLNAMES)
+BACKGROUNDSKILLS = tuple(Character.statmask(skills) for skills in Character.backgroundbuffs.values())
+# Option sets used by class events: every skill after the saving throws (the College of Lore), and the Knowledge and Nature domain skills
+SKILLNAMES = tuple(Character.statnames[len(Character.savingthrows):])
+SKILLS = Character.statmask(SKILLNAMES)
+KNOWLEDGENAMES = ("Arcana", "Nature", "History", "Religion")
+KNOWLEDGESKILLS = Character.statmask(KNOWLEDGENAMES)
+NATURENAMES = ("Animal handling", "Nature", "Survival")
+NATURESKILLS = Character.statmask(NATURENAMES)
+# Levels at which every class gets an ability score improvement
+ASILEVELS = frozenset([4, 8, 12, 16, 19])
+# Highest level the rules go up to
+MAXLEVEL = 20
+
+
+# Steps that compiled class features are made of. Each one is called with the character, the decisions provider and the arguments compiled from its feature.
+def _increasestep(character, decisions):
+    character.increasescores(decisions)
+
+
+def _proficiencystep(character, decisions, kind, names, mask, count, doubled):
+    for x in range(count):
+        choice = character.gainproficiency(decisions, kind, names, mask)
+        if not choice:
+            break
+        if doubled:
+            character.addproficiencies(STATBITS[choice], True)
+
+
+def _expertisestep(character, decisions, count, ifexpertise):
+    if ifexpertise and not character._doubled:
+        return
+    for x in range(count):
+        if not character.gainexpertise(decisions):
+            break
+
+
+def _grantstep(character, decisions, mask):
+    character.addproficiencies(mask & ~character._proficient)
+
+
+def _choicestep(character, decisions, kind, options, outcomes):
+    for step, arguments in outcomes[decisions.choose(kind, list(options), character)]:
+        step(character, decisions, *arguments)
+
+
+# Compiles a list of class features into a tuple of (step, arguments) pairs, working out option lists and bitmasks once so that applying them is only a walk through the steps
+def compilefeatures(features):
+    steps = []
+    for feature in features:
+        kind = feature["feature"]
+        if kind == "increase":
+            steps.append((_increasestep, ()))
+        elif kind == "proficiency":
+            names = tuple(feature.get("options", SKILLNAMES))
+            steps.append((_proficiencystep, (feature["kind"], names, Character.statmask(names), feature.get("count", 1), feature.get("doubled", False))))
+        elif kind == "expertise":
+            steps.append((_expertisestep, (feature.get("count", 1), feature.get("ifexpertise", False))))
+        elif kind == "grant":
+            steps.append((_grantstep, (Character.statmask(feature["proficiencies"]),)))
+        elif kind == "choice":
+            outcomes = MappingProxyType({option: compilefeatures(chosen) for option, chosen in feature["options"].items()})
+            steps.append((_choicestep, (feature["kind"], tuple(outcomes), outcomes)))
+        else:
+            raise ValueError("unknown class feature {!r}".format(kind))
+    return tuple(steps)
+
+
+# Dispatch table of every class event, keyed by (class, level)
+CLASSEVENTTABLE = MappingProxyType({(setclass, level): compilefeatures(features) for setclass, levels in Character.classfeatures.items() for level, features in levels.items()})
+
+# Fixed pieces of the character sheet, built once rather than every time a sheet is shown
+SHEETRULE = " " + "-"*110
+THROWSHEADER = "| Saving Throws |".center(110, "-")
+SKILLSHEADER = "|" + "| Skills |".center(108) + "  |"
+
+
+# Defines the interactive decision provider. Every choice made while setting up or levelling a character is put to the user as a numbered menu, which is how the program has always asked for them.
+class MenuDecisions:
+    # Text printed above each kind of menu, and the prompt shown when asking for the selection
+    headers = {"scoremethod": "How would you like to set your ability scores?", "increase": "Choose an ability score to increase by 1 point.", "college": "Choose your college:", "domain": "Choose a divine domain:", "domainproficiency": "Pick a skill to gain proficiency in.", "rogueoption": "Choose a class option:"}
+    prompts = {"level": "Character level:\n", "score": "Enter raw {} score.\n", "race": "Select character race:\n", "class": "Character class: \n", "background": "Character background:\n", "proficiency": "Select a proficiency:\n", "loreproficiency": "Choose a proficiency.\n", "expertise": "Choose your expertise.\n"}
+    # Long lists are shown four to a row instead of two
+    wide = ["race", "class", "background", "loreproficiency"]
+    # Highest number that can be entered for each kind: the rules go up to level 20, and no ability score can go above 30
+    highest = {"level": MAXLEVEL, "score": 30}
+
+    # Asks for a whole number of at least 1 and at most the highest allowed for its kind, such as the character level or a raw ability score
+    def number(self, kind, character, label=None):
+        prompt = self.prompts.get(kind, "")
+        highest = self.highest.get(kind)
+        while True:
+            try:
+                value = int(input(prompt.format(str(label).lower())))
+                if value < 1 or highest is not None and value > highest:
+                    raise ValueError
+                return value
+            except ValueError:
+                print("Invalid input, try again.")
+
+    # Offers the ways of setting ability scores. Returns the six raw scores, or None if the user would rather enter them by hand.
+    # Rolled scores and the standard array are placed in the abilities by the user, and point buy lets them pick what to buy for each ability.
+    def rawscores(self, character):
+        import abilityscores
+        methods = {"Enter scores by hand": None}
+        methods.update({name: method for method, name in abilityscores.METHODS.items()})
+        method = methods[self.choose("scoremethod", list(methods), character)]
+        if method is None:
+            return None
+        if method == "pointbuy":
+            rawscores = self.pointbuy(character)
+        else:
+            if method == "roll":
+                values = [int(value) for value in abilityscores.generate(1, method, dice.stream(character.name))[0]]
+                print("You rolled: {}".format(", ".join(str(value) for value in values)))
+            else:
+                values = list(abilityscores.STANDARDARRAY)
+            rawscores = self.assign(values, character)
+        print("Your raw scores: {}".format(", ".join("{} {}".format(score, value) for score, value in zip(character.abilities, rawscores))))
+        return rawscores
+
+    # Asks which of the values goes in each ability in turn. The last ability gets whichever value is left.
+    def assign(self, values, character):
+        values = sorted(values, reverse=True)
+        rawscores = []
+        for score in character.abilities:
+            if len(values) > 1:
+                print("Choose your {} score.".format(score.lower()))
+                value = int(self.choose("assign", [str(value) for value in values], character))
+            else:
+                value = values[0]
+            values.remove(value)
+            rawscores.append(value)
+        return rawscores
+
+    # Asks what score to buy for each ability in turn, offering only the scores the points left can pay for
+    def pointbuy(self, character):
+        import abilityscores
+        points = abilityscores.POINTBUYBUDGET
+        rawscores = []
+        for score in character.abilities:
+            affordable = [value for value, cost in abilityscores.POINTBUYCOSTS.items() if cost <= points]
+            print("You have {} points left. Choose your {} score.".format(points, score.lower()))
+            options = ["{} ({} points)".format(value, abilityscores.POINTBUYCOSTS[value]) for value in affordable]
+            value = affordable[options.index(self.choose("pointbuy", options, character))]
+            points -= abilityscores.POINTBUYCOSTS[value]
+            rawscores.append(value)
+        if points:
+            print("{} points were left unspent.".format(points))
+        return rawscores
+
+    # Returns the numbered menu of options for a kind of choice, followed by its header if it has one
+    def menu(self, kind, options, character):
+        if kind == "increase":
+            formatted = numbered(["{} [{}]".format(item, character.scores[item]) for item in options])
+        else:
+            formatted = numbered(options)
+        if kind in self.wide:
+            formatted = columns(formatted, False)
+        lines = columns(formatted, False)
+        if kind in self.headers:
+            lines.append(self.headers[kind])
+        return "\n".join(lines) + "\n"
+
+    # Shows the options as a numbered menu and returns the one the user selects
+    def choose(self, kind, options, character):
+        sys.stdout.write(self.menu(kind, options, character))
+        while True:
+            try:
+                selection = int(input(self.prompts.get(kind, "")))
+                if selection < 1 or selection > len(options):
+                    raise ValueError
+                return options[selection-1]
+            except ValueError:
+                print("Invalid selection, try again.")
 
 
 # This is a formatting function to add a dynamic border to passed text. The buffer variable can add whitespace characters between the edge of the screen and the boarder, and may be left empty
@@ -521,22 +740,51 @@ def numbered(items):
 
 
 # This is a formatting function for formatting a list of strings into columns. If the printiterations value is left blank, the columned information will be printed. If False is passed, the formatted list of strings will be returned to be saved as a variable. This variable can then be passed through again for a column of 4 & so on
+# The columns are printed in one write rather than a line at a time.
 def columns(itemlist, printiterations=True):
     items = iter(itemlist)
     returnlist = []
     for item in items:
-        if printiterations:
-            print('{:<30}{:<30}'.format(item, next(items, "")))
-        else:
-            returnlist.append('{:<30}{:<30}'.format(item, next(items, "")))
+        returnlist.append('{:<30}{:<30}'.format(item, next(items, "")))
     if not printiterations:
         return returnlist
+    if returnlist:
+        sys.stdout.write("\n".join(returnlist) + "\n")
+
 
-def roll(amount=None, die=None, modifier=0):
+# Writes the character sheets of many characters in one pass, to a stream or to the file at the given path. Sheets are joined into large blocks so that even thousands of sheets only take a handful of writes. Returns the number of sheets written.
+def rendersheets(characters, output=None, blocksize=256):
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, "w", encoding="utf-8") as stream:
+            return rendersheets(characters, stream, blocksize)
+    if output is None:
+        output = sys.stdout
+    count = 0
+    block = []
+    for character in characters:
+        block.append(character.rendersheet())
+        count += 1
+        if len(block) == blocksize:
+            output.write("".join(block))
+            block.clear()
+    if block:
+        output.write("".join(block))
+    return count
+
+# If a roll log from rolllog.py is given, every die rolled is logged along with the character and skill it was rolled for. Rolls made for a character come from that character's own stream of dice.
+# Asked for a die, the player can also type dice notation such as 4d6kh3 or 2d20kl1+5, which is rolled as it is.
+def roll(amount=None, die=None, modifier=0, log=None, character=None, skill=None):
     if die is None:
+        import notation
         while True:
             try:
-                die = int(input("Roll me a \n    ----> D".format()))
+                text = input("Roll me a \n    ----> D".format())
+                if notation.isnotation(text):
+                    expression = notation.parse(text)
+                    if expression.largestdie() > 100 or expression.smallestdie() < 2 or expression.dicecount() > 100:
+                        raise CustomExcept
+                    return rollnotation(expression, log, character, skill)
+                die = int(text)
                 if die > 100 or die < 2:
                     raise CustomExcept
                 break
@@ -558,17 +806,31 @@ def roll(amount=None, die=None, modifier=0):
                 print("Invalid input, please try again.")
             except CustomExcept:
                 print("Don't be greedy. Try again.")
+    # The rolling itself is done by the batch dice engine, this function only gathers the inputs and prints the results.
+    batch = dice.rollbatch(amount, die, modifier, rng=dice.stream(character) if character else None)
+    if log is not None:
+        log.record(character, skill, die, modifier, [result-modifier for result in batch.row(0)])
+    # The results are passed to print() as they are rather than formatted first, so nothing is turned into text unless it is printed
     if amount == 1:
-        result = random.randint(1, die)+modifier
-        print("Result: {}".format(result))
+        print("Result:", batch.total(0))
         input("...")
     else:
-        results = []
-        for x in range(1, amount+1):
-            result = random.randint(1, die) + modifier
-            results.append(result)
-        print("Results: {}\nTotal: {}".format(results, sum(results)))
+        print("Results:", batch.row(0))
+        print("Total:", batch.total(0))
         input("...")
+
+
+# Rolls a compiled dice expression for roll(), logging every die that comes up
+def rollnotation(expression, log=None, character=None, skill=None):
+    total, faces = expression.rollonce(dice.stream(character) if character else None)
+    if log is not None:
+        for die, rolled in faces:
+            log.record(character, skill, die, 0, rolled)
+    rolled = [face for die, dierolled in faces for face in dierolled]
+    if len(rolled) > 1:
+        print("Rolled: {}".format(rolled))
+    print("{}: {}".format(expression, total))
+    input("...")
         
         
 # Function asks user for input, checks if it is a valid character name, and creates an instance of the Character class using that name. It then initates the setup function for that character.
@@ -586,68 +848,327 @@ def create():
     # Returns the created name to be stored in the variable that tracks the character being actively used.
     return charactername
 
+# csvkeys variable associates the fieldnames used in CSV output with the Character variables to help in importing a file.
+csvkeys = {'Name': "name", 'Path Name': "pathname", 'Level': "level", 'Class': "setclass", 'Race': "race", 'Background': "background", 'Ability scores': "scores", 'Stats': "stats", 'Proficiencies': "proficiencies"}
+
+# Regular expressions used when reading sheets, compiled by pattern() the first time each is needed. They can also be read as module attributes, e.g. theprogram.sheetpattern.
+# sheetpattern is the naming convention used for exported character sheet files.
+# Character sheets store the ability scores and stats as comma separated numbers in the fixed order of Character.abilities and Character.statnames, e.g. "15,14,13,12,10,8".
+# Proficiencies are stored as comma separated names, followed by a semicolon and the names with expertise, e.g. "Arcana,History;History".
+# Sheets exported by earlier versions hold Python dictionaries in these fields instead. These always start with "{" and are read by the legacy parsers below, so old sheets still load.
+PATTERNS = {"sheetpattern": r"charactersheet_([\w_]*)\.csv", "legacynumber": r"'([^']+)': (-?\d+)", "legacylist": r"'(proficiencies|doubled)': \[([^\]]*)\]", "legacyname": r"'([^']+)'"}
+
+
+# Compiled pattern for a name in PATTERNS
+@functools.lru_cache(maxsize=None)
+def pattern(name):
+    import re
+    return re.compile(PATTERNS[name])
+
+
+# Lets the patterns be read as module attributes, as they were before they were compiled lazily
+def __getattr__(name):
+    if name in PATTERNS:
+        return pattern(name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+# Every number that fits in the packed storage, keyed by how it is written. Looking numbers up here is quicker than calling int() on each one.
+numbertable = {str(number): number for number in range(-128, 128)}
+
+
+# Formats the scores or stats of a character for a sheet
+def formatnumbers(values):
+    return ",".join(map(str, values))
+
+
+# Reads the scores and stats fields of a sheet into one list of numbers, ready to become a character's packed values
+def parsevalues(scores, stats):
+    if scores.startswith("{") or stats.startswith("{"):
+        return parsenumbers(scores, Character.abilities) + parsenumbers(stats, Character.statnames)
+    parts = (scores + "," + stats).split(",")
+    if len(parts) != len(Character.abilities) + len(Character.statnames) or scores.count(",") != len(Character.abilities) - 1:
+        raise ValueError("expected {} scores and {} stats".format(len(Character.abilities), len(Character.statnames)))
+    try:
+        return list(map(numbertable.__getitem__, parts))
+    except KeyError:
+        return list(map(int, parts))
+
+
+# Reads the scores or stats field of a sheet into a list of numbers in the order of names
+def parsenumbers(text, names):
+    if text.startswith("{"):
+        return parselegacynumbers(text, names)
+    numbers = list(map(int, text.split(",")))
+    if len(numbers) != len(names):
+        raise ValueError("expected {} numbers, found {}".format(len(names), len(numbers)))
+    return numbers
+
+
+# Reads a dictionary of numbers as written by earlier versions. Anything that doesn't look like a simple dictionary of names and numbers is handed to ast.literal_eval. Stats missing from very old sheets are read as 0.
+def parselegacynumbers(text, names):
+    found = dict(pattern("legacynumber").findall(text))
+    if len(found) != text.count(":"):
+        import ast
+        found = ast.literal_eval(text)
+    return [int(found.get(name, 0)) for name in names]
+
+
+# Formats the proficiencies of a character for a sheet
+def formatproficiencies(proficiencies):
+    return ",".join(proficiencies["proficiencies"]) + ";" + ",".join(proficiencies["doubled"])
+
+
+# Reads the proficiencies field of a sheet into the proficiency and expertise bitmasks
+def parseproficiencies(text):
+    if text.startswith("{"):
+        lists = {key: pattern("legacyname").findall(items) for key, items in pattern("legacylist").findall(text)}
+        if len(lists) != text.count(":"):
+            import ast
+            lists = ast.literal_eval(text)
+        return Character.statmask(lists.get("proficiencies", [])), Character.statmask(lists.get("doubled", []))
+    proficient, separator, doubled = text.partition(";")
+    return splitmask(proficient), splitmask(doubled)
+
+
+# Turns a comma separated list of stat names into a bitmask
+def splitmask(text):
+    mask = 0
+    if text:
+        for name in text.split(","):
+            mask |= STATBITS[name]
+    return mask
+
+
+# Opens a character sheet file and returns the character stored in it. If the file is missing any required information or can't be read, None is returned instead.
+def loadsheet(filename):
+    import csv
+    loadedcharacter = {}
+    # Opens the associated character file and stores the information in a variable as a dictionary.
+    with open(filename, "r") as file:
+        for row in csv.DictReader(file):
+            loadedcharacter = row
+    # Checks to make sure that each required item is present in the CSV file. If so, initiates an instance of the Character class from it.
+    if loadedcharacter.keys() != csvkeys.keys():
+        return None
+    try:
+        return Character(None, loadedcharacter)
+    except (ValueError, KeyError, SyntaxError, OverflowError):
+        return None
+
+
+# Reads every character from a stream of CSV sheet rows. The stream can hold one sheet or many joined together, with or without repeated header rows. Rows that can't be read are skipped.
+# This is the bulk loading path, so rows are turned straight into packed characters rather than going through a dictionary for each row.
+def readsheets(stream):
+    import csv
+    fields = list(csvkeys.keys())
+    pick = operator.itemgetter(*range(len(fields)))
+    # Rosters tend to repeat the same proficiency lists, so each distinct one is only parsed once per stream
+    proficiencycache = {}
+    for row in csv.reader(stream):
+        if len(row) != len(fields):
+            continue
+        # Header rows are skipped, but their order is used for the rows that follow
+        if row[1] == "Path Name" or row[0] == "Name":
+            if csvkeys.keys() == set(row):
+                pick = operator.itemgetter(*[row.index(field) for field in fields])
+                continue
+        name, pathname, level, setclass, race, background, scores, stats, proficiencies = pick(row)
+        try:
+            masks = proficiencycache.get(proficiencies)
+            if masks is None:
+                masks = proficiencycache[proficiencies] = parseproficiencies(proficiencies)
+            yield Character.unpacked(name, pathname, int(level), setclass, race, background, parsevalues(scores, stats), *masks)
+        except (ValueError, KeyError, SyntaxError, OverflowError):
+            continue
+
+
+# Reads every charactersheet_<name>.csv file in a directory
+def loadsheets(directory="."):
+    characters = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if pattern("sheetpattern").match(entry.name):
+                with open(entry.path, "r", newline="") as file:
+                    characters.extend(readsheets(file))
+    return characters
+
+
+# Name of the file, kept alongside the character sheets, that caches what is known about them
+indexfilename = ".charactersheets-index.json"
+
+
+# A character sheet listed in a SheetIndex. The sheet is only read the first time its character is asked for.
+class LazySheet:
+    def __init__(self, index, filename):
+        self.index = index
+        self.filename = filename
+        self.name = index.entries[filename]["name"]
+        self._character = None
+
+    def __repr__(self):
+        return "LazySheet({!r})".format(self.filename)
+
+    # The character stored in the sheet, or None if the sheet can't be read
+    @property
+    def character(self):
+        if self._character is None:
+            self._character = self.index.load(self.filename)
+        return self._character
+
+
+# Keeps a persistent index of the character sheets in a directory so that the character menu can be shown without listing the directory or reading any sheets.
+# The index is written with the same modification time as the directory. While the two still match, no file in the directory has been added, removed or renamed, so the stored listing can be used as it is. Otherwise the directory is scanned again.
+# Each sheet's character is cached in the index along with the sheet's modification time and size, and is only read from the sheet again when either of those change.
+class SheetIndex:
+    def __init__(self, directory="."):
+        self.directory = directory
+        self.path = os.path.join(directory, indexfilename)
+        self.entries = {}
+        self.changed = False
+        cached = self.read()
+        if cached is not None and self.current():
+            self.entries = cached
+        else:
+            self.scan(cached or {})
+
+    # Reads the stored index, returning None if there isn't one or it can't be used
+    def read(self):
+        import json
+        try:
+            with open(self.path, "r") as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return entries if isinstance(entries, dict) else None
+
+    # Checks that the directory hasn't changed since the index was written
+    def current(self):
+        try:
+            return os.stat(self.directory).st_mtime_ns == os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+
+    # Lists the directory for character sheets, keeping whatever was already cached about the sheets that are still there
+    def scan(self, previous):
+        self.entries = {}
+        with os.scandir(self.directory) as found:
+            for entry in found:
+                match = pattern("sheetpattern").match(entry.name)
+                if match:
+                    # The file name is processed from its path friendly version to its reader friendly version
+                    self.entries[entry.name] = previous.get(entry.name) or {"name": " ".join(match.group(1).split("_"))}
+        self.changed = True
+
+    # Every sheet in the index, in alphabetical order of character name
+    def sheets(self):
+        return [LazySheet(self, filename) for filename in sorted(self.entries, key=lambda filename: self.entries[filename]["name"])]
+
+    # Returns the character in a sheet, using the cached copy if the sheet hasn't changed since it was cached. Returns None if the sheet can't be read.
+    def load(self, filename):
+        entry = self.entries[filename]
+        path = os.path.join(self.directory, filename)
+        status = os.stat(path)
+        if entry.get("mtime") == status.st_mtime_ns and entry.get("size") == status.st_size and "packed" in entry:
+            name, pathname, level, setclass, race, background, values, proficient, doubled = entry["packed"]
+            return Character.unpacked(name, pathname, level, setclass, race, background, bytes.fromhex(values), proficient, doubled)
+        character = loadsheet(path)
+        if character is not None:
+            packed = list(character.packed())
+            packed[6] = packed[6].hex()
+            entry.update(mtime=status.st_mtime_ns, size=status.st_size, packed=packed)
+            self.changed = True
+        return character
+
+    # Drops a sheet from the index, for when its file has been deleted
+    def forget(self, filename):
+        self.entries.pop(filename, None)
+        self.changed = True
+
+    # Writes the index back to the directory if anything has changed. The file is written under a temporary name and renamed into place, then given the directory's modification time so that the next run can tell whether the directory has changed since.
+    def save(self):
+        if not self.changed:
+            return
+        import json
+        temporary = self.path + ".tmp"
+        try:
+            with open(temporary, "w") as file:
+                json.dump(self.entries, file, separators=(",", ":"))
+            os.replace(temporary, self.path)
+            directorytime = os.stat(self.directory).st_mtime_ns
+            os.utime(self.path, ns=(directorytime, directorytime))
+        except OSError:
+            # The index is only a cache, so a directory that can't be written to just means the sheets are listed again next time
+            return
+        self.changed = False
+
+
 # This function runs at startup and checks to see if there are any existing character sheets present. If there are none, it initiates character creation.
+# If a sheet can't be loaded, the selection menu is shown again until a character is loaded or created.
 def startup():
-    # Checks the surrounding directory for any CSV files matching the naming convention used by the script. It then stores these filenames in the characterfiles variable.
-    characterfiles = []
-    directorylist = os.listdir()
-    for item in directorylist:
-        if re.match(r"charactersheet_([\w_]*)\.csv", item):
-            characterfiles.append(item)
-    if characterfiles:
-        # If there are files present, they are enumarated into the index number and file name. The file name is then processed via regex from its path friendly version to its reader friendly version, and the reader friendly name is stored in a directory along with the index number of its associated file.
-        characterdirectory = {}
-        for index, file in enumerate(characterfiles):
-            charactername = re.search(r"charactersheet_([\w_]*)\.csv", file)
-            charactername = " ".join(charactername.group(1).split("_"))
-            characterdirectory[charactername] = index
-        characters = list(characterdirectory.keys())
-        # The list of characters is displayed to the user to select. If the user wants to create a new character, they enter 0. Otherwise, when selected, that character is referenced back to find the associated file. 
+    while True:
+        # Looks up the character sheets in the surrounding directory through the sheet index, which only lists the directory again if it has changed since the last run.
+        index = SheetIndex()
+        sheets = index.sheets()
+        index.save()
+        if not sheets:
+            # Automatically runs the character creation function if no character file is present.
+            return create()
+        # The list of characters is displayed to the user to select. If the user wants to create a new character, they enter 0. Otherwise, when selected, that character's sheet is loaded.
         print("Select from existing character sheets or enter 0 to create a new character.\n(0): Create new character")
-        columns(numbered(characters))
+        columns(numbered([sheet.name for sheet in sheets]))
         while True:
             try:
                 selection = int(input())
-                if selection < 0 or selection > len(characters):
+                if selection < 0 or selection > len(sheets):
                     raise ValueError
-                character = characters[selection-1]
                 break
             except ValueError:
                 print("Invalid selection, try again.")
-        fileindex = characterdirectory[character]
-        chosenfile = characterfiles[fileindex]
-        if selection != 0:
-            # csvkeys variable associates the fieldnames used in CSV output with the Character variables to help in importing a file.
-            csvkeys = {'Name': "name", 'Path Name': "pathname", 'Level': "level", 'Class': "setclass", 'Race': "race", 'Background': "background", 'Ability scores': "scores", 'Stats': "stats", 'Proficiencies': "proficiencies"}
-            # Opens the associated character file and stores the information in a variable as a dictionary.
-            with open(chosenfile, "r") as file:
-                for row in csv.DictReader(file):
-                    loadedcharacter = row
-            # Checks to make sure that each required item is present in the CSV file. If so, initiates an instance of the Character class with the character's path-friendly name.
-            if all(item in list(csvkeys.keys()) for item in list(loadedcharacter.keys())) and all(item in list(loadedcharacter.keys()) for item in list(csvkeys.keys())):
-                loadedname = loadedcharacter["Path Name"]
-                loadedname = Character(None, loadedcharacter)
-                # Returns the loaded name to be stored in the variable that tracks the current active character.
-                return loadedname
-            else:
-                # If the selected character is missing any required information in its CSV file, the user is informed that there was an error and is given the option to delete the file or to return to the character selection menu while leaving the file in tact.
-                while True:
-                    try:
-                        selection = int(input("There was a problem loading the selected character sheet. Enter 1 to delete the file and return to character selection or 2 to return to character selection without deleting.\n"))
-                        if selection < 1 or selection > 2:
-                            return ValueError
-                        break
-                    except ValueError:
-                        print("Invalid selection, try again.")
-                if selection == 1:
-                    # Deletes the problem file.
-                    os.remove(chosenfile)
-                startup()
         if selection == 0:
             return create()
-    else:
-        # Automatically runs the character creation function if no character file is present.
-        return create()
+        chosen = sheets[selection-1]
+        loadedname = chosen.character
+        index.save()
+        if loadedname is not None:
+            # Returns the loaded name to be stored in the variable that tracks the current active character.
+            return loadedname
+        # If the selected character is missing any required information in its CSV file, the user is informed that there was an error and is given the option to delete the file or to return to the character selection menu while leaving the file in tact.
+        while True:
+            try:
+                selection = int(input("There was a problem loading the selected character sheet. Enter 1 to delete the file and return to character selection or 2 to return to character selection without deleting.\n"))
+                if selection < 1 or selection > 2:
+                    raise ValueError
+                break
+            except ValueError:
+                print("Invalid selection, try again.")
+        if selection == 1:
+            # Deletes the problem file.
+            os.remove(chosen.filename)
+            index.forget(chosen.filename)
+            index.save()
+
+
+# Menus are the states of the launcher's state machine. Each menu function returns the state to go to next instead of calling the next menu itself, so however long a session runs, the program never goes deeper than one menu at a time.
+# "startup" is character selection, "program" the main menu and "options" the character options menu.
+STARTUP = "startup"
+PROGRAM = "program"
+OPTIONS = "options"
+
+
+# Asks the user to confirm with 1 or go back with 2, returning True if they confirmed
+def confirm(message):
+    print(message)
+    while True:
+        try:
+            selection = int(input())
+            if selection < 1 or selection > 2:
+                raise ValueError
+            break
+        except ValueError:
+            print("Invalid selection, try again.")
+    return selection == 1
+
 
 def characteroptions(character):
     options = ["View character sheet", "Level up", "Reset my luck", "Reset character information", "Delete character", "Return"]
@@ -663,65 +1184,50 @@ def characteroptions(character):
     if selection == 1:
         character.charactersheet()
         input()
-        characteroptions(character)
+        return OPTIONS
     if selection == 2:
+        if character.level >= MAXLEVEL:
+            print("{} is already level {}, the highest level there is.".format(character.name, MAXLEVEL))
+            return OPTIONS
         level = character.level+1
         character.levelup(level)
         print("{} is now level {}.".format(character.name, character.level))
     if selection == 3:
-        # Resets the seed for the random module
-        random.seed()
+        # Gives the character a freshly seeded stream of dice, leaving everyone else's as it was
+        dice.reseedstream(character.name)
         print("Your fortune has been refreshed. Good luck!")
     if selection == 4:
-        print("This will wipe all of your character's stats & start the setup over. Are you sure?\nEnter (1) to proceed or (2) to go back.")
-        while True:
-            try:
-                selection = int(input())
-                if selection < 1 or selection > 2:
-                    raise ValueError
-                break
-            except ValueError:
-                print("Invalid selection, try again.")
-        if selection == 1:
-            character.setup()
-        if selection == 2:
-            characteroptions(character)
+        if not confirm("This will wipe all of your character's stats & start the setup over. Are you sure?\nEnter (1) to proceed or (2) to go back."):
+            return OPTIONS
+        character.setup()
     if selection == 5:
-        print("This will delete your character & the file containing their information. Are you sure?\nEnter (1) to proceed or (2) to go back.")
-        while True:
-            try:
-                selection = int(input())
-                if selection < 1 or selection > 2:
-                    raise ValueError
-                break
-            except ValueError:
-                print("Invalid selection, try again.")
-        if selection == 1:
-            filename = "charactersheet_"+character.pathname+".csv"
-            os.remove(filename)
-            launcher()
-        if selection == 2:
-            characteroptions(character)
-    if selection == 6:
-        launcher(character)
+        if not confirm("This will delete your character & the file containing their information. Are you sure?\nEnter (1) to proceed or (2) to go back."):
+            return OPTIONS
+        filename = "charactersheet_"+character.pathname+".csv"
+        os.remove(filename)
+        return STARTUP
+    return PROGRAM
+
+
+# Options on the main menu: a custom roll, a roll for each stat, then the character menus
+ROLLOPTIONS = ["(1): Custom roll"] + ["({}): Roll for {}".format(index+2, item.lower()) for index, item in enumerate(Character.statnames)] + ["({}): {}".format(len(Character.statnames)+index+2, item) for index, item in enumerate(["Character sheet", "Character options", "Switch character"])]
+
+
+# Returns the main menu for the named character as one block of text. Only the title changes from character to character, so each menu is built once and kept.
+@functools.lru_cache(maxsize=256)
+def programmenu(name):
+    lines = ["-"*110, "| {} |".format(name).center(110, "|"), "-"*110]
+    lines.extend(columns(columns(ROLLOPTIONS, False), False))
+    lines.append("Select an option")
+    return "\n".join(lines) + "\n"
 
 
 # This is the main program, where users select a dice roll to make, can view their character's sheet, and can go into the character options menu        
-def program(character):
-    print("-"*110)
-    print("| {} |".format(character.name).center(110, "|"))
-    print("-"*110)
+def program(character, log=None):
     stats = character.stats
-    rolltypes = list(character.stats.keys())
-    rolloptions = ["(1): Custom roll"]
-    for index, item in enumerate(rolltypes):
-        rolloptions.append("({}): Roll for {}".format(index+2, item.lower()))
-    rolloptions.append("({}): Character sheet".format(len(rolltypes)+2))
-    rolloptions.append("({}): Character options".format(len(rolltypes)+3))
-    rolloptions.append("({}): Switch character".format(len(rolltypes)+4))
-    formattedoptions = columns(rolloptions, False)
-    columns(formattedoptions)
-    print("Select an option")
+    rolltypes = Character.statnames
+    rolloptions = ROLLOPTIONS
+    sys.stdout.write(programmenu(character.name))
     while True:
         try:
             selection = int(input())
@@ -731,27 +1237,76 @@ def program(character):
         except ValueError:
             print("Invalid selection, try again.")
     if selection == 1:
-        roll()
+        roll(log=log, character=character.name)
     if selection <= len(rolltypes)+1 and selection != 1:
         selectedroll = rolltypes[selection-2]
         modifier = stats[selectedroll]
-        roll(1, 20, modifier)
+        roll(1, 20, modifier, log, character.name, selectedroll)
     if selection == len(rolltypes)+2:
         character.charactersheet()
         input()
     if selection == len(rolltypes)+3:
-        characteroptions(character)
+        return OPTIONS
     if selection == len(rolltypes)+4:
-        launcher()
-                
-def launcher(activecharacter=None):
+        return STARTUP
+    return PROGRAM
+
+
+# Runs the program, moving from menu to menu until the user quits. Starts at the main menu if a character is given, and at character selection otherwise.
+# If a script is given, its lines answer the prompts instead of the keyboard, and the session ends once they run out. The script can be a string or any iterable of lines, and output can be a stream to write to instead of the screen.
+# Rolls are written to the roll log if one is given.
+def launcher(activecharacter=None, script=None, output=None, log=None):
+    if script is not None:
+        with scripted(script, output):
+            return launcher(activecharacter, log=log)
+    state = PROGRAM if activecharacter is not None else STARTUP
     while True:
         try:
-            if activecharacter is None:
+            if state == STARTUP:
                 print("Welcome to Kate's Py&D. Press ctrl+c at any time to quit the program.")
                 activecharacter = startup()
-            program(activecharacter)
+                state = PROGRAM
+            elif state == PROGRAM:
+                state = program(activecharacter, log)
+            else:
+                state = characteroptions(activecharacter)
         except KeyboardInterrupt:
             quit()
+        except EOFError:
+            # There is no more input, as at the end of a script or of a file piped in
+            return
+
+
+# Lines of a script, read one at a time in place of standard input
+class ScriptInput:
+    def __init__(self, script):
+        self.lines = iter(script.splitlines() if isinstance(script, str) else script)
+
+    def readline(self):
+        line = next(self.lines, None)
+        if line is None:
+            return ""
+        return line if line.endswith("\n") else line + "\n"
+
+    def isatty(self):
+        return False
+
+
+# Answers input() from a script, and sends output to a stream if one is given, until the block ends
+@contextlib.contextmanager
+def scripted(script, output=None):
+    stdin = sys.stdin
+    sys.stdin = script if hasattr(script, "readline") else ScriptInput(script)
+    try:
+        if output is None:
+            yield
+        else:
+            with contextlib.redirect_stdout(output):
+                yield
+    finally:
+        sys.stdin = stdin
 
-launcher()
+# Running this file starts the program through the console entry point in dndpy.py, which reads the --log and --profile options
+if __name__ == "__main__":
+    import dndpy
+    dndpy.main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# Precomputed level progression tables. For every race, class and background, and every level from 1 to 20, the table holds the lowest and highest modifier each stat can have under each ability score improvement policy, along with the proficiency bonus at that level.
+# The table is worked out once by levelling real characters with setup(), levelup() and recalculate(), so it always follows the program's own rules. It is saved as a flat array of bytes behind a small header, and loading it only maps the file into memory, so looking a build up is a single index into the array however large the table is.
+
+import argparse
+import itertools
+import json
+import mmap
+import os
+import struct
+from array import array
+
+from theprogram import BACKGROUNDINDEX, BACKGROUNDSKILLS, RACEBUFFS, RACEINDEX, Character
+
+
+DEFAULTPATH = "trajectories.bin"
+
+MAGIC = b"DNDTRAJ1"
+LEVELS = 20
+
+# Ability score improvement policies, as the number of the two points from each improvement that go into the ability score behind the stat. The rest go into other scores.
+POLICIES = {"none": 0, "split": 1, "focus": 2}
+
+# Lowest and highest raw ability scores, the range of 4d6 dropping the lowest die
+RAWLOW = 3
+RAWHIGH = 18
+
+# Order of the dimensions of the stored array. The last dimension holds the lowest modifier and then the highest.
+DIMENSIONS = ("race", "class", "background", "policy", "level", "stat", "bound")
+
+
+# Decisions provider that steers a character towards the highest (or lowest) possible value of one stat. Proficiencies and expertise in the stat are taken as soon as they are offered (or avoided for as long as possible), ability score improvements follow the policy, and every other choice is fixed in picks.
+# Kinds of choice listed in defer never take the stat even when aiming high, which leaves it open for a later feature that gives more for it, such as the doubled proficiencies of the Knowledge domain.
+class TargetDecisions:
+    def __init__(self, stat, highest, share, picks, defer=()):
+        self.stat = stat
+        self.ability = Character.statability[stat]
+        self.highest = highest
+        self.share = share
+        self.picks = picks
+        self.defer = defer
+        self.increases = 0
+
+    def number(self, kind, character, label=None):
+        if kind == "level":
+            return 1
+        if label == self.ability:
+            return RAWHIGH if self.highest else RAWLOW
+        return 10
+
+    def choose(self, kind, options, character):
+        if kind in self.picks:
+            return self.picks[kind]
+        if kind == "increase":
+            # increasescores() asks for two points at a time, and the policy decides how many of them the stat's ability gets
+            wanted = self.increases % 2 < self.share
+            self.increases += 1
+            return self._pick(options, self.ability, wanted)
+        return self._pick(options, self.stat, self.highest and kind not in self.defer)
+
+    @staticmethod
+    def _pick(options, target, wanted):
+        if wanted and target in options:
+            return target
+        others = [option for option in options if option != target]
+        return others[0] if others else options[0]
+
+
+# Returns every kind of choice that a class's features ask for, along with its options, including choices made within other choices
+def classchoices(setclass):
+    choices = []
+
+    def collect(features):
+        for feature in features:
+            if feature["feature"] == "choice":
+                choices.append((feature["kind"], list(feature["options"])))
+                for chosen in feature["options"].values():
+                    collect(chosen)
+    for features in Character.classfeatures.get(setclass, {}).values():
+        collect(features)
+    return choices
+
+
+# Levels a character from 1 to 20 and returns the value of one stat at each level
+def walk(race, setclass, background, stat, highest, share, branch, defer=()):
+    picks = {"race": race, "class": setclass, "background": background}
+    picks.update(branch)
+    decisions = TargetDecisions(stat, highest, share, picks, defer)
+    character = Character("Trajectory")
+    character.setup(decisions, autoexport=False)
+    values = [character.stats[stat]]
+    for level in range(2, LEVELS+1):
+        character.levelup(level, False, decisions)
+        character.recalculate()
+        values.append(character.stats[stat])
+    return values
+
+
+# Works out the whole table, returning it as an array of bytes in the order of DIMENSIONS.
+# The lowest and highest values of a stat only depend on the race's buff to the ability behind it, the class, and the skills the background gives, so each distinct combination of those is only levelled once for every choice a class feature offers (and aiming high, once more with the stat left out of the class proficiencies).
+def compute():
+    races = list(Character.racebuffs)
+    classes = list(Character.classbuffs)
+    backgrounds = list(Character.backgroundbuffs)
+    statnames = Character.statnames
+    abilityof = [Character.abilityindex[Character.statability[stat]] for stat in statnames]
+    branches = {setclass: [dict(zip([kind for kind, options in classchoices(setclass)], chosen)) for chosen in itertools.product(*[options for kind, options in classchoices(setclass)])] for setclass in classes}
+    walks = {}
+    table = array("b", bytes(len(races)*len(classes)*len(backgrounds)*len(POLICIES)*LEVELS*len(statnames)*2))
+    position = 0
+    for race in races:
+        buffs = RACEBUFFS[RACEINDEX[race]]
+        for setclass in classes:
+            for background in backgrounds:
+                skills = BACKGROUNDSKILLS[BACKGROUNDINDEX[background]]
+                for share in POLICIES.values():
+                    bounds = []
+                    for stat, ability in zip(statnames, abilityof):
+                        key = (buffs[ability], setclass, skills, stat, share)
+                        if key not in walks:
+                            lowest = [walk(race, setclass, background, stat, False, share, branch) for branch in branches[setclass]]
+                            highest = [walk(race, setclass, background, stat, True, share, branch, defer) for branch in branches[setclass] for defer in ((), ("proficiency",))]
+                            walks[key] = [(min(values), max(values)) for values in zip(*lowest, *highest)]
+                        bounds.append(walks[key])
+                    # Stored level by level, then stat by stat
+                    for level in range(LEVELS):
+                        for stat in bounds:
+                            table[position], table[position+1] = stat[level]
+                            position += 2
+    return table
+
+
+# Writes the table to a file: the magic number, the length of a JSON header describing the table, the header, then the array itself, starting on an 8 byte boundary
+def save(path=DEFAULTPATH, table=None):
+    if table is None:
+        table = compute()
+    header = {"races": list(Character.racebuffs), "classes": list(Character.classbuffs), "backgrounds": list(Character.backgroundbuffs), "policies": list(POLICIES), "levels": LEVELS, "stats": Character.statnames, "dimensions": DIMENSIONS, "proficiency": proficiencies()}
+    encoded = json.dumps(header).encode("utf-8")
+    start = len(MAGIC) + 4 + len(encoded)
+    padding = -start % 8
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(MAGIC)
+        file.write(struct.pack("<I", len(encoded) + padding))
+        file.write(encoded + b" "*padding)
+        file.write(table.tobytes())
+    os.replace(temporary, path)
+    return path
+
+
+# Proficiency bonus at each level from 1 to 20
+def proficiencies():
+    character = Character()
+    bonuses = []
+    for level in range(1, LEVELS+1):
+        character.level = level
+        bonuses.append(character.proficiencymodifier())
+    return bonuses
+
+
+# A saved table, mapped into memory. Nothing is read from the file until it is looked up, so opening even a large table is instant.
+class TrajectoryTable:
+    def __init__(self, path=DEFAULTPATH):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("{} is not a trajectory table".format(path))
+        length = struct.unpack_from("<I", self.map, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(self.map[start:start+length]))
+        self.races = {name: index for index, name in enumerate(self.header["races"])}
+        self.classes = {name: index for index, name in enumerate(self.header["classes"])}
+        self.backgrounds = {name: index for index, name in enumerate(self.header["backgrounds"])}
+        self.policies = {name: index for index, name in enumerate(self.header["policies"])}
+        self.stats = {name: index for index, name in enumerate(self.header["stats"])}
+        self.levels = self.header["levels"]
+        # Signed bytes straight out of the mapped file, without copying them
+        self.values = memoryview(self.map)[start+length:].cast("b")
+        # Number of bytes from one entry in each dimension to the next
+        self.strides = []
+        stride = 2
+        for size in reversed([len(self.races), len(self.classes), len(self.backgrounds), len(self.policies), self.levels, len(self.stats)]):
+            self.strides.insert(0, stride)
+            stride *= size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        if getattr(self, "values", None) is not None:
+            self.values.release()
+            self.values = None
+        self.map.close()
+        self.file.close()
+
+    def _position(self, race, setclass, background, policy, level):
+        if not 1 <= level <= self.levels:
+            raise ValueError("level must be between 1 and {}, got {}".format(self.levels, level))
+        indexes = (self.races[race], self.classes[setclass], self.backgrounds[background], self.policies[policy], level-1)
+        return sum(index*stride for index, stride in zip(indexes, self.strides))
+
+    # Proficiency bonus at a level
+    def proficiency(self, level):
+        return self.header["proficiency"][level-1]
+
+    # Lowest and highest modifier a stat can have for a build at a level
+    def modifier(self, race, setclass, background, level, stat, policy="focus"):
+        position = self._position(race, setclass, background, policy, level) + 2*self.stats[stat]
+        return (self.values[position], self.values[position+1])
+
+    # Lowest and highest modifier of every stat for a build at a level, as a dictionary
+    def build(self, race, setclass, background, level, policy="focus"):
+        position = self._position(race, setclass, background, policy, level)
+        return {stat: (self.values[position+2*index], self.values[position+2*index+1]) for stat, index in self.stats.items()}
+
+    # Lowest and highest modifier of one stat at every level from 1 to 20
+    def trajectory(self, race, setclass, background, stat, policy="focus"):
+        return [self.modifier(race, setclass, background, level, stat, policy) for level in range(1, self.levels+1)]
+
+    # The whole table as a NumPy array shaped by DIMENSIONS, sharing memory with the mapped file. Needs NumPy.
+    def asarray(self):
+        import numpy
+        shape = (len(self.races), len(self.classes), len(self.backgrounds), len(self.policies), self.levels, len(self.stats), 2)
+        return numpy.frombuffer(self.values, dtype=numpy.int8).reshape(shape)
+
+
+# Command line tool for building the table and looking builds up in it
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Build and query precomputed level progression tables for every race, class and background.")
+    parser.add_argument("--table", default=DEFAULTPATH, help="table file to use (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="work out the table and save it")
+    show = subparsers.add_parser("show", help="show the modifier ranges for a build at a level")
+    show.add_argument("race")
+    show.add_argument("setclass", metavar="class")
+    show.add_argument("background")
+    show.add_argument("level", type=int)
+    show.add_argument("--policy", choices=list(POLICIES), default="focus")
+    arguments = parser.parse_args(arguments)
+    if arguments.command == "build":
+        print("Saved the table to {}.".format(save(arguments.table)))
+        return
+    with TrajectoryTable(arguments.table) as table:
+        print("{} {} {} | Level {} | Proficiency bonus +{} | {} policy".format(arguments.race, arguments.setclass, arguments.background, arguments.level, table.proficiency(arguments.level), arguments.policy))
+        for stat, (lowest, highest) in table.build(arguments.race, arguments.setclass, arguments.background, arguments.level, arguments.policy).items():
+            print("{:<20}{:>4} to {}".format(stat, lowest, highest))
+
+
+if __name__ == "__main__":
+    main()